@@ -1,3 +1,4 @@
+import io
 import os
 import re
 import sys
@@ -35,7 +36,7 @@ from utils.option_parser import OptionParser
 from cogs.osu.beatmap_parser import beatmap_parser
 from cogs.osu.replay_parser.replay import parse_replay_file
 from cogs.osu.osu_utils.owoAPI import owoAPI
-from cogs.osu.osu_utils import map_utils, utils, web_utils, drawing
+from cogs.osu.osu_utils import map_utils, utils, web_utils, drawing, owoSession, owoLimiter
 # import https://xkcd.com/353/
 
 class Osu(commands.Cog):
@@ -90,7 +91,8 @@ class Osu(commands.Cog):
         self.MAX_USER_DISP = 5
         self.LIST_MAX = 5
         self.MAX_MAP_DISP = 3
-        self.SLEEP_TIME = 0.1 # so we don't get ratelimited
+        self.SLEEP_TIME = 0.1 # pacing for discord, api calls go through owoAPI.limiter
+        self.REC_DB_CONCURRENCY = 8 # users processed at once when building rec db
         self.LB_MAX = 15
         self.LINK_COOLDOWN = 5 # seconds
 
@@ -102,6 +104,11 @@ class Osu(commands.Cog):
         self.server_link_cooldown = {}
 
 
+    def cog_unload(self):
+        # close pooled http sessions
+        self.bot.loop.create_task(self.owoAPI.close())
+
+
     def reimport(self):
         import_list = []
         beatmap_parser = importlib.import_module('cogs.osu.beatmap_parser.beatmap_parser')
@@ -238,6 +245,43 @@ class Osu(commands.Cog):
         print('Finished transfering recs.')
         """
 
+    # ---------------------------------- api stats ----------------------------------------
+    @commands.is_owner()
+    @commands.command(name="apistats", hidden=True)
+    async def apistats(self, ctx, kind='upstream', minutes:int=15):
+        """owoAPI latency per server and request. Kinds: upstream, call, cache, download, prom
+
+        Example: >apistats upstream 60"""
+        if kind == 'prom':
+            exposition = self.owoAPI.metrics.exposition()
+            return await ctx.send(file=discord.File(
+                io.BytesIO(exposition.encode()), filename='owo_metrics.txt'))
+
+        summary = self.owoAPI.get_latency_usage(kind, minutes * 60).get(kind, {})
+        rows = []
+        for api, requests in summary.items():
+            for request_name, stats in requests.items():
+                rows.append((api, request_name, stats))
+        if not rows:
+            return await ctx.send("**No `{}` requests in the last {} minutes.**".format(kind, minutes))
+
+        # slowest first
+        rows.sort(key=lambda row: row[2]['p95'], reverse=True)
+        lines = ['{:<12} {:<26} {:>6} {:>5} {:>7} {:>7} {:>7}'.format(
+            'api', 'request', 'count', 'err', 'p50', 'p95', 'p99')]
+        for api, request_name, stats in rows:
+            lines.append('{:<12} {:<26} {:>6} {:>5} {:>7.3f} {:>7.3f} {:>7.3f}'.format(
+                api[:12], request_name[:26], stats['count'], stats['errors'],
+                stats['p50'], stats['p95'], stats['p99']))
+
+        msg = ''
+        for line in lines:
+            if len(msg) + len(line) > 1900:
+                break
+            msg += line + '\n'
+        await ctx.send("```{}```".format(msg))
+
+
     # ---------------------------------- osuset ----------------------------------------
     @commands.group(pass_context=True)
     async def osuset(self, ctx):
@@ -318,7 +362,6 @@ class Osu(commands.Cog):
             osu_user = await self.owoAPI.get_user(username, mode=gamemode, api=api)
             if osu_user:
                 break
-            await asyncio.sleep(.5)
 
         if not osu_user:
             return await ctx.send("**`{}` doesn't exist in the `{}` database.**".format(
@@ -3324,7 +3367,7 @@ class Osu(commands.Cog):
             if not options['best']:
 
                 if api == 'droid':
-                    temp_beatmap = await self.owoAPI.get_beatmap(
+                    temp_beatmap = await self.owoAPI.get_beatmap_by_md5(
                         userrecent_filtered[0]["beatmap_id"], api='ripple')
                     try:
                         userrecent_filtered[0]["beatmap_id"] = temp_beatmap[0]['beatmap_id']
@@ -3388,7 +3431,7 @@ class Osu(commands.Cog):
             for play in userrecent_filtered:
                 try:
                     if api == 'droid':
-                        beatmap = await self.owoAPI.get_beatmap(play['beatmap_id'], api='ripple')
+                        beatmap = await self.owoAPI.get_beatmap_by_md5(play['beatmap_id'], api='ripple')
                     else:
                         beatmap = await self.owoAPI.get_beatmap(play['beatmap_id'], api=api)
                     recent_beatmaps.append(beatmap[0])
@@ -3449,7 +3492,6 @@ class Osu(commands.Cog):
             bmp = await api_utils.get_beatmap(key, api, beatmap_id=play['beatmap_id'])
             recent_beatmaps.append(bmp[0])
             recent_acc.append(utils.calculate_acc(play, gamemode))
-            await asyncio.sleep(.15)
         msg, embed = await self._get_user_top(
             ctx, api, userinfo, userrecent, recent_beatmaps, recent_acc, gamemode,
             recent_list = True)
@@ -3530,7 +3572,10 @@ class Osu(commands.Cog):
             bmp_api = 'bancho'
             """
         bmp_api = api
-        beatmap = await self.owoAPI.get_beatmap(userrecent['beatmap_id'], api=bmp_api)
+        if api == 'droid': # droid scores only have the hash
+            beatmap = await self.owoAPI.get_beatmap_by_md5(userrecent['beatmap_id'], api=bmp_api)
+        else:
+            beatmap = await self.owoAPI.get_beatmap(userrecent['beatmap_id'], api=bmp_api)
         if not beatmap:
             return None, None, None
 
@@ -3994,8 +4039,12 @@ class Osu(commands.Cog):
                     if str(user.id) not in donor_ids:
                         return await ctx.send("**You must be a supporter to use this feature! `>support`**")
 
-                beatmap = await self.owoAPI.get_beatmap(
-                    filtered_full_play_list[0]['beatmap_id'], api=api)
+                if api == 'droid':
+                    beatmap = await self.owoAPI.get_beatmap_by_md5(
+                        filtered_full_play_list[0]['beatmap_id'], api=api)
+                else:
+                    beatmap = await self.owoAPI.get_beatmap(
+                        filtered_full_play_list[0]['beatmap_id'], api=api)
 
                 enabled_mods = 0
                 if 'enabled_mods' in filtered_full_play_list[0].keys():
@@ -4042,11 +4091,14 @@ class Osu(commands.Cog):
                         # combine
                         beatmap.update(beatmapset)
                         beatmap = [beatmap]
+                    elif api == 'droid': # droid scores only have the hash
+                        beatmap = await self.owoAPI.get_beatmap_by_md5(
+                            filtered_full_play_list[i]['beatmap_id'], 
+                            api=api, use_cache=use_cache)
                     else:
                         beatmap = await self.owoAPI.get_beatmap(
                             filtered_full_play_list[i]['beatmap_id'], 
                             api=api, use_cache=use_cache) # force
-                        await asyncio.sleep(self.SLEEP_TIME)
 
                     best_beatmaps.append(beatmap[0])
                     test_full_play_list.append(filtered_full_play_list[i])
@@ -5735,8 +5787,7 @@ class Osu(commands.Cog):
     async def create_std_rec_database(self):
         # await self.rec_std.drop()
         print("Creating suggestion database!")
-        self.SLEEP_TIME = .25
-        print('Sleep per user: ', self.SLEEP_TIME)
+        print('Users in parallel: ', self.REC_DB_CONCURRENCY)
 
         current_time = datetime.datetime.now()
         loop = asyncio.get_event_loop()
@@ -5744,11 +5795,16 @@ class Osu(commands.Cog):
         force_list = [] # empty
         total_players = await self.track.count_documents({})
         counter = 0
-        async for player in self.track.find({}, no_cursor_timeout=True):
-            print(f"PLAYER {counter}/{total_players}")
-            loop.create_task(self.suggestion_play_parser(player))
-            await asyncio.sleep(self.SLEEP_TIME)
-            counter += 1
+        semaphore = asyncio.Semaphore(self.REC_DB_CONCURRENCY)
+        tasks = []
+        with owoLimiter.lane('bulk'): # never ahead of user commands
+            async for player in self.track.find({}, no_cursor_timeout=True):
+                print(f"PLAYER {counter}/{total_players}")
+                await semaphore.acquire()
+                tasks.append(loop.create_task(
+                    self._bounded_suggestion_play_parser(player, semaphore)))
+                counter += 1
+        await asyncio.gather(*tasks, return_exceptions=True)
 
         loop_time = datetime.datetime.now()
         elapsed_time = loop_time - current_time
@@ -5851,8 +5907,7 @@ class Osu(commands.Cog):
     async def verify_std_rec_database(self):
         # await self.rec_std.drop()
         print("Creating suggestion database!")
-        self.SLEEP_TIME = .25
-        print('Sleep per user: ', self.SLEEP_TIME)
+        print('Users in parallel: ', self.REC_DB_CONCURRENCY)
 
         current_time = datetime.datetime.now()
         loop = asyncio.get_event_loop()
@@ -5860,6 +5915,7 @@ class Osu(commands.Cog):
         force_list = [] # empty
         total_recs = await self.rec_std.count_documents({})
         counter = 0
+        semaphore = asyncio.Semaphore(self.REC_DB_CONCURRENCY)
         async for rec in self.rec_std.find({}, no_cursor_timeout=True):
             """
             if 'osu_id' in player:
@@ -5869,8 +5925,10 @@ class Osu(commands.Cog):
             # print(f'Examining {osu_id}')
             # if (counter > start_index and counter <= end_index) or osu_id in force_list:
             print(f"ITEM {counter}/{total_recs}")
-            loop.create_task(self.suggestion_play_parser(player))
-            await asyncio.sleep(self.SLEEP_TIME)
+            with owoLimiter.lane('bulk'):
+                await semaphore.acquire()
+                loop.create_task(
+                    self._bounded_suggestion_play_parser(player, semaphore))
             counter += 1
 
         loop_time = datetime.datetime.now()
@@ -5879,6 +5937,13 @@ class Osu(commands.Cog):
         print("Suggestion Database Creation ENDED!!!. Took: {}".format(str(elapsed_time)))
 
 
+    async def _bounded_suggestion_play_parser(self, player, semaphore):
+        try:
+            await self.suggestion_play_parser(player)
+        finally:
+            semaphore.release()
+
+
     # this code is very similar to the play tracker
     async def suggestion_play_parser(self, player):
         # ensures that data is recieved
@@ -5901,7 +5966,6 @@ class Osu(commands.Cog):
 
         for play in top_plays:
             await self.append_suggestion_database(play)
-            await asyncio.sleep(.1)
 
 
     async def append_suggestion_database(self, play, status=0):
@@ -6446,8 +6510,8 @@ class Osu(commands.Cog):
 
         # process
         replay_data = self.replay_parser(file_path)
-        beatmap = await self.owoAPI.get_beatmap(
-            beatmap_id=replay_data.beatmap_hash, api='ripple') # ripple supports hash
+        beatmap = await self.owoAPI.get_beatmap_by_md5(
+            replay_data.beatmap_hash, api='ripple') # ripple supports hash
         if beatmap:
             beatmap = beatmap[0]
             em, file = await self._get_replay_embed(message, beatmap, replay_data)
@@ -6618,9 +6682,8 @@ class Osu(commands.Cog):
 
         # print('Getting SS')
         try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as r:
-                    image = await r.content.read()
+            async with owoSession.get_manager().get(url) as r:
+                image = await r.content.read()
             with open(filepath,'wb') as f:
                 f.write(image)
                 f.close()
@@ -7875,7 +7938,6 @@ class Osu(commands.Cog):
                 userinfo = [cache_info_id['data']]
             else: # try the cache
                 userinfo = await self.owoAPI.get_user(username, mode=0)
-                await asyncio.sleep(.1)
 
             if not userinfo or len(userinfo) == 0:
                 msg += "`{}` does not exist in the osu! database.\n".format(username)
@@ -7912,7 +7974,6 @@ class Osu(commands.Cog):
                                 userinfo = userinfo[0]
 
                             new_json["userinfo"][mode] = userinfo
-                            await asyncio.sleep(self.SLEEP_TIME)
 
                         # handle server options
                         new_json["servers"] = {}
@@ -8132,7 +8193,6 @@ class Osu(commands.Cog):
                 else: # try the cache
                     osu_userinfo = await self.owoAPI.get_user(username, mode=0)
                     osu_userinfo = osu_userinfo[0]
-                    await asyncio.sleep(.1)
 
                 user_find = await self.track.find_one({"osu_id": osu_userinfo['user_id']})
 
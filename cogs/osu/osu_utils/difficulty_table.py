@@ -0,0 +1,113 @@
+"""
+Stars, aim, speed, max combo and modded ar/od/cs/hp for every mod
+combination that changes difficulty, computed once per parsed beatmap and
+kept next to it as <beatmap_id>.diff.json.
+
+EZ/HR (circle size) and DT/HT (speed) change what diff_calc returns, HD/FL/NF
+only matter to ppv2, so 9 rows cover most std and droid plays. TD changes it
+too (aim ** 0.8), TD plays aren't in the table and go to diff_calc.
+"""
+import os
+import json
+import pyttanko
+
+from cogs.osu.osu_utils import parsed_beatmap, droid_pyttanko, droid_strain, utils
+
+VERSION = 2 # 1 served no-TD rows to TD plays
+EXTENSION = '.diff.json'
+
+DIFF_MODS = pyttanko.MODS_EZ | pyttanko.MODS_HR | pyttanko.MODS_DT | pyttanko.MODS_HT
+MOD_COMBOS = [cs_mods | speed_mods
+    for cs_mods in [0, pyttanko.MODS_EZ, pyttanko.MODS_HR]
+    for speed_mods in [0, pyttanko.MODS_DT, pyttanko.MODS_HT]]
+
+
+class Stars:
+    """stands in for a diff_calc result (total, aim, speed)"""
+    def __init__(self, total, aim, speed):
+        self.total = total
+        self.aim = aim
+        self.speed = speed
+
+
+def table_mods(mods):
+    """row key for mods, None for combos that aren't in the table (EZHR, DTHT, TD)"""
+    mods = int(mods)
+    if mods & pyttanko.MODS_TOUCH_DEVICE:
+        return None
+    if mods & pyttanko.MODS_NC:
+        mods |= pyttanko.MODS_DT
+    mods &= DIFF_MODS
+    return mods if mods in MOD_COMBOS else None
+
+
+def _row(module, bmap, mods, calculator=None):
+    stars = (calculator or module.diff_calc)().calc(bmap, mods=mods)
+    _, ar, od, cs, hp = module.mods_apply(mods,
+        ar=bmap.ar, od=bmap.od, cs=bmap.cs, hp=bmap.hp)
+    return {
+        'stars': float(stars.total),
+        'aim': float(stars.aim),
+        'speed': float(stars.speed),
+        'max_combo': int(bmap.max_combo()),
+        'ar': float(ar), 'od': float(od), 'cs': float(cs), 'hp': float(hp)
+    }
+
+
+def compute(parsed):
+    """table for a ParsedBeatmap, each calculator gets its own copy of the map"""
+    std_bmap = parsed.to_pyttanko(pyttanko)
+    droid_bmap = parsed.to_pyttanko(droid_pyttanko)
+    table = {'version': VERSION, 'std': {}, 'droid': {}}
+    for mods in MOD_COMBOS:
+        table['std'][str(mods)] = _row(pyttanko, std_bmap, mods)
+        table['droid'][str(mods)] = _row(droid_pyttanko, droid_bmap,
+            utils.num_to_droid_mod(mods), calculator=droid_strain.diff_calc)
+    return table
+
+
+def lookup(table, mods, kind='std'):
+    """(Stars, row) for mods, None if the table can't answer"""
+    if not table or table.get('version') != VERSION:
+        return None
+    key = table_mods(mods)
+    if key is None:
+        return None
+    row = table.get(kind, {}).get(str(key))
+    if row is None:
+        return None
+    return Stars(row['stars'], row['aim'], row['speed']), row
+
+
+def sidecar_path(parsed_filepath):
+    return os.path.splitext(parsed_filepath)[0] + EXTENSION
+
+
+def dump(table, filepath):
+    temp_filepath = '{}.{}.tmp'.format(filepath, os.getpid())
+    with open(temp_filepath, 'w') as f:
+        json.dump(table, f)
+    os.replace(temp_filepath, filepath)
+
+
+def load(filepath):
+    """table from a sidecar, None if it's missing or out of date"""
+    try:
+        with open(filepath) as f:
+            table = json.load(f)
+    except (OSError, ValueError):
+        return None
+    if table.get('version') != VERSION:
+        return None
+    return table
+
+
+def build(parsed_filepath):
+    """computes and writes the sidecar for a parsed beatmap file, run in an executor"""
+    try:
+        table = compute(parsed_beatmap.load_parsed(parsed_filepath))
+        dump(table, sidecar_path(parsed_filepath))
+        return table
+    except Exception as e:
+        print('Difficulty table not built for {}: {}'.format(parsed_filepath, e))
+        return None
@@ -23,7 +23,6 @@ import matplotlib.dates as mdates
 
 from PIL import Image, ImageDraw, ImageFont, ImageEnhance, ImageFilter
 from cogs.osu.osu_utils import map_utils, web_utils, utils, owoAPI
-from cogs.osu.osu_utils.chunks import chunks
 
 async def plot_profile(user, color = 'blue'):
     rank_data = user['rank_history']["data"]
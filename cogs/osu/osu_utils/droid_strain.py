@@ -0,0 +1,243 @@
+"""
+Array backend for droid_pyttanko.diff_calc.
+
+Positions, times and types go into numpy arrays once, spacing weights for
+both difficulty types are computed over the arrays, and only the strain
+decay (each strain depends on the previous one) and the strain intervals
+run as a loop, over plain floats instead of hitobject/v2f objects.
+
+Gives the same stars as droid_pyttanko.diff_calc (within float rounding,
+see other_scripts/benchmark_droid_strain.py) and has the same fields, but
+doesn't write normpos/strains/angle back onto the hitobjects.
+"""
+import math
+import numpy as np
+
+from cogs.osu.osu_utils import droid_pyttanko
+from cogs.osu.osu_utils.droid_pyttanko import (
+    DIFF_SPEED, DIFF_AIM, DECAY_BASE, OBJ_CIRCLE, OBJ_SLIDER, OBJ_SPINNER, MODE_STD)
+
+WEIGHT_SCALING = [1400.0, 26.25] # balances speed and aim
+PLAYFIELD_WIDTH = 512.0
+
+
+def scaling(cs):
+    """(scaling_factor, playfield_center) that normalize positions on circle radius"""
+    CIRCLESIZE_BUFF_THRESHOLD = 30.0
+    radius = (
+        (PLAYFIELD_WIDTH / 16.0) *
+        (1.0 - 0.7 * (cs - 5.0) / 5.0)
+    )
+    scaling_factor = 52.0 / radius
+    if radius < CIRCLESIZE_BUFF_THRESHOLD:
+        scaling_factor *= (
+            1.0 + min(CIRCLESIZE_BUFF_THRESHOLD - radius, 5.0) / 50.0
+        )
+    return scaling_factor, (PLAYFIELD_WIDTH / 2) * scaling_factor
+
+
+def hitobject_arrays(bmap, scaling_factor, playfield_center):
+    """(time, objtype, x, y) arrays with positions already normalized"""
+    objs = bmap.hitobjects
+    time = np.fromiter((obj.time for obj in objs), dtype=float, count=len(objs))
+    objtype = np.fromiter((obj.objtype for obj in objs), dtype=np.int64, count=len(objs))
+    spinner = (objtype & OBJ_SPINNER) != 0
+    x = np.fromiter((playfield_center if obj.objtype & OBJ_SPINNER else obj.data.pos.x
+        for obj in objs), dtype=float, count=len(objs))
+    y = np.fromiter((playfield_center if obj.objtype & OBJ_SPINNER else obj.data.pos.y
+        for obj in objs), dtype=float, count=len(objs))
+    x = np.where(spinner, x, x * scaling_factor)
+    y = np.where(spinner, y, y * scaling_factor)
+    return time, objtype, x, y
+
+
+def spacing_arrays(time, objtype, x, y, speed_mul):
+    """
+    (hit, delta_time, distance, prev_distance, prev_delta_time, angle) from
+    the previous objects, as d_strain leaves them on the hitobjects
+    """
+    num_objects = len(time)
+
+    # angle at each object from the two before it, nan for the first two
+    angle = np.full(num_objects, np.nan)
+    if num_objects > 2:
+        v1x, v1y = x[:-2] - x[1:-1], y[:-2] - y[1:-1]
+        v2x, v2y = x[2:] - x[1:-1], y[2:] - y[1:-1]
+        dot = v1x * v2x + v1y * v2y
+        det = v1x * v2y - v1y * v2x
+        angle[2:] = np.abs(np.arctan2(det, dot))
+
+    # spacing from the previous object, spinners and the first object keep 0
+    delta_time = np.zeros(num_objects)
+    distance = np.zeros(num_objects)
+    hit = (objtype & (OBJ_SLIDER | OBJ_CIRCLE)) != 0
+    if num_objects > 1:
+        delta_time[1:] = (time[1:] - time[:-1]) / speed_mul
+        dx, dy = x[1:] - x[:-1], y[1:] - y[:-1]
+        distance[1:] = np.where(hit[1:], np.sqrt(dx * dx + dy * dy), 0.0)
+    prev_distance = np.concatenate(([0.0], distance[:-1]))
+    prev_delta_time = np.concatenate(([0.0], delta_time[:-1]))
+    return hit, delta_time, distance, prev_distance, prev_delta_time, angle
+
+
+def spacing_weights(difftype, distance, delta_time, prev_distance,
+    prev_delta_time, angle, max_speed_bonus=53.0):
+    """
+    droid_pyttanko.d_spacing_weight over arrays, angle is nan where it's None.
+    pyttanko's (std) only differs in max_speed_bonus, which is 45 there
+    """
+    MIN_SPEED_BONUS = 75.0
+    MAX_SPEED_BONUS = max_speed_bonus
+    ANGLE_BONUS_SCALE = 90
+    AIM_TIMING_THRESHOLD = 107
+    SPEED_ANGLE_BONUS_BEGIN = 5 * math.pi / 6
+    AIM_ANGLE_BONUS_BEGIN = math.pi / 3
+    SINGLE_SPACING = 125.0
+
+    strain_time = np.maximum(delta_time, 50.0)
+    prev_strain_time = np.maximum(prev_delta_time, 50.0)
+
+    if difftype == DIFF_AIM:
+        angle_bonus = np.sqrt(
+            np.maximum(prev_distance - ANGLE_BONUS_SCALE, 0.0) *
+            np.power(np.sin(angle - AIM_ANGLE_BONUS_BEGIN), 2.0) *
+            np.maximum(distance - ANGLE_BONUS_SCALE, 0.0))
+        result = np.where(angle > AIM_ANGLE_BONUS_BEGIN,
+            1.5 * np.power(np.maximum(0.0, angle_bonus), 0.99) /
+            np.maximum(AIM_TIMING_THRESHOLD, prev_strain_time), 0.0)
+        weighted_distance = np.power(distance, 0.99)
+        res = np.maximum(result +
+            weighted_distance / np.maximum(AIM_TIMING_THRESHOLD, strain_time),
+            weighted_distance / strain_time)
+        return res, np.zeros(len(distance), dtype=bool)
+
+    elif difftype == DIFF_SPEED:
+        is_single = distance > SINGLE_SPACING
+        distance = np.minimum(distance, SINGLE_SPACING)
+        delta_time = np.maximum(delta_time, MAX_SPEED_BONUS)
+        speed_bonus = np.where(delta_time < MIN_SPEED_BONUS,
+            1.0 + np.power((MIN_SPEED_BONUS - delta_time) / 40.0, 2), 1.0)
+
+        s = np.sin(1.5 * (SPEED_ANGLE_BONUS_BEGIN - angle))
+        angle_bonus = np.where(angle < SPEED_ANGLE_BONUS_BEGIN, 1.0 + s * s / 3.57, 1.0)
+        close = distance < ANGLE_BONUS_SCALE
+        closeness = np.minimum((ANGLE_BONUS_SCALE - distance) / 10.0, 1.0)
+        sharp_bonus = np.where(close & (angle < math.pi / 4.0),
+            1.28 + (1.0 - 1.28) * closeness,
+            np.where(close,
+                1.28 + (1.0 - 1.28) * closeness * np.sin((math.pi / 2.0 - angle) * 4.0 / math.pi),
+                1.28))
+        angle_bonus = np.where(angle < math.pi / 2.0, sharp_bonus, angle_bonus)
+
+        res = (
+            (1 + (speed_bonus - 1) * 0.75) * angle_bonus *
+            (0.95 + speed_bonus * np.power(distance / SINGLE_SPACING, 3.5))
+        ) / strain_time
+        return res, is_single
+
+    raise NotImplementedError
+
+
+class diff_calc(droid_pyttanko.diff_calc):
+    """droid_pyttanko.diff_calc with the strain computed over arrays"""
+
+    def calc_strains(self, difftype, time, values, decays, speed_mul):
+        """strain peaks per interval, same loop as calc_individual over floats"""
+        strain_step = 400.0 * speed_mul
+        base = DECAY_BASE[difftype]
+
+        peaks = []
+        interval_end = math.ceil(time[0] / strain_step) * strain_step
+        max_strain = 0.0
+        strain = 0.0 # first object doesn't generate a strain
+        prev_time = time[0]
+
+        for obj_time, value, decay in zip(time[1:], values[1:], decays[1:]):
+            prev_strain = strain
+            strain = prev_strain * decay + value
+
+            while obj_time > interval_end:
+                peaks.append(max_strain)
+                max_strain = prev_strain * pow(base, (interval_end - prev_time) / 1000.0)
+                interval_end += strain_step
+
+            if strain > max_strain:
+                max_strain = strain
+            prev_time = obj_time
+
+        peaks.append(max_strain)
+        return peaks
+
+    def weigh_strains(self, peaks):
+        DECAY_WEIGHT = 0.9
+        weight = 1.0
+        total = 0.0
+        difficulty = 0.0
+
+        peaks.sort(reverse=True)
+        for strain in peaks:
+            total += pow(strain, 1.2)
+            difficulty += strain * weight
+            weight *= DECAY_WEIGHT
+
+        self.strains = peaks
+        return (difficulty, total)
+
+    def calc(self, bmap, mods, singletap_threshold=125):
+        STAR_SCALING_FACTOR = 0.0675
+        EXTREME_SCALING_FACTOR = 0.4
+
+        if bmap.mode != MODE_STD:
+            raise NotImplementedError
+
+        self.reset()
+
+        speed_mul, _, _, cs, _ = droid_pyttanko.mods_apply(mods, cs=bmap.cs)
+        scaling_factor, playfield_center = scaling(cs)
+
+        time, objtype, x, y = hitobject_arrays(bmap, scaling_factor, playfield_center)
+        hit, delta_time, distance, prev_distance, prev_delta_time, angle = \
+            spacing_arrays(time, objtype, x, y, speed_mul)
+
+        time_list = time.tolist()
+        with np.errstate(invalid='ignore'):
+            results = {}
+            is_single = None
+            for difftype in [DIFF_SPEED, DIFF_AIM]:
+                values, singles = spacing_weights(difftype, distance, delta_time,
+                    prev_distance, prev_delta_time, angle)
+                values = np.where(hit, values * WEIGHT_SCALING[difftype], 0.0)
+                decays = np.power(DECAY_BASE[difftype], delta_time / 1000.0)
+                if difftype == DIFF_SPEED:
+                    is_single = singles & hit
+                peaks = self.calc_strains(difftype, time_list,
+                    values.tolist(), decays.tolist(), speed_mul)
+                results[difftype] = self.weigh_strains(peaks)
+
+        self.speed, self.speed_difficulty = results[DIFF_SPEED]
+        self.aim, self.aim_difficulty = results[DIFF_AIM]
+
+        def length_bonus(star, diff):
+            return (
+              0.32 + 0.5 * (math.log10(diff + star) - math.log10(star))
+            )
+
+        self.aim_length_bonus = length_bonus(self.aim, self.aim_difficulty)
+        self.speed_length_bonus = (
+          length_bonus(self.speed, self.speed_difficulty)
+        )
+        self.aim = pow(math.sqrt(self.aim) * STAR_SCALING_FACTOR, 0.8)
+        self.speed = math.sqrt(self.speed) * STAR_SCALING_FACTOR
+
+        self.total = self.aim + self.speed
+        self.total += (
+            abs(self.speed - self.aim) *
+                EXTREME_SCALING_FACTOR
+        )
+
+        # singletap stats
+        self.nsingles = int(np.count_nonzero(is_single[1:]))
+        self.nsingles_threshold = int(np.count_nonzero(
+            hit[1:] & (delta_time[1:] >= singletap_threshold)))
+
+        return self
@@ -8,6 +8,7 @@ import pyoppai
 import discord
 import pyttanko
 import statistics
+import numpy as np
 from PIL import Image, ImageEnhance, ImageFilter
 import matplotlib as mpl
 mpl.use('Agg') # for non gui
@@ -16,10 +17,10 @@ import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 from utils.dataIO import dataIO, fileIO
 
-from pippy.beatmap import Beatmap
-from cogs.osu.osu_utils.chunks import chunks
 from cogs.osu.beatmap_parser import beatmap_parser
-from cogs.osu.osu_utils import utils, web_utils, droid_pyttanko
+from cogs.osu.osu_utils import utils, web_utils, droid_pyttanko, owoSession, owoDisk
+from cogs.osu.osu_utils import parsed_beatmap, difficulty_table, droid_strain, owoCompute
+from cogs.osu.osu_utils import osu_file, owoStore
 
 
 def handle_status(beatmap_info):
@@ -63,10 +64,14 @@ async def get_std_data(beatmap_info, bmp_parsed,
     key_append = '_mod'
     beatmap_id = beatmap_info['beatmap_id']
 
-    # let pyttanko handle calculations
+    # precomputed table first, then let pyttanko handle calculations
     ret_json = {}
+    table_hit = difficulty_table.lookup(getattr(bmap, 'difficulty', None), mods)
     try:
-        stars = pyttanko.diff_calc().calc(bmap, mods=mods)
+        if table_hit:
+            stars, _ = table_hit
+        else: # in the process pool, not on the event loop
+            stars = await owoCompute.get_service().diff_calc(bmap, mods)
     except:
         return beatmap_info, None
 
@@ -84,8 +89,12 @@ async def get_std_data(beatmap_info, bmp_parsed,
     ret_json['od'] = float(bmap.od)
     ret_json['ar'] = float(bmap.ar)
     ret_json['hp'] = float(bmap.hp)
-    _, ar_mod, od_mod, cs_mod, hp_mod = pyttanko.mods_apply(mods, 
-        ar=bmap.ar, od=bmap.od, cs=bmap.cs, hp=bmap.hp)
+    if table_hit:
+        _, row = table_hit
+        ar_mod, od_mod, cs_mod, hp_mod = row['ar'], row['od'], row['cs'], row['hp']
+    else:
+        _, ar_mod, od_mod, cs_mod, hp_mod = pyttanko.mods_apply(mods, 
+            ar=bmap.ar, od=bmap.od, cs=bmap.cs, hp=bmap.hp)
     ret_json['cs'+key_append] = float(cs_mod)
     ret_json['od'+key_append] = float(od_mod)
     ret_json['ar'+key_append] = float(ar_mod)
@@ -102,16 +111,13 @@ async def get_std_data(beatmap_info, bmp_parsed,
     ret_json["total_length"+key_append], ret_json["bpm_mod"] = \
         time_mod(beatmap_info["total_length"], beatmap_info['bpm'], mods)
 
-    for acc in accs:
-        misses = 0
-        n300, n100, n50 = pyttanko.acc_round(acc, len(bmap.hitobjects), misses)
-        pp, aim_pp, speed_pp, acc_pp, _ = pyttanko.ppv2(
-            stars.aim, stars.speed, bmap=bmap, mods=mods,
-            n300=n300, n100=n100, n50=n50, nmiss=misses, combo=bmap.max_combo())
-        ret_json['pp'+key_append].append(float(pp))
-        ret_json['aim_pp'+key_append].append(float(aim_pp))
-        ret_json['speed_pp'+key_append].append(float(speed_pp))
-        ret_json['acc_pp'+key_append].append(float(acc_pp))
+    # every acc in one go
+    difficulty = pp_difficulty(bmap, stars)
+    acc_grid = pp_grid(difficulty, mods, accs=accs)
+    ret_json['pp'+key_append] = acc_grid['pp'].tolist()
+    ret_json['aim_pp'+key_append] = acc_grid['aim_pp'].tolist()
+    ret_json['speed_pp'+key_append] = acc_grid['speed_pp'].tolist()
+    ret_json['acc_pp'+key_append] = acc_grid['acc_pp'].tolist()
     
     ret_json['extra_info'] = {}
     if extra_info:
@@ -133,24 +139,23 @@ async def get_std_data(beatmap_info, bmp_parsed,
             fc_info['count_100'] = int(play_info['count_100'])
             fc_info['count_50'] = int(play_info['count_50'])
             fc_info['count_miss'] = 0
-            ret_json['extra_info']['fc_pp'], _, _, _, _ = pyttanko.ppv2(
-                stars.aim, stars.speed, bmap=bmap, mods=mods,
-                n300=fc_info['count_300'], n100=fc_info['count_100'], 
-                n50=fc_info['count_50'], nmiss=fc_info['count_miss'], 
-                combo=int(bmap.max_combo()))
             ret_json['extra_info']['fc_acc'] = float(utils.calculate_acc(fc_info, 0))
 
-            # calculate play pp
+            # calculate fc and play pp together
             total_hits = int(play_info['count_300']) + int(play_info['count_geki']) + \
                     int(play_info['count_100']) + int(play_info['count_katu']) + \
                     int(play_info['count_50'])
             total_misses = int(play_info['count_miss']) # + bmap.max_combo() - total_hits
-            ret_json['extra_info']['play_pp'], _, _, _, _ = pyttanko.ppv2(
-                stars.aim, stars.speed, bmap=bmap, mods=mods,
-                n300=int(play_info['count_300']) + int(play_info['count_geki']), 
-                n100=int(play_info['count_100']) + int(play_info['count_katu']), 
-                n50=int(play_info['count_50']), nmiss=total_misses, 
-                combo=int(play_info['max_combo']))
+            play_grid = pp_grid(difficulty, mods,
+                n300=[fc_info['count_300'],
+                    int(play_info['count_300']) + int(play_info['count_geki'])],
+                n100=[fc_info['count_100'],
+                    int(play_info['count_100']) + int(play_info['count_katu'])],
+                n50=[fc_info['count_50'], int(play_info['count_50'])],
+                misses=[fc_info['count_miss'], total_misses],
+                combos=[difficulty['max_combo'], int(play_info['max_combo'])])
+            ret_json['extra_info']['fc_pp'] = float(play_grid['pp'][0])
+            ret_json['extra_info']['play_pp'] = float(play_grid['pp'][1])
             ret_json['extra_info']['play_acc'] = float(utils.calculate_acc(play_info, 0))
 
             # get map completion
@@ -160,10 +165,8 @@ async def get_std_data(beatmap_info, bmp_parsed,
                 int(play_info['count_300']) + \
                 int(play_info['count_miss'])
 
-                numobj = completion_hits - 1
-                timing = int(bmap.hitobjects[-1].time) - int(bmap.hitobjects[0].time)
-                point = int(bmap.hitobjects[numobj].time) - int(bmap.hitobjects[0].time)
-                ret_json['extra_info']['map_completion'] = (point / timing) * 100
+                ret_json['extra_info']['map_completion'] = map_completion(
+                    [obj.time for obj in bmap.hitobjects], completion_hits)
             else:
                 ret_json['extra_info']['map_completion'] = 100
 
@@ -182,7 +185,13 @@ async def get_droid_data(beatmap_info, bmp_parsed,
     ret_json = {}
     # try:
     droid_mods = utils.num_to_droid_mod(mods)
-    stars = droid_pyttanko.diff_calc().calc(bmap, mods=droid_mods)
+    table_hit = difficulty_table.lookup(
+        getattr(bmap, 'difficulty', None), mods, kind='droid')
+    if table_hit:
+        stars, _ = table_hit
+    else:
+        stars = await owoCompute.get_service().diff_calc(
+            bmap, droid_mods, kind='droid')
     # except:
         # return beatmap_info, None
 
@@ -200,8 +209,12 @@ async def get_droid_data(beatmap_info, bmp_parsed,
     ret_json['od'] = float(bmap.od)
     ret_json['ar'] = float(bmap.ar)
     ret_json['hp'] = float(bmap.hp)
-    _, ar_mod, od_mod, cs_mod, hp_mod = droid_pyttanko.mods_apply(droid_mods, 
-        ar=bmap.ar, od=bmap.od, cs=bmap.cs, hp=bmap.hp)
+    if table_hit:
+        _, row = table_hit
+        ar_mod, od_mod, cs_mod, hp_mod = row['ar'], row['od'], row['cs'], row['hp']
+    else:
+        _, ar_mod, od_mod, cs_mod, hp_mod = droid_pyttanko.mods_apply(droid_mods, 
+            ar=bmap.ar, od=bmap.od, cs=bmap.cs, hp=bmap.hp)
     ret_json['cs'+key_append] = float(cs_mod)
     ret_json['od'+key_append] = float(od_mod)
     ret_json['ar'+key_append] = float(ar_mod)
@@ -273,10 +286,8 @@ async def get_droid_data(beatmap_info, bmp_parsed,
                 int(play_info['count_300']) + \
                 int(play_info['count_miss'])
 
-                numobj = completion_hits - 1
-                timing = int(bmap.hitobjects[-1].time) - int(bmap.hitobjects[0].time)
-                point = int(bmap.hitobjects[numobj].time) - int(bmap.hitobjects[0].time)
-                ret_json['extra_info']['map_completion'] = (point / timing) * 100
+                ret_json['extra_info']['map_completion'] = map_completion(
+                    [obj.time for obj in bmap.hitobjects], completion_hits)
             else:
                 ret_json['extra_info']['map_completion'] = 100
 
@@ -299,11 +310,199 @@ def time_mod(length_sec, bpm, mod_num):
     return length_mod, bpm_mod
 
 
+# ------- vectorized pp -------
+def pp_difficulty(bmap, stars):
+    """what pp_grid needs about one std map, from the map and its diff_calc"""
+    return {
+        'aim': float(stars.aim),
+        'speed': float(stars.speed),
+        'max_combo': int(bmap.max_combo()),
+        'nobjects': len(bmap.hitobjects),
+        'ncircles': int(bmap.ncircles),
+        'nsliders': int(bmap.nsliders),
+        'ar': float(bmap.ar),
+        'od': float(bmap.od)
+    }
+
+
+def acc_round_grid(accs, nobjects, misses=0):
+    """pyttanko.acc_round over arrays, returns (n300, n100, n50)"""
+    accs, nobjects, misses = np.broadcast_arrays(
+        np.asarray(accs, dtype=float), np.asarray(nobjects), np.asarray(misses))
+    misses = np.minimum(nobjects, misses)
+    max300 = nobjects - misses
+    hits = np.maximum(nobjects, 1)
+    maxacc = np.where(nobjects > 0, max300 * 300.0 / (hits * 300.0), 0.0) * 100.0
+    accs = np.maximum(0.0, np.minimum(maxacc, accs))
+
+    remaining = (accs * 0.01 - 1.0) * nobjects + misses
+    n100 = np.round(-3.0 * remaining * 0.5).astype(np.int64)
+    n50 = np.zeros_like(n100)
+    use_50s = n100 > nobjects - misses # acc lower than all 100s
+    n50 = np.where(use_50s,
+        np.minimum(max300, np.round(-6.0 * remaining * 0.5).astype(np.int64)), n50)
+    n100 = np.where(use_50s, 0, np.minimum(max300, n100))
+    n300 = nobjects - n100 - n50 - misses
+    return n300, n100, n50
+
+
+def _acc_calc(n300, n100, n50, nmiss):
+    hits = n300 + n100 + n50 + nmiss
+    return np.where(hits > 0,
+        (n50 * 50.0 + n100 * 100.0 + n300 * 300.0) / (np.maximum(hits, 1) * 300.0), 0.0)
+
+
+def _pp_base(stars):
+    return np.power(5.0 * np.maximum(1.0, stars / 0.0675) - 4.0, 3.0) / 100000.0
+
+
+def pp_grid(difficulty, mods=0, accs=None, misses=0, combos=None,
+    n300=None, n100=None, n50=None):
+    """
+    pyttanko.ppv2 (scorev1) for many plays on many maps at once.
+
+    difficulty is a pp_difficulty dict, or a list of them with mods as an int
+    or one per map. plays are given as accs (rounded like acc_round) or as
+    n300/n100/n50, along with misses and combos (None is max_combo - misses).
+    1-d play arrays are evaluated on every map, 2-d ones are (maps, plays).
+    returns a dict of pp, aim_pp, speed_pp, acc_pp and acc (percent) arrays
+    shaped (maps, plays), or (plays,) for a single map.
+    """
+    single = isinstance(difficulty, dict)
+    maps = [difficulty] if single else list(difficulty)
+    mods_list = np.broadcast_to(np.asarray(mods, dtype=np.int64), (len(maps),))
+
+    def column(values, dtype=float):
+        return np.asarray(values, dtype=dtype).reshape(-1, 1)
+
+    aim_stars = column([info['aim'] for info in maps])
+    speed_stars = column([info['speed'] for info in maps])
+    max_combo = column([max(1, info['max_combo']) for info in maps])
+    nobjects = column([info['nobjects'] for info in maps], np.int64)
+    ncircles = column([info['ncircles'] for info in maps], np.int64)
+    nsliders = column([info['nsliders'] for info in maps], np.int64)
+    mods_col = mods_list.reshape(-1, 1)
+
+    # modded ar/od, once per map
+    ar, od = [], []
+    for info, map_mods in zip(maps, mods_list.tolist()):
+        _, map_ar, map_od, _, _ = pyttanko.mods_apply(
+            map_mods, ar=info['ar'], od=info['od'])
+        ar.append(map_ar)
+        od.append(map_od)
+    ar, od = column(ar), column(od)
+
+    # plays
+    def plays(values, dtype=np.int64):
+        values = np.asarray(values, dtype=dtype)
+        return values.reshape(1, -1) if values.ndim < 2 else values
+
+    misses = plays(misses)
+    if n300 is None:
+        n300, n100, n50 = acc_round_grid(plays(accs, float), nobjects, misses)
+    n300, n100, n50, nmiss, _ = np.broadcast_arrays(plays(n300),
+        plays(0 if n100 is None else n100), plays(0 if n50 is None else n50),
+        misses, np.zeros((len(maps), 1), dtype=np.int64))
+    if combos is None:
+        combo = max_combo - nmiss
+    else:
+        combo = np.broadcast_to(plays(combos, float), n300.shape)
+
+    with np.errstate(divide='ignore', invalid='ignore'):
+        grid = _ppv2_grid(aim_stars, speed_stars, max_combo, nobjects, ncircles,
+            nsliders, ar, od, mods_col, n300, n100, n50, nmiss, combo)
+    if single:
+        grid = {key: values[0] for key, values in grid.items()}
+    return grid
+
+
+def _ppv2_grid(aim_stars, speed_stars, max_combo, nobjects, ncircles,
+    nsliders, ar, od, mods_col, n300, n100, n50, nmiss, combo):
+    """the body of pyttanko.ppv2, map values are (maps, 1) columns"""
+    nspinners = nobjects - nsliders - ncircles
+
+    # accuracy
+    accuracy = _acc_calc(n300, n100, n50, nmiss)
+    real_acc = np.maximum(0.0, _acc_calc(n300 - nsliders - nspinners, n100, n50, nmiss))
+
+    # global values
+    nobjects_over_2k = nobjects / 2000.0
+    length_bonus = 0.95 + 0.4 * np.minimum(1.0, nobjects_over_2k)
+    length_bonus = np.where(nobjects > 2000,
+        length_bonus + np.log10(np.maximum(nobjects_over_2k, 1.0)) * 0.5, length_bonus)
+
+    miss_ratio = np.power(nmiss / nobjects.astype(float), 0.775)
+    miss_penalty_aim = np.where(nmiss > 0,
+        0.97 * np.power(1 - miss_ratio, nmiss.astype(float)), 1.0)
+    miss_penalty_speed = np.where(nmiss > 0,
+        0.97 * np.power(1 - miss_ratio, np.power(nmiss.astype(float), 0.875)), 1.0)
+    combo_break = np.power(combo, 0.8) / np.power(max_combo, 0.8)
+
+    # ar bonus
+    ar_bonus = np.where(ar > 10.33, 0.4 * (ar - 10.33),
+        np.where(ar < 8.0, 0.01 * (8.0 - ar), 0.0))
+    ar_factor = 1.0 + np.minimum(ar_bonus, ar_bonus * (nobjects / 1000.0))
+    hidden = (mods_col & pyttanko.MODS_HD) != 0
+    flashlight = (mods_col & pyttanko.MODS_FL) != 0
+    hd_bonus = np.where(hidden, 1.0 + 0.04 * (12.0 - ar), 1.0)
+
+    fl_bonus = 1.0 + 0.35 * np.minimum(1.0, nobjects / 200.0)
+    fl_bonus = np.where(nobjects > 200,
+        fl_bonus + 0.3 * np.minimum(1, (nobjects - 200) / 300.0), fl_bonus)
+    fl_bonus = np.where(nobjects > 500, fl_bonus + (nobjects - 500) / 1200.0, fl_bonus)
+    fl_bonus = np.where(flashlight, fl_bonus, 1.0)
+
+    od_squared = od * od
+    od_bonus = 0.98 + od_squared / 2500.0
+
+    # aim pp
+    aim = _pp_base(aim_stars) * length_bonus
+    aim = aim * miss_penalty_aim * combo_break * ar_factor * hd_bonus * fl_bonus
+    aim = aim * (0.5 + accuracy / 2.0) * od_bonus
+
+    # speed pp
+    speed = _pp_base(speed_stars) * length_bonus
+    speed = speed * miss_penalty_speed * combo_break
+    speed = speed * np.where(ar > 10.33, ar_factor, 1.0) * hd_bonus
+    speed = speed * ((0.95 + od_squared / 750.0) * \
+        np.power(accuracy, (14.5 - np.maximum(od, 8.0)) / 2.0))
+    speed = np.where(n50 >= nobjects / 500.0,
+        speed * np.power(0.98, n50 - nobjects / 500.0), speed)
+
+    # acc pp
+    acc = np.power(1.52163, od) * np.power(real_acc, 24.0) * 2.83
+    acc = acc * np.minimum(1.15, np.power(ncircles / 1000.0, 0.3))
+    acc = acc * np.where(hidden, 1.08, 1.0) * np.where(flashlight, 1.02, 1.0)
+
+    # total pp
+    final_multiplier = np.full(n300.shape, 1.12)
+    final_multiplier = np.where((mods_col & pyttanko.MODS_NF) != 0,
+        final_multiplier * np.maximum(0.9, 1.0 - 0.2 * nmiss), final_multiplier)
+    final_multiplier = np.where((mods_col & pyttanko.MODS_SO) != 0,
+        final_multiplier * (1.0 - np.power(nspinners / nobjects.astype(float), 0.85)),
+        final_multiplier)
+    total = np.power(np.power(aim, 1.1) + np.power(speed, 1.1) + np.power(acc, 1.1),
+        1.0 / 1.1) * final_multiplier
+
+    return {'pp': total, 'aim_pp': aim, 'speed_pp': speed,
+        'acc_pp': acc, 'acc': accuracy * 100.0}
+
+
 async def get_rec_data(map_id:str, accs=[100], mods=0, misses=0, combo=None,
     completion=None, fc=None, plot = False, color = 'blue', gamemode = 0):
+    parsed_filepath = os.path.join('cogs', 'osu', 'cache', 'beatmap_parsed',
+        '{}{}'.format(map_id, parsed_beatmap.EXTENSION))
     try:
-        file_path = 'cogs/osu/beatmaps/{}.osu'.format(map_id) # some unique filepath
-        bmap = pyttanko.parser().map(open(file_path))
+        bmap = parsed_beatmap.load(parsed_filepath)
+        bmap.difficulty = difficulty_table.load(
+            difficulty_table.sidecar_path(parsed_filepath))
+    except (OSError, ValueError):
+        bmap = None
+
+    try:
+        if bmap is None:
+            file_path = owoStore.get_store().get_path(map_id)
+            bmap = osu_file.parse(file_path)
     except:
         url = 'https://osu.ppy.sh/osu/{}'.format(map_id)
         file_id = random.randint(0,50)
@@ -311,10 +510,14 @@ async def get_rec_data(map_id:str, accs=[100], mods=0, misses=0, combo=None,
         fc_pp = 0
         # await download_file(url, file_path) # this is the file name that it downloaded
         return
-        bmap = pyttanko.parser().map(open(file_path))
+        bmap = osu_file.parse(file_path)
         print(f"Downloading {map_id}")
 
-    stars = pyttanko.diff_calc().calc(bmap, mods=mods)
+    table_hit = difficulty_table.lookup(getattr(bmap, 'difficulty', None), mods)
+    if table_hit:
+        stars, _ = table_hit
+    else:
+        stars = pyttanko.diff_calc().calc(bmap, mods=mods)
     bmap.stars = stars.total
     bmap.aim_stars = stars.aim
     bmap.speed_stars = stars.speed
@@ -957,7 +1160,7 @@ async def plot_map_stars(bmap_chunks, bmap_info, mods=0, color='blue'):
 
 
 async def _get_map_image(mapset_id):
-    # also maintains length to 1500
+    # folder size is kept in check by owoDisk
     folder = f"cogs/osu/resources/beatmap_images"
     filename = f"{mapset_id}.jpg"
     file_path = f"{folder}/{filename}"
@@ -965,7 +1168,9 @@ async def _get_map_image(mapset_id):
     # if it exists
     if os.path.exists(file_path):
         try:
-            bg = Image.open(file_path)
+            with owoDisk.get_manager().reading(file_path):
+                bg = Image.open(file_path)
+                bg.load()
             return bg, True
         except:
             pass
@@ -983,19 +1188,19 @@ async def _get_map_image(mapset_id):
                "sid": "",
                "login": "Login"}"""
 
-    async with aiohttp.ClientSession() as session:
-        # async with session.post('https://osu.ppy.sh/forum/ucp.php?mode=login', data = payload) as resp:
-        # text = await resp.read()
-        try:
-            print("Attempting Download")
-            bg, bg_success = await download_map_image_to_folder(mapset_id, session=session)
-            # bg = Image.open("cogs/osu/resources/triangles_map.jpg")
-            return bg, bg_success
-            # return bg
-        except:
-            bg = Image.open(os.path.join(
-                os.getcwd(), "cogs/osu/resources/triangles_map.jpg"))
-            return bg, False
+    session = owoSession.get_manager().get_session('https://assets.ppy.sh/')
+    # async with session.post('https://osu.ppy.sh/forum/ucp.php?mode=login', data = payload) as resp:
+    # text = await resp.read()
+    try:
+        print("Attempting Download")
+        bg, bg_success = await download_map_image_to_folder(mapset_id, session=session)
+        # bg = Image.open("cogs/osu/resources/triangles_map.jpg")
+        return bg, bg_success
+        # return bg
+    except:
+        bg = Image.open(os.path.join(
+            os.getcwd(), "cogs/osu/resources/triangles_map.jpg"))
+        return bg, False
 
 
 async def download_map_image_to_folder(mapset_id, session=None, limit=8000):
@@ -1016,21 +1221,13 @@ async def download_map_image_to_folder(mapset_id, session=None, limit=8000):
         with open(file_path,'wb') as f:
             f.write(image)
         bg = Image.open(file_path)
+        bg.load()
         bg_success = True
         break
         # await asyncio.sleep(1)
 
-    # if too many
-    """
-    path, dirs, files = next(os.walk(folder))
-    file_count = len(files)
-    if file_count > limit:
-        delete_num = file_count - limit
-        for i in range(delete_num):
-            file = random.choice(files)
-            delete_file = f"{folder}/{file}"
-            if delete_file != file_path:
-                os.remove(delete_file)"""
+    # evicts the least recently used images past the folder quota
+    owoDisk.get_manager().add(file_path)
     return bg, bg_success
 
 
@@ -1040,22 +1237,20 @@ def plot_time_format(time, pos=None):
     return "%d:%02d" % (m, s)
 
 
+def map_completion(hitobject_times, hits):
+    """percent of the map's length played by the time of the hits-th object"""
+    timing = int(hitobject_times[-1]) - int(hitobject_times[0])
+    point = int(hitobject_times[hits - 1]) - int(hitobject_times[0])
+    return (point / timing) * 100
+
+
 async def _map_completion(btmap, totalhits=0):
-    btmap = open(btmap, 'r').read()
-    btmap = Beatmap(btmap)
-    good = btmap.parse()
-    if not good:
-        raise ValueError("Beatmap verify failed. "
-                         "Either beatmap is not for osu! standart, or it's malformed")
-        return
-    hitobj = []
+    # only needs the hitobject times, the rest of the file isn't decoded
+    with osu_file.OsuFile(btmap) as osu:
+        if osu.mode() != 0:
+            raise ValueError("Beatmap verify failed. "
+                             "Either beatmap is not for osu! standart, or it's malformed")
+        hitobject_times = osu.hitobject_times()
     if totalhits == 0:
-        totalhits = len(btmap.hit_objects)
-    numobj = totalhits - 1
-    num = len(btmap.hit_objects)
-    for objects in btmap.hit_objects:
-        hitobj.append(objects.time)
-    timing = int(hitobj[num - 1]) - int(hitobj[0])
-    point = int(hitobj[numobj]) - int(hitobj[0])
-    map_completion = (point / timing) * 100
-    return map_completion
+        totalhits = len(hitobject_times)
+    return map_completion(hitobject_times, totalhits)
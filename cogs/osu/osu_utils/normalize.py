@@ -0,0 +1,148 @@
+import re
+import json
+import datetime
+
+from cogs.osu.osu_utils import utils
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+
+# ----- json -----
+def json_loads(text):
+    """orjson when it's installed, the standard library otherwise"""
+    if orjson is not None:
+        try:
+            return orjson.loads(text)
+        except orjson.JSONDecodeError: # NaN, huge ints, etc.
+            pass
+    return json.loads(text)
+
+
+# ----- keys -----
+class KeyMap(object):
+    """
+    Static key renames for api responses. `mapping` applies to every command,
+    `commands` adds/overrides renames for a single command (None keeps the key).
+    Each command is compiled once into a translation function.
+    """
+    def __init__(self, mapping, commands=None):
+        self.mapping = mapping
+        self.commands = commands or {}
+        self._tables = {}
+        self._compiled = {}
+
+    def table(self, command=None):
+        table = self._tables.get(command)
+        if table is None:
+            table = dict(self.mapping)
+            table.update(self.commands.get(command, {}))
+            table = {key_name: new_key for key_name, new_key in table.items()
+                if new_key and new_key != key_name}
+            self._tables[command] = table
+        return table
+
+    def compile(self, command=None):
+        translate = self._compiled.get(command)
+        if translate is None:
+            translate = _make_translator(self.table(command))
+            self._compiled[command] = translate
+        return translate
+
+    def __call__(self, key_name, command=None):
+        # same interface as the old key_mapping methods
+        return self.table(command).get(key_name)
+
+
+def _make_translator(table):
+    if not table:
+        return dict
+
+    get = table.get
+    def translate(obj):
+        return {get(key_name, key_name): value for key_name, value in obj.items()}
+    return translate
+
+
+def key_cleanup(obj_list, key_mapping, command=None):
+    if isinstance(key_mapping, KeyMap):
+        translate = key_mapping.compile(command)
+        return [translate(sub_obj) for sub_obj in obj_list]
+
+    # plain key_mapping(key_name, command=None) function
+    new_obj_list = []
+
+    for sub_obj in obj_list:
+        new_sub_obj = {}
+        for obj_key in sub_obj.keys():
+            new_key = key_mapping(obj_key, command=command)
+            if new_key:
+                new_sub_obj[new_key] = sub_obj[obj_key]
+            else:
+                new_sub_obj[obj_key] = sub_obj[obj_key]
+        new_obj_list.append(new_sub_obj)
+
+    return new_obj_list
+
+
+def value_cleanup(obj_list, key_name, value_mapping):
+    for idx, sub_obj in enumerate(obj_list):
+        obj_list[idx] = value_mapping(sub_obj, key_name)
+
+    return obj_list
+
+
+# ----- values -----
+RANKING_STATUS = {
+    'graveyard': -2,
+    'WIP': -1,
+    'pending': 0,
+    'ranked': 1,
+    'approved': 2,
+    'qualified': 3,
+    'loved': 4
+}
+
+GAMEMODES = {
+    'osu': 0,
+    'taiko': 1,
+    'fruits': 2,
+    'mania': 3
+}
+
+
+def fix_ranking_status(status):
+    if isinstance(status, str):
+        return RANKING_STATUS.get(status, status)
+    return status
+
+
+def fix_gamemode(mode):
+    if isinstance(mode, str):
+        return GAMEMODES.get(mode, mode)
+    return mode
+
+
+_UTC_DATE = re.compile(r'[0-9]{4}-[0-9]{2}-[0-9]{2}T[0-9]{2}:[0-9]{2}:[0-9]{2}(\+00:00|Z)')
+
+def fix_utc_date(date_str, date_format='%Y-%m-%dT%H:%M:%S+00:00'):
+    """ISO utc date to '%Y-%m-%d %H:%M:%S', sliced when it's well formed"""
+    match = _UTC_DATE.fullmatch(date_str)
+    if match and date_format.endswith(match.group(1)):
+        return date_str[:10] + ' ' + date_str[11:19]
+
+    dt_obj = datetime.datetime.strptime(date_str, date_format)
+    return dt_obj.strftime('%Y-%m-%d %H:%M:%S')
+
+
+_mod_nums = {}
+
+def mod_str_to_num(mod_str):
+    """utils.mod_to_num, remembered per mod string"""
+    mod_num = _mod_nums.get(mod_str)
+    if mod_num is None:
+        mod_num = utils.mod_to_num(mod_str)
+        _mod_nums[mod_str] = mod_num
+    return mod_num
@@ -0,0 +1,152 @@
+"""
+Lazy .osu reader. The file is memory-mapped, one scan records where each
+[Section] starts and ends, and a section is only decoded when it's asked for.
+
+    with OsuFile(filepath) as osu:
+        osu.difficulty()          # {'hp', 'cs', 'od', 'ar', 'sv', 'tick_rate'}
+        osu.metadata()            # [Metadata] as a dict
+        osu.hitobject_times()     # start times, numpy array
+        bmap = osu.to_pyttanko()  # full pyttanko (or droid_pyttanko) beatmap
+
+The full path only hands the sections pyttanko reads to its parser, so
+storyboards in [Events] are never decoded.
+"""
+import os
+import re
+import mmap
+import numpy as np
+import pyttanko
+
+SECTION = re.compile(rb'^[ \t]*\[([^\]\r\n]*)\][ \t]*\r?$', re.MULTILINE)
+PARSED_SECTIONS = ['General', 'Metadata', 'Difficulty', 'TimingPoints', 'HitObjects']
+DIFFICULTY_FIELDS = {
+    'HPDrainRate': 'hp',
+    'CircleSize': 'cs',
+    'OverallDifficulty': 'od',
+    'ApproachRate': 'ar',
+    'SliderMultiplier': 'sv',
+    'SliderTickRate': 'tick_rate'
+}
+
+
+class OsuFile:
+    """memory-mapped .osu file, close it (or use with) when done"""
+    def __init__(self, filepath):
+        self.filepath = filepath
+        self.file = open(filepath, 'rb')
+        try:
+            if os.fstat(self.file.fileno()).st_size:
+                self.data = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+            else: # empty files can't be mapped
+                self.data = b''
+            self.header_end, self.sections = self._index()
+        except:
+            self.close()
+            raise
+
+    def _index(self):
+        """(end of the lines before any section, [(name, start, end)] in file order)"""
+        sections = []
+        header_end = len(self.data)
+        for match in SECTION.finditer(self.data):
+            if sections:
+                name, start, _ = sections[-1]
+                sections[-1] = (name, start, match.start())
+            else:
+                header_end = match.start()
+            sections.append((match.group(1).decode('utf-8', 'replace'),
+                match.end(), len(self.data)))
+        return header_end, sections
+
+    def close(self):
+        if isinstance(getattr(self, 'data', None), mmap.mmap):
+            self.data.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    # ----- sections -----
+    def has_section(self, name):
+        return any(section[0] == name for section in self.sections)
+
+    def section_bytes(self, name):
+        return b''.join(self.data[start:end]
+            for section, start, end in self.sections if section == name)
+
+    def section_lines(self, name):
+        return self.section_bytes(name).decode('utf-8', 'replace').splitlines()
+
+    def properties(self, name):
+        """Key:Value lines of a section as a dict of stripped strings"""
+        properties = {}
+        for line in self.section_lines(name):
+            if line.startswith('//') or ':' not in line:
+                continue
+            key, value = line.split(':', 1)
+            properties[key.strip()] = value.strip()
+        return properties
+
+    # ----- fast paths -----
+    def mode(self):
+        try:
+            return int(self.properties('General').get('Mode', 0))
+        except ValueError:
+            return 0
+
+    def metadata(self):
+        return self.properties('Metadata')
+
+    def difficulty(self):
+        """[Difficulty] under pyttanko's names, ar falls back to od like the parser"""
+        difficulty = {}
+        for key, value in self.properties('Difficulty').items():
+            if key in DIFFICULTY_FIELDS:
+                try:
+                    difficulty[DIFFICULTY_FIELDS[key]] = float(value)
+                except ValueError:
+                    pass
+        if 'ar' not in difficulty and 'od' in difficulty:
+            difficulty['ar'] = difficulty['od']
+        return difficulty
+
+    def hitobject_lines(self):
+        return [line for line in self.section_bytes('HitObjects').split(b'\n')
+            if line.strip() and not line.startswith((b' ', b'_', b'//'))]
+
+    def hitobject_times(self):
+        times = []
+        for line in self.hitobject_lines():
+            try:
+                times.append(float(line.split(b',', 3)[2]))
+            except (IndexError, ValueError):
+                pass
+        return np.array(times, dtype=float)
+
+    # ----- full path -----
+    def parsed_lines(self):
+        """the file minus the sections pyttanko doesn't read"""
+        lines = self.data[:self.header_end].decode('utf-8', 'replace').splitlines()
+        for name, start, end in self.sections:
+            if name in PARSED_SECTIONS:
+                lines.append('[{}]'.format(name))
+                lines.extend(self.data[start:end].decode('utf-8', 'replace').splitlines())
+        return lines
+
+    def to_pyttanko(self, module=pyttanko):
+        """a module.beatmap, `module` can also be droid_pyttanko"""
+        return module.parser().map(self.parsed_lines())
+
+
+def parse(filepath, module=pyttanko):
+    """full beatmap, for module.parser().map(open(filepath)) without the open file"""
+    with OsuFile(filepath) as osu:
+        return osu.to_pyttanko(module)
+
+
+def hitobject_times(filepath):
+    with OsuFile(filepath) as osu:
+        return osu.hitobject_times()
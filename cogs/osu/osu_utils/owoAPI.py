@@ -13,15 +13,15 @@ import requests
 import datetime 
 import aiofiles
 import operator
-import pyttanko
-import pickle as pkl
 from PIL import Image
 from string import ascii_uppercase
 from utils.dataIO import dataIO, fileIO
 from utils.uri_builder import URIBuilder
 
-from cogs.osu.osu_utils.chunks import chunks
-from cogs.osu.osu_utils.owoCache import owoCache
+from cogs.osu.osu_utils.owoCache import owoCache, SingleFlight, NEGATIVE
+from cogs.osu.osu_utils import owoSession, owoLimiter, owoMirrors, owoMetrics, normalize
+from cogs.osu.osu_utils import parsed_beatmap, difficulty_table, owoDisk, owoStore, owoCompute
+from cogs.osu.osu_utils.normalize import KeyMap, key_cleanup, value_cleanup
 from cogs.osu.osu_utils import map_utils, web_utils, utils
 
 
@@ -34,10 +34,46 @@ class owoAPI(object):
         official_client_id=None, official_client_secret=None, 
         droid_api_key=None, beatconnect_api_key=None, database=None):
         # use cache?
-        self.use_cache = fileIO("config.json", "load")['settings']['osu']['cache']
-
-        # owo Cache
-        self.cache = owoCache(database)
+        osu_settings = fileIO("config.json", "load")['settings']['osu']
+        self.use_cache = osu_settings['cache']
+
+        # pooled http sessions, shared by every backend below
+        self.sessions = owoSession.SessionManager.from_settings(
+            osu_settings.get('http', {}))
+        owoSession.set_manager(self.sessions)
+
+        # offline stand-in for load testing, see other_scripts/api_standin.py
+        standin_settings = osu_settings.get('api_standin', {})
+        if standin_settings.get('enabled'):
+            self.sessions.standin = standin_settings['url']
+            print('Using api stand-in at', self.sessions.standin)
+
+        # owo Cache, stale windows in seconds and memory tier limits by cache name
+        self.cache = owoCache(database,
+            stale_times=osu_settings.get('cache_stale', {}),
+            memory_limits=osu_settings.get('cache_memory', {}),
+            keep_times=osu_settings.get('cache_keep', {}),
+            write_behind=osu_settings.get('cache_write_behind', {}),
+            negative_times=osu_settings.get('cache_negative', {}),
+            compression=osu_settings.get('cache_compression', {}))
+        # byte quotas and lru eviction for the beatmap/image folders
+        self.disk = owoDisk.DiskCacheManager.from_settings(
+            osu_settings.get('disk_cache', {}))
+        owoDisk.set_manager(self.disk)
+        asyncio.get_event_loop().create_task(self.disk.start())
+        # .osu files by md5, resolves beatmap ids and hashes without the api
+        self.osu_store = owoStore.OsuFileStore.from_settings(
+            osu_settings.get('osu_store', {}))
+        owoStore.set_store(self.osu_store)
+        asyncio.get_event_loop().create_task(self.osu_store.start())
+        # parsing, difficulty and chunks in a process pool, off the event loop
+        self.compute = owoCompute.ComputeService.from_settings(
+            osu_settings.get('compute', {}))
+        owoCompute.set_service(self.compute)
+        asyncio.get_event_loop().create_task(self.compute.start())
+
+        # shares one upstream request between identical concurrent lookups
+        self.single_flight = SingleFlight()
 
         # API list
         self.official_api = officialAPIv1(key=official_api_key)
@@ -77,38 +113,163 @@ class owoAPI(object):
         # other services
         self.beatconnect_api = BeatConnect(beatconnect_api_key)
 
-        # request_counter
-        self.LOG_INTERVAL = 60
-        self.last_log = time.time()
-        self.request_counter = {}
-        loop = asyncio.get_event_loop()
-        loop.create_task(self.log_poller())
+        # one request budget per upstream, shared by all priority lanes
+        self.limiter = owoLimiter.RateLimiter(
+            osu_settings.get('rate_limits', {}))
+        self._add_rate_limit_routes()
+        self.sessions.limiter = self.limiter
+
+        # .osz mirrors, tried fastest healthy first
+        self.OSZ_MIRRORS = ['ripple', 'gatari', 'akatsuki', 'ezppfarm']
+        self.mirrors = owoMirrors.MirrorScorer.from_settings(
+            self.OSZ_MIRRORS, osu_settings.get('mirrors', {}))
+
+        # bulk lookups
+        self.BULK_BEATMAP_LIMIT = 50 # ids per v2 request
+        self.BULK_CONCURRENCY = 8 # concurrent requests without a batch endpoint
+
+        # latency metrics, recorded at the transport, cache and downloads
+        metrics_settings = osu_settings.get('metrics', {})
+        self.metrics = owoMetrics.Metrics(
+            slot_seconds=metrics_settings.get('slot_seconds', 60),
+            num_slots=metrics_settings.get('num_slots', 60))
+        owoMetrics.set_metrics(self.metrics)
+        self.metrics_runner = None
+        if metrics_settings.get('port'):
+            loop = asyncio.get_event_loop()
+            loop.create_task(self._start_metrics_server(
+                metrics_settings.get('host', '127.0.0.1'), metrics_settings['port']))
+
+    async def close(self):
+        if self.metrics_runner is not None:
+            await self.metrics_runner.cleanup()
+        await self.cache.close()
+        await self.osu_store.close()
+        await self.compute.close()
+        owoCompute.clear_service(self.compute)
+        await self.disk.close()
+        owoDisk.clear_manager(self.disk)
+        owoStore.clear_store(self.osu_store)
+        owoSession.clear_manager(self.sessions)
+        await self.sessions.close()
+
+    # ---------------- metrics ------------------
+    async def _start_metrics_server(self, host, port):
+        try:
+            self.metrics_runner = await owoMetrics.start_server(
+                self.metrics, host=host, port=port)
+        except OSError as e:
+            print('Metrics endpoint not started:', e)
+
+
+    def get_api_usage(self, window=60):
+        """upstream requests per api and request over the last `window` seconds"""
+        usage = {}
+        upstream = self.metrics.summary('upstream', window).get('upstream', {})
+        for api, requests in upstream.items():
+            usage[api] = {request: stats['count'] for request, stats in requests.items()}
+        return usage
+
+
+    def get_latency_usage(self, kind=None, window=None):
+        """count/errors/p50/p95/p99 per kind, api and request"""
+        return self.metrics.summary(kind, window)
+
+
+    def get_dedup_usage(self):
+        return self.single_flight.get_stats()
+
+
+    def get_cache_memory_usage(self):
+        return self.cache.get_memory_stats()
+
+
+    def get_cache_compression_usage(self):
+        return self.cache.get_compression_stats()
+
+
+    def get_cache_write_behind_usage(self):
+        return self.cache.get_write_behind_stats()
 
-    # ---------------- logging ------------------
-    async def log_poller(self):
-        while True:
-            if time.time() - self.last_log >= self.LOG_INTERVAL:
-                self.request_counter = {}
-                self.last_log = time.time()
 
-            await asyncio.sleep(5)
+    def get_disk_usage(self):
+        return self.disk.get_stats()
+
+    def get_osu_store_usage(self):
+        return self.osu_store.get_stats()
+
+    def get_compute_usage(self):
+        return self.compute.get_stats()
+
+
+    # ---------------- stale-while-revalidate ------------------
+    async def _get_stale(self, cache, identifiers, request_name, flight_key, fetch,
+        allow_negative=False):
+        """
+        Cached data if there's a fresh or stale entry. Stale entries are
+        served as is and refreshed in the background (one refresh per key).
+        """
+        data, fresh = await cache.get_stale(identifiers, allow_negative=allow_negative)
+        if data is not None and not fresh:
+            self._schedule_refresh(request_name, flight_key, fetch)
+        return data
+
+
+    def _schedule_refresh(self, request_name, flight_key, fetch):
+        if self.single_flight.is_in_flight(request_name, flight_key):
+            return
+        # below interactive requests, the user already has an answer
+        with owoLimiter.lane('tracking'):
+            asyncio.ensure_future(self._refresh(request_name, flight_key, fetch))
+
+
+    async def _refresh(self, request_name, flight_key, fetch):
+        try:
+            await self.single_flight.do(request_name, flight_key, fetch)
+        except Exception as e:
+            print('Background refresh failed', request_name, flight_key, e)
+
+
+    # ---------------- rate limits ------------------
+    def _add_rate_limit_routes(self):
+        self.limiter.add_route('https://osu.ppy.sh/api/v2/', 'officialAPIv2')
+        self.limiter.add_route('https://osu.ppy.sh/oauth/', 'officialAPIv2')
+        self.limiter.add_route(
+            self._base_prefix(self.official_api.base), 'officialAPIv1')
+        self.limiter.add_route(
+            self._base_prefix(self.gatari_api.base), 'gatariAPI')
+        self.limiter.add_route(
+            self._base_prefix(self.droid_api.base), 'droidAPI')
+
+        # ripple family shares a budget per host (incl. their peppy-style api)
+        for api_obj in list(vars(self).values()):
+            if not isinstance(api_obj, rippleAPI):
+                continue
+            host = urllib.parse.urlparse(api_obj.base).netloc
+            for scheme in ['https', 'http']:
+                self.limiter.add_route('{}://{}/api/'.format(scheme, host),
+                    'rippleAPI', key='rippleAPI:{}'.format(host))
+
 
+    def _base_prefix(self, base):
+        return base.split('{')[0]
 
-    def log_request(self, request_name, api):
-        if api not in self.request_counter:
-            self.request_counter[api] = {}
 
-        if request_name not in self.request_counter[api]:
-            self.request_counter[api][request_name] = 0
+    def lane(self, name):
+        """priority lane for requests made inside, interactive/tracking/bulk"""
+        return owoLimiter.lane(name)
 
-        self.request_counter[api][request_name] += 1
 
+    def get_rate_limit_usage(self):
+        return self.limiter.get_stats()
 
-    def get_api_usage(self):
-        return self.request_counter
+
+    def get_mirror_usage(self):
+        return self.mirrors.get_stats()
 
 
     # --------------- api -------------------------
+    @owoMetrics.timed
     async def get_beatmap(self, beatmap_id, mods=0, 
         api='bancho', converted=0, since=None, use_cache=True):
         request_name = 'get_beatmap'
@@ -123,8 +284,11 @@ class owoAPI(object):
 
         if use_cache and self.use_cache and since is None:
             # print("Attempting to find cache.")
-            beatmap_info = await self.cache.beatmap.get(identifiers)
+            beatmap_info = await self.cache.beatmap.get(
+                identifiers, allow_negative=True)
             # print(beatmap_info)
+            if beatmap_info is NEGATIVE: # known not to exist
+                return []
             if beatmap_info is not None:
                 if api == 'bancho':
                     await self.map_search_upsert(beatmap_info)
@@ -132,8 +296,32 @@ class owoAPI(object):
                 return [beatmap_info]
 
             # print('get_beatmap cache not found.')
-        
+
+        flight_key = dict(identifiers, server=api, since=str(since))
+        return await self.single_flight.do(request_name, flight_key,
+            lambda: self._get_beatmap(request_name, identifiers,
+                beatmap_id, mods=mods, api=api, since=since))
+
+
+    async def _get_beatmap(self, request_name, identifiers, beatmap_id,
+        mods=0, api='bancho', since=None):
         # otherwise get from api
+        with owoSession.track_failures() as failures:
+            beatmap_info = await self._fetch_beatmap(beatmap_id,
+                mods=mods, api=api, since=since)
+
+        # then cache
+        if beatmap_info:
+            if api == 'bancho':
+                await self.map_search_upsert(beatmap_info[0])
+            await self.cache.beatmap.cache(identifiers, beatmap_info[0])
+        elif since is None and not failures[0]:
+            await self.cache.beatmap.cache_negative(identifiers)
+
+        return beatmap_info
+
+
+    async def _fetch_beatmap(self, beatmap_id, mods=0, api='bancho', since=None):
         if api == "gatari":
             # print('GATARI MAP')
             beatmap_info = await self.gatari_api.get_beatmaps(
@@ -152,19 +340,73 @@ class owoAPI(object):
         else: # official
             beatmap_info = await self.official_api_v2.get_beatmaps(
                 beatmap_id=beatmap_id, mods=mods)
+        return beatmap_info
 
-        # then cache
-        if beatmap_info:
-            if api == 'bancho':
-                await self.map_search_upsert(beatmap_info[0])
-            await self.cache.beatmap.cache(identifiers, beatmap_info[0])
-
-        # log request
-        self.log_request(request_name, api)
 
-        return beatmap_info
+    @owoMetrics.timed
+    async def get_beatmaps_bulk(self, beatmap_ids, 
+        mods=0, api='bancho', use_cache=True):
+        """
+        Beatmap info for many ids at once, in the same order as beatmap_ids
+        (None where a map couldn't be found)
+        """
 
+        clean_api = self.remove_api_suffix(api)
+        beatmap_ids = [str(beatmap_id) for beatmap_id in beatmap_ids]
+        unique_ids = list(dict.fromkeys(beatmap_ids))
 
+        # cache hits in one query
+        found = {}
+        if use_cache and self.use_cache:
+            found = await self.cache.beatmap.get_many('beatmap_id', unique_ids,
+                query={'api': str(clean_api), 'mods': int(mods)})
+
+        missing_ids = [beatmap_id for beatmap_id in unique_ids 
+            if beatmap_id not in found]
+
+        if missing_ids and api == 'bancho':
+            for i in range(0, len(missing_ids), self.BULK_BEATMAP_LIMIT):
+                id_chunk = missing_ids[i:i+self.BULK_BEATMAP_LIMIT]
+                beatmaps = await self.official_api_v2.get_beatmaps_bulk(id_chunk)
+
+                cache_tasks = []
+                for beatmap in beatmaps:
+                    beatmap_id = str(beatmap['beatmap_id'])
+                    found[beatmap_id] = beatmap
+                    identifiers = {
+                        'beatmap_id': beatmap_id,
+                        'api': str(clean_api),
+                        'mods': int(mods)
+                    }
+                    cache_tasks.append(self.map_search_upsert(beatmap))
+                    cache_tasks.append(self.cache.beatmap.cache(identifiers, beatmap))
+                await asyncio.gather(*cache_tasks)
+
+        elif missing_ids: # no batch endpoint, so bounded concurrency instead
+            semaphore = asyncio.Semaphore(self.BULK_CONCURRENCY)
+
+            async def _get_single(beatmap_id):
+                async with semaphore:
+                    try:
+                        if api == 'droid': # droid scores only have the hash
+                            beatmap = await self.get_beatmap_by_md5(beatmap_id,
+                                api=api, use_cache=False)
+                        else:
+                            beatmap = await self.get_beatmap(beatmap_id, 
+                                mods=mods, api=api, use_cache=False)
+                    except:
+                        return
+                if beatmap:
+                    found[beatmap_id] = beatmap[0]
+
+            await asyncio.gather(*[_get_single(beatmap_id) 
+                for beatmap_id in missing_ids])
+
+        return [copy.deepcopy(found.get(beatmap_id)) 
+            for beatmap_id in beatmap_ids]
+
+
+    @owoMetrics.timed
     async def get_beatmap_chunks(self, beatmap, beatmap_filepath, 
         mods=0, use_cache=True):
 
@@ -179,10 +421,10 @@ class owoAPI(object):
                 return bmap_chunk_cache['chunks']
 
         # download the beatmap in case
-        if not os.path.exists(beatmap_filepath):
-            await self.download_osu_file(beatmap)
+        if not beatmap_filepath or not os.path.exists(beatmap_filepath):
+            beatmap_filepath = await self.download_osu_file(beatmap)
 
-        bmap_chunks = chunks(beatmap_filepath, mods=mods)
+        bmap_chunks = await self.compute.chunks(beatmap_filepath, mods=mods)
 
         # then cache
         if bmap_chunks:
@@ -196,9 +438,9 @@ class owoAPI(object):
         return bmap_chunks
 
 
+    @owoMetrics.timed
     async def get_beatmapset(self, set_id, mods=0, 
         api='bancho', converted=0, hash_id=None, use_cache=True):
-        request_name = 'get_beatmapset'
 
         clean_api = self.remove_api_suffix(api)
         identifiers = {
@@ -224,25 +466,17 @@ class owoAPI(object):
 
             await self.cache.beatmapset.cache(identifiers, beatmaps)
 
-        # log request
-        self.log_request(request_name, api)
-
         return beatmaps
 
 
+    @owoMetrics.timed(api='beatconnect')
     async def get_full_beatmapset_image(self, beatmapset_id, beatmap_id=None):
-        api = 'beatconnect'
-        request_name = 'get_full_beatmapset_image'
-
         save_folder = 'cogs/osu/resources/beatmap_images_full'
         if not os.path.exists(save_folder):
             os.makedirs(save_folder)
         save_name = '{}.jpg'.format(beatmapset_id)
         full_path = os.path.join(save_folder, save_name)
 
-        # log request
-        self.log_request(request_name, api)
-
         resp = await self.beatconnect_api.get_full_beatmapset_image(
                 beatmapset_id, beatmap_id=beatmap_id)
         
@@ -256,16 +490,12 @@ class owoAPI(object):
         return resp
 
 
+    @owoMetrics.timed(api='beatconnect')
     async def get_beatmapset_audio(self, beatmapset_id):
-        api = 'beatconnect'
-        request_name = 'get_beatmapset_audio'
-
-        # log request
-        self.log_request(request_name, api)
-
         return await self.beatconnect_api.get_beatmapset_audio(beatmapset_id)
 
 
+    @owoMetrics.timed
     async def get_full_beatmap_info(self, beatmap_info, 
         mods=0, accs=[95, 99, 100], extra_info={}, use_cache=True, 
         force_osu_cache=False, api='bancho'):
@@ -301,22 +531,38 @@ class owoAPI(object):
         if mode == 0: # other modes don't work atm
             if use_cache and self.use_cache:
                 bmap_file = await self.cache.beatmap_parsed.get(identifiers)
-                # load file
-                if bmap_file and os.path.exists(bmap_file):
+                # load file, old pickles are parsed again and replaced
+                if bmap_file and bmap_file.endswith(parsed_beatmap.EXTENSION) \
+                    and os.path.exists(bmap_file):
                     # print("Loading cached file.")
-                    with open(bmap_file, 'rb') as pickle_file:
-                        bmap = pkl.load(pickle_file)
-                    using_cache = True
+                    try:
+                        with self.disk.reading(bmap_file):
+                            bmap = parsed_beatmap.load(bmap_file)
+                        using_cache = True
+                    except ValueError as e:
+                        print('Could not load parsed beatmap', e)
+
+                    # per-mod stars, parsed files from before the table get one now
+                    if bmap is not None:
+                        bmap.parsed_filepath = bmap_file # workers load it themselves
+                        bmap.difficulty = difficulty_table.load(
+                            difficulty_table.sidecar_path(bmap_file))
+                        if bmap.difficulty is None:
+                            bmap.difficulty = await self._stored_difficulty(
+                                beatmap_info, bmap_file)
+                        if bmap.difficulty is None:
+                            self.cache.beatmap_parsed.build_difficulty(bmap_file)
 
         # get info
         # print('API ACCS', accs)
-        filename = '{}.osu'.format(beatmap_info['beatmap_id'])
-        file_path = os.path.join(os.getcwd(),'cogs','osu','beatmaps', filename)
+        file_path = self.osu_store.get_path(beatmap_info['beatmap_id'])
         if mode == 0:
             if not bmap:
                 file_path = await self.download_osu_file(beatmap_info, 
                     force_cache=force_osu_cache)
-                bmap = pyttanko.parser().map(open(file_path))
+                with self.disk.reading(file_path):
+                    parsed = await self.compute.parse(file_path)
+                bmap = parsed.to_pyttanko()
 
             if api == 'droid':
                 resp, bmap = await map_utils.get_droid_data(beatmap_info, bmap,
@@ -347,51 +593,58 @@ class owoAPI(object):
         return resp, bmap, file_path
 
 
+    @owoMetrics.timed
     async def download_osu_file(self, beatmap_info, use_cache=True, force_cache=False, api='bancho'):
         request_name = 'download_osu_file'
 
         status = map_utils.handle_status(beatmap_info)
         beatmap_id = beatmap_info['beatmap_id']
         url = 'https://osu.ppy.sh/osu/{}'.format(beatmap_id)
-
-        filename = '{}.osu'.format(beatmap_id)
-        file_path = os.path.join(os.getcwd(),
-            'cogs','osu','beatmaps',filename)
+        md5 = self.beatmap_md5(beatmap_info)
 
         identifiers = {'beatmap_id': str(beatmap_id)}
 
-        try:
-            if os.path.exists(file_path) and use_cache and self.use_cache:
-                beatmap_osu_cache = await self.cache.beatmap_osu_file.get(identifiers)
+        if use_cache and self.use_cache:
+            if md5: # the hash says whether the stored file is current
+                file_path = self.osu_store.get_path(beatmap_id, md5=md5)
+                if file_path:
+                    self.disk.touch(file_path)
+                    return file_path
 
-                if beatmap_osu_cache:
-                    return beatmap_osu_cache['filepath']
+            file_path = self.osu_store.get_path(beatmap_id)
+            if file_path and (force_cache or api != 'bancho' or (not md5 and \
+                await self.cache.beatmap_osu_file.get(identifiers))):
+                self.disk.touch(file_path)
+                return file_path
 
-                if force_cache or api != 'bancho':
-                    return file_path
-        except:
-            pass
+        return await self.single_flight.do(request_name, identifiers,
+            lambda: self._download_osu_file(request_name, identifiers,
+                beatmap_info, status, url, md5, api=api))
+
+
+    async def _download_osu_file(self, request_name, identifiers, 
+        beatmap_info, status, url, md5, api='bancho'):
+        beatmap_id = str(beatmap_info['beatmap_id'])
 
         # download the beatmap
-        if status in [-2, 1, 2, 4]: # if it's ranked or graveyard, trust ripple
-            viable_dl_apis = ['ripple', 'gatari', 'akatsuki', 'ezppfarm']
+        file_path = None
+        if status in [-2, 1, 2, 4]: # if it's ranked or graveyard, trust the mirrors
             beatmapset_id = beatmap_info['beatmapset_id']
-            api = random.choice(viable_dl_apis)
 
             try:
                 print('Downloading full osz for', beatmapset_id)
-                await self.download_beatmap_osz(beatmapset_id, api=api)
-
-                if not os.path.exists(file_path): # backup
-                    print('Downloading osz unsuccesful, downloading .osu to', file_path)
-                    await self.download_file(url, file_path)
+                mirror = await self.download_beatmap_osz(beatmapset_id)
+                if mirror:
+                    api = mirror
+                # mirrors can have an older version of the map
+                file_path = self.osu_store.get_path(beatmap_id, md5=md5)
             except:
-                print('Downloading .osu to', file_path)
-                await self.download_file(url, file_path)                         
+                pass
 
-        else: # if wip, graveyard, etc. use ppy's server
-            print('Downloading .osu to', file_path)
-            await self.download_file(url, file_path)
+        if file_path is None: # if wip, graveyard, etc. use ppy's server
+            file_path = await self._download_osu_to_store(url, beatmap_id, md5)
+            if file_path is None:
+                return None
         
         # cache the result
         beatmap_osu_cache = {}
@@ -400,85 +653,163 @@ class owoAPI(object):
         await self.cache.beatmap_osu_file.cache(
             identifiers, beatmap_osu_cache)
 
-        self.log_request(request_name, api)
         return file_path
 
 
-    async def download_beatmap_osz(self, set_id, api='ripple'):
-        """downloads osz, unzips, and extracts all files into correct locations"""
-        request_name = 'download_beatmap_osz'
+    async def _download_osu_to_store(self, url, beatmap_id, md5=None):
+        temp_filepath = os.path.join(os.getcwd(), 'cogs', 'osu', 'temp',
+            '{}_{}.osu'.format(beatmap_id, random.randint(0, 1000000)))
+        print('Downloading .osu for', beatmap_id)
+        if not await self.download_file(url, temp_filepath):
+            return None
+
+        file_path, file_md5 = self.osu_store.add_file(
+            temp_filepath, beatmap_id=beatmap_id)
+        if md5 and file_md5 != md5: # ppy's file is the current one, our info is old
+            self.osu_store.mismatches += 1
+            print('Downloaded .osu for {} has md5 {}, expected {}'.format(
+                beatmap_id, file_md5, md5))
+        return file_path
+
+
+    async def _stored_difficulty(self, beatmap_info, bmap_file):
+        """difficulty table from the bulk run, written out as the parsed file's sidecar"""
+        md5 = self.osu_store.get_md5(beatmap_info['beatmap_id']) or \
+            self.beatmap_md5(beatmap_info)
+        table = await self.cache.get_stored_difficulty(md5)
+        if table is not None:
+            try:
+                difficulty_table.dump(table, difficulty_table.sidecar_path(bmap_file))
+            except OSError as e:
+                print('Could not write difficulty table for {}: {}'.format(bmap_file, e))
+        return table
+
+
+    def beatmap_md5(self, beatmap_info):
+        """md5 of the current .osu, named file_md5 by v1 and checksum by v2"""
+        md5 = beatmap_info.get('file_md5') or beatmap_info.get('checksum')
+        return str(md5).lower() if md5 else None
+
+
+    def get_beatmap_id_by_md5(self, md5):
+        return self.osu_store.get_beatmap_id(md5)
+
+
+    async def get_beatmap_by_md5(self, md5, api='ripple', use_cache=True):
+        """
+        beatmap info for a map hash (replays, droid scores). by id if the
+        local store knows the hash, otherwise `api` is asked for the hash
+        """
+        beatmap_id = self.get_beatmap_id_by_md5(md5)
+        if beatmap_id is not None:
+            beatmap = await self.get_beatmap(beatmap_id, use_cache=use_cache)
+            if beatmap:
+                return beatmap
+        return await self.get_beatmap(md5, api=api, use_cache=use_cache)
+
+
+    @owoMetrics.timed(api='mirrors')
+    async def download_beatmap_osz(self, set_id, api=None):
+        """downloads osz, unzips, and extracts all files into correct locations.
+        returns the mirror used, None if every mirror failed"""
+        mirrors = [api] if api else None
+
+        api, temp_filepath = await self.mirrors.run(
+            lambda mirror: self._fetch_osz(set_id, mirror), names=mirrors)
+
+        if not temp_filepath:
+            return None
+
+        try:
+            await self._extract_osz(set_id, temp_filepath)
+        finally:
+            self._remove_file(temp_filepath)
+
+        return api
+
+
+    async def _fetch_osz(self, set_id, api):
+        """one mirror attempt, returns the zip path if it's a valid osz"""
         api_obj = self.get_api(api)
         if not api_obj.beatmap_download:
-            api_obj = self.get_api('ripple')
+            return None
 
         download_url = api_obj.beatmap_download.format(str(set_id))
         dest_folderpath = os.path.join(os.getcwd(), 'cogs', 'osu', 'temp')
-        rand_dl_id = random.randint(0, 30)
-        temp_filepath = os.path.join(dest_folderpath, 'beatmapset_{}.zip'.format(rand_dl_id))
+        temp_filepath = os.path.join(dest_folderpath, 'beatmapset_{}_{}_{}.zip'.format(
+            set_id, api, random.randint(0, 1000000)))
 
-        await self.download_file(download_url, temp_filepath)
+        try:
+            with owoMetrics.labels(api, 'download_beatmap_osz'):
+                success = await self.download_file(download_url, temp_filepath)
+            # mirrors like to answer 200 with an html error page
+            if success and zipfile.is_zipfile(temp_filepath):
+                return temp_filepath
+        except asyncio.CancelledError:
+            self._remove_file(temp_filepath)
+            raise
 
-        # check if temp_filepath exists
-        if not os.path.exists(temp_filepath):
-            return
+        self._remove_file(temp_filepath)
+        return None
 
-        with zipfile.ZipFile(temp_filepath, 'r') as z:
-            # Extract all the contents of zip file in different directory
-            temp_location = os.path.join(dest_folderpath, 'beatmap_unzipped_{}'.format(rand_dl_id)) 
-
-            # first delete original folder/content
-            if os.path.exists(temp_location):
-                shutil.rmtree(temp_location)
-            z.extractall(temp_location)
-
-            # ------------- attempt to extract image --------------
-            background_dir = os.path.join(os.getcwd(), 'cogs', 'osu', 'resources', 'beatmap_images_full')
-            background_filepath = os.path.join(background_dir, '{}.png'.format(set_id))
-            valid_bg_images = []
-            for f in os.listdir(temp_location):
-                if os.path.splitext(f)[1].lower() in ['.jpg', '.jpeg', '.png']:
-                    full_image_path = os.path.join(temp_location, f)
-                    file_size = os.path.getsize(full_image_path)
-                    valid_bg_images.append((full_image_path, file_size))
-
-            # sort by size, largest is probably the background (one would hope)
-            sorted_list = sorted(
-                valid_bg_images, key=lambda tup: tup[1], reverse=True)
-            bg_image_path = sorted_list[0][0]
-
-            print('Downloading image to', background_filepath)
-
-            full_image = Image.open(bg_image_path).convert('RGBA')
-            full_image.save(background_filepath)
-
-            # ------------- attempt to get .osu files --------------
-            beatmap_folder = os.path.join(os.getcwd(), 'cogs', 'osu', 'beatmaps')
-            valid_osu_files = []
-            for f in os.listdir(temp_location):
-                if os.path.splitext(f)[1].lower() in ['.osu']:
-                    full_osu_filepath = os.path.join(temp_location, f)
-                    
-                    # process to find the beatmap id
-                    beatmap_id = None
-                    async with aiofiles.open(full_osu_filepath, mode='r') as f:
-                        async for line in f:
-                            if 'beatmapid:' in str(line).lower():
-                                linesplit = str(line).split(':')
-                                beatmap_id = linesplit[1].strip()
-                                print('BEATMAP ID FOUND', beatmap_id)
-
-                                # save to appropriate folder
-                                new_osu_filepath = os.path.join(beatmap_folder, '{}.osu'.format(beatmap_id))
-                                shutil.move(full_osu_filepath, new_osu_filepath)
-                                break
+
+    def _remove_file(self, filepath):
+        try:
+            os.remove(filepath)
+        except OSError:
+            pass
+
+
+    async def _extract_osz(self, set_id, temp_filepath):
+        dest_folderpath = os.path.dirname(temp_filepath)
+        dl_name = os.path.splitext(os.path.basename(temp_filepath))[0]
+
+        temp_location = os.path.join(dest_folderpath, 'unzipped_{}'.format(dl_name))
+        try:
+            with zipfile.ZipFile(temp_filepath, 'r') as z:
+                # Extract all the contents of zip file in different directory
+                z.extractall(temp_location)
+
+                # ------------- attempt to extract image --------------
+                background_dir = os.path.join(os.getcwd(), 'cogs', 'osu', 'resources', 'beatmap_images_full')
+                background_filepath = os.path.join(background_dir, '{}.png'.format(set_id))
+                valid_bg_images = []
+                for f in os.listdir(temp_location):
+                    if os.path.splitext(f)[1].lower() in ['.jpg', '.jpeg', '.png']:
+                        full_image_path = os.path.join(temp_location, f)
+                        file_size = os.path.getsize(full_image_path)
+                        valid_bg_images.append((full_image_path, file_size))
+
+                # sort by size, largest is probably the background (one would hope)
+                sorted_list = sorted(
+                    valid_bg_images, key=lambda tup: tup[1], reverse=True)
+                bg_image_path = sorted_list[0][0]
+
+                print('Downloading image to', background_filepath)
+
+                full_image = Image.open(bg_image_path).convert('RGBA')
+                full_image.save(background_filepath)
+                self.disk.add(background_filepath)
+
+                # ------------- attempt to get .osu files --------------
+                for f in os.listdir(temp_location):
+                    if os.path.splitext(f)[1].lower() in ['.osu']:
+                        full_osu_filepath = os.path.join(temp_location, f)
+                        async with aiofiles.open(full_osu_filepath, mode='rb') as f:
+                            data = await f.read()
+
+                        # the store finds the beatmap id, maps without one aren't kept
+                        if owoStore.read_beatmap_id(data) is not None:
+                            self.osu_store.add_bytes(data)
+        finally:
+            shutil.rmtree(temp_location, ignore_errors=True)
 
         # beatmaps = await self.official_api_v2.download_beatmapset(set_id)
-        self.log_request(request_name, api)
 
 
+    @owoMetrics.timed
     async def get_scores(self, beatmap_id, user_id, mode, 
         relax=0, api='bancho', use_cache=True):
-        request_name = 'get_scores'
 
         # check cache for user
         identifiers = {
@@ -489,11 +820,27 @@ class owoAPI(object):
         }
 
         if use_cache and self.use_cache:
-            user_score_info = await self.cache.user_score.get(identifiers)
+            user_score_info = await self.cache.user_score.get(
+                identifiers, allow_negative=True)
 
+            if user_score_info is NEGATIVE: # user or map doesn't exist there
+                return None
             if user_score_info is not None:
                 return user_score_info
 
+        with owoSession.track_failures() as failures:
+            resp = await self._fetch_scores(beatmap_id, user_id, mode, api=api)
+
+        # [] is a real answer (no scores), None means nothing was found
+        if resp is not None:
+            await self.cache.user_score.cache(identifiers, resp) # whole list
+        elif not failures[0]:
+            await self.cache.user_score.cache_negative(identifiers)
+
+        return resp
+
+
+    async def _fetch_scores(self, beatmap_id, user_id, mode, api='bancho'):
         api_obj = self.get_api(api)
         if api == 'bancho':
             resp = await self.official_api.get_scores(beatmap_id, user_id, mode)
@@ -510,12 +857,10 @@ class owoAPI(object):
             # resp = await api_obj.get_scores(beatmap_id, user_id, mode)
 
         # resp = await api.get_scores(beatmap_id, user_id, mode)
-        await self.cache.user_score.cache(identifiers, resp) # whole list
-
-        self.log_request(request_name, api)
         return resp
 
 
+    @owoMetrics.timed
     async def get_user(self, user_id, 
         mode=0, api='bancho', use_cache=True):
         request_name = 'get_user'
@@ -527,38 +872,54 @@ class owoAPI(object):
             'mode': int(mode)
         }
 
+        fetch = lambda: self._get_user(request_name, identifiers,
+            user_id, mode=mode, api=api)
+
         if use_cache and self.use_cache:
-            user_info = await self.cache.user.get(identifiers)
+            user_info = await self._get_stale(self.cache.user, 
+                identifiers, request_name, identifiers, fetch, allow_negative=True)
 
+            if user_info is NEGATIVE: # known not to exist (or restricted)
+                return []
             if user_info is not None:
                 return [user_info]        
 
+        return await self.single_flight.do(request_name, identifiers, fetch)
+
+
+    async def _get_user(self, request_name, identifiers, user_id,
+        mode=0, api='bancho'):
         # clean up for v2
         user_id = urllib.parse.quote(user_id.encode('utf8'))
 
-        if api == 'bancho':
-            # user_id = user_id.replace('_', ' ')
-            resp = await self.official_api_v2.get_user(user_id, mode=mode)
-            if not resp:
-                resp = await self.official_api.get_user(user_id, mode=mode)
+        with owoSession.track_failures() as failures:
+            if api == 'bancho':
+                # user_id = user_id.replace('_', ' ')
+                resp = await self.official_api_v2.get_user(user_id, mode=mode)
+                if not resp:
+                    resp = await self.official_api.get_user(user_id, mode=mode)
 
-        else:
+            else:
+                try:
+                    api_obj = self.get_api(api)
+                    resp = await api_obj.get_user(user_id, mode=mode)
+                except:
+                    resp = None
+                    failures[0] += 1 # can't tell a parse error from a missing user
+
+        # then cache, negative entry if they don't exist
+        if resp:
             try:
-                api_obj = self.get_api(api)
-                resp = await api_obj.get_user(user_id, mode=mode)
+                await self.cache.user.cache(identifiers, resp[0])
             except:
-                resp = None
-
-        # then cache, event if they don't exist
-        try:
-            await self.cache.user.cache(identifiers, resp[0])
-        except:
-            await self.cache.user.cache(identifiers, resp)   
+                await self.cache.user.cache(identifiers, resp)   
+        elif not failures[0]:
+            await self.cache.user.cache_negative(identifiers)
 
-        self.log_request(request_name, api)    
         return resp
 
 
+    @owoMetrics.timed
     async def get_user_detailed(self, user_id, 
         mode=0, api='bancho', use_cache=True):
         # request_name = 'get_user'
@@ -568,14 +929,12 @@ class owoAPI(object):
             # profile, firsts, recent activity, beatmaps
             resp = await self.get_user(user_id, api=api)
 
-        # self.log_request(request_name, api)
-
         return resp
 
 
+    @owoMetrics.timed
     async def get_user_recent_activity(self, user_id, 
         limit=50, offset=0, api='bancho', use_cache=True):
-        request_name = 'get_user_recent_activity'
 
         if api != 'bancho':
             return None
@@ -600,10 +959,10 @@ class owoAPI(object):
         if resp:
             await self.cache.user_recent_activity.cache(identifiers, resp)  
 
-        self.log_request(request_name, api)    
         return resp
 
 
+    @owoMetrics.timed
     async def get_user_best(self, user_id, 
         mode=0, api='bancho', limit=50, use_cache=True):
         request_name = 'get_user_best'
@@ -620,6 +979,14 @@ class owoAPI(object):
             if user_best is not None and len(user_best) >= limit:
                 return user_best
 
+        flight_key = dict(identifiers, limit=int(limit))
+        return await self.single_flight.do(request_name, flight_key,
+            lambda: self._get_user_best(request_name, identifiers,
+                user_id, mode=mode, api=api, limit=limit))
+
+
+    async def _get_user_best(self, request_name, identifiers, user_id,
+        mode=0, api='bancho', limit=50):
         api_obj = self.get_api(api)
 
         if 'bancho' in api:
@@ -633,10 +1000,10 @@ class owoAPI(object):
         if resp:
             await self.cache.user_best.cache(identifiers, resp)    
 
-        self.log_request(request_name, api)
         return resp
 
 
+    @owoMetrics.timed
     async def get_user_best_no_choke(self, user_id, 
         mode=0, api='bancho', use_cache=True):
 
@@ -689,32 +1056,14 @@ class owoAPI(object):
         # will output in same format as user_best, but no choke with "original" field.
         no_choke_list = []
 
-        for i, play_info in enumerate(play_list):
-
-            if 'enabled_mods' in play_info:
-                enabled_mods = int(play_info['enabled_mods'])
-            elif 'mods' in play_info:
-                enabled_mods = utils.mod_to_num(''.join(play_info['mods']))
-
-            # ensure some info exists... because some don't have it?
-            if api != 'bancho':
-                map_info = await self.get_beatmap(
-                    play_info['beatmap']['beatmap_id'], api=api)
-                map_info = map_info[0]
-                map_info['status'] = 1
-                map_info['mode'] = mode
-                # print(map_info)
-            else:
-                map_info = play_info['beatmap']
+        derived_list = await self._get_score_derived(
+            play_list, mode=mode, api=api)
 
-            # print('MAP INFO', map_info)
-            try:
-                beatmap_info, bmap, _ = await self.get_full_beatmap_info(map_info, 
-                    extra_info={'play_info': play_info}, mods=enabled_mods,
-                    force_osu_cache=True)
-                map_max_combo = int(bmap.max_combo())
-            except:
+        for i, play_info in enumerate(play_list):
+            derived = derived_list[i]
+            if derived is None or derived['max_combo'] is None:
                 continue
+            map_max_combo = derived['max_combo']
             
             # check if choke play
             no_choke_play = copy.deepcopy(play_info)
@@ -730,11 +1079,10 @@ class owoAPI(object):
                 no_choke_play['count_50'] = int(play_info['count_50'])
                 no_choke_play['count_miss'] = 0
                 no_choke_play['max_combo'] = map_max_combo
-                no_choke_play['accuracy'] = beatmap_info['extra_info']['fc_acc']
-                no_choke_play['pp'] = beatmap_info['extra_info']['fc_pp']
+                no_choke_play['accuracy'] = derived['fc_acc']
+                no_choke_play['pp'] = derived['fc_pp']
                 no_choke_play['original'] = copy.deepcopy(play_info)
-                no_choke_play['rank'] = utils.calculate_rank(
-                    no_choke_play, no_choke_play['accuracy'], ''.join(play_info['mods']))
+                no_choke_play['rank'] = derived['fc_rank']
             else:
                 no_choke_play['original'] = None
 
@@ -746,6 +1094,7 @@ class owoAPI(object):
         return no_choke_list_sorted
 
 
+    @owoMetrics.timed
     async def get_user_stats(self, user_id, 
         mode=0, api='bancho', use_cache=True):
 
@@ -806,41 +1155,25 @@ class owoAPI(object):
             "rank": [],
         }
 
+        derived_list = await self._get_score_derived(
+            scores, mode=mode, api=api)
+
         for score_idx, score in enumerate(scores):
             # weighting score['weight']
             # https://osu.ppy.sh/wiki/en/Performance_points/Weighting_system
+            enabled_mods = self._get_score_mods(score)
+            derived = derived_list[score_idx]
+            if derived is None:
+                continue
 
-            if 'enabled_mods' in score:
-                enabled_mods = int(score['enabled_mods'])
-            elif 'mods' in score:
-                enabled_mods = utils.mod_to_num(''.join(score['mods']))
-
-            # ensure some info exists... because some don't have it?
-            if api != 'bancho':
-                map_info = await self.get_beatmap(
-                    score['beatmap']['beatmap_id'], api=api)
-                map_info = map_info[0]
-                map_info['status'] = 1
-                map_info['mode'] = mode
-                # print(map_info)
-            else:
-                map_info = score['beatmap']
-
-            # if mode == 0:
-            beatmap_info, _, _ = await self.get_full_beatmap_info(map_info, 
-                extra_info={'play_info': score}, mods=enabled_mods,
-                force_osu_cache=True)
-            # else:
-                # beatmap_info = map_info
-
-            # print(score, beatmap_info.keys())
+            # print(score, derived)
             stats_list['rank'].append(score['rank'])
             stats_list['pp'].append(score['pp'])
             stats_list['pp_w'].append(score['pp'] * 0.95 ** score_idx)
             try:
                 stats_list['mappers'].append(score['beatmapset']['creator'])
             except:
-                stats_list['mappers'].append(map_info['creator'])
+                stats_list['mappers'].append(derived['creator'])
             mod_list = utils.num_to_mod(enabled_mods)
             if not mod_list:
                 mod_list = ['NM']
@@ -849,12 +1182,10 @@ class owoAPI(object):
             if not mod_combo_str:
                 mod_combo_str = 'NM'
             stats_list['mod_combos'].append(mod_combo_str)
-            try:
-                stats_list['stars'].append(beatmap_info['stars_mod'])
-                stats_list['aim'].append(beatmap_info['aim_stars_mod'])
-                stats_list['speed'].append(beatmap_info['speed_stars_mod'])
-            except:
-                stats_list['stars'].append(beatmap_info['difficulty_rating'])
+            stats_list['stars'].append(derived['stars'])
+            if derived['aim'] is not None:
+                stats_list['aim'].append(derived['aim'])
+                stats_list['speed'].append(derived['speed'])
 
             # accuracy
             if 'accuracy'not in score:
@@ -862,14 +1193,145 @@ class owoAPI(object):
             else:
                 play_acc = score['accuracy']
             stats_list['acc'].append(play_acc)
-            try:
-                stats_list['bpm'].append(beatmap_info['bpm_mod'])
-            except: # this is an issue lol, calc stats in get_std_data in case of fail
-                stats_list['bpm'].append(beatmap_info['bpm'])
+            stats_list['bpm'].append(derived['bpm'])
 
         return stats_list
 
 
+    async def _get_score_derived(self, scores, mode=0, api='bancho'):
+        """
+        What the no-choke and stats lists need from each score's map, in
+        order, None where the map info failed. Cached per score (beatmap, mods,
+        counts and combo), so only new or changed scores need a
+        get_full_beatmap_info.
+        """
+        identifiers = [self._score_derived_identifiers(score, mode, api)
+            for score in scores]
+        derived_list = [None] * len(scores)
+        if self.use_cache:
+            derived_list = await self.cache.score_derived.get_bulk(identifiers)
+
+        missing = [i for i, derived in enumerate(derived_list) if derived is None]
+        if not missing:
+            return derived_list
+
+        missing_scores = [scores[i] for i in missing]
+        map_infos = await self._get_score_beatmaps(
+            missing_scores, mode=mode, api=api)
+        full_map_infos = await self._get_score_full_beatmap_info(
+            missing_scores, map_infos=map_infos, mode=mode, api=api)
+
+        to_cache = []
+        for i, map_info, full_map_info in zip(missing, map_infos, full_map_infos):
+            if full_map_info is None:
+                continue
+            try:
+                derived_list[i] = self._derive_score(
+                    scores[i], map_info, *full_map_info, mode=mode)
+            except Exception as e:
+                print('Could not derive score info', e)
+                continue
+            # a failed calculation (busy workers, timeouts) is used once, not cached
+            _, bmap, _ = full_map_info
+            if mode == 0 and (bmap is None or derived_list[i]['fc_pp'] is None):
+                continue
+            to_cache.append((identifiers[i], derived_list[i]))
+
+        if to_cache and self.use_cache:
+            await self.cache.score_derived.cache_many(to_cache)
+        return derived_list
+
+
+    def _score_derived_identifiers(self, score, mode=0, api='bancho'):
+        identifiers = {
+            'beatmap_id': str(score['beatmap']['beatmap_id']),
+            'api': str(api),
+            'mode': int(mode),
+            'mods': self._get_score_mods(score),
+            'max_combo': int(score.get('max_combo') or 0)
+        }
+        for count in ['count_300', 'count_100', 'count_50', 
+            'count_miss', 'count_geki', 'count_katu']:
+            identifiers[count] = int(score.get(count) or 0)
+        return identifiers
+
+
+    def _derive_score(self, score, map_info, beatmap_info, bmap, file_path, mode=0):
+        extra_info = beatmap_info.get('extra_info', {})
+        derived = {
+            # for the cache time, like a beatmap
+            'status': beatmap_info.get('approved', beatmap_info.get('status', 0)),
+            'creator': map_info.get('creator') if map_info else None,
+            'max_combo': None,
+            'fc_pp': extra_info.get('fc_pp'),
+            'fc_acc': extra_info.get('fc_acc'),
+            'fc_rank': None,
+            'stars': beatmap_info.get('difficulty_rating'),
+            'aim': None,
+            'speed': None,
+            # this is an issue lol, calc stats in get_std_data in case of fail
+            'bpm': beatmap_info.get('bpm_mod', beatmap_info.get('bpm'))
+        }
+        if all(key in beatmap_info for key in 
+            ['stars_mod', 'aim_stars_mod', 'speed_stars_mod']):
+            derived['stars'] = beatmap_info['stars_mod']
+            derived['aim'] = beatmap_info['aim_stars_mod']
+            derived['speed'] = beatmap_info['speed_stars_mod']
+
+        # no choke, std only
+        if bmap is not None and mode == 0 and derived['fc_acc'] is not None:
+            derived['max_combo'] = int(bmap.max_combo())
+            derived['fc_rank'] = utils.calculate_rank({'count_miss': 0},
+                derived['fc_acc'], ''.join(utils.num_to_mod(self._get_score_mods(score))))
+        return derived
+
+
+    def _get_score_mods(self, score):
+        if 'enabled_mods' in score:
+            return int(score['enabled_mods'])
+        elif 'mods' in score:
+            return utils.mod_to_num(''.join(score['mods']))
+        return 0
+
+
+    async def _get_score_beatmaps(self, scores, mode=0, api='bancho'):
+        # ensure some info exists... because some don't have it?
+        if api == 'bancho':
+            return [score['beatmap'] for score in scores]
+
+        beatmap_ids = [score['beatmap']['beatmap_id'] for score in scores]
+        beatmaps = await self.get_beatmaps_bulk(beatmap_ids, api=api)
+        for map_info in beatmaps:
+            if map_info is not None:
+                map_info['status'] = 1
+                map_info['mode'] = mode
+        return beatmaps
+
+
+    async def _get_score_full_beatmap_info(self, scores, 
+        map_infos=None, mode=0, api='bancho'):
+        """get_full_beatmap_info for every score, in order, None if it failed"""
+        if map_infos is None:
+            map_infos = await self._get_score_beatmaps(scores, mode=mode, api=api)
+        semaphore = asyncio.Semaphore(self.BULK_CONCURRENCY)
+
+        async def _get_full_info(score, map_info):
+            if map_info is None:
+                return None
+            async with semaphore:
+                try:
+                    return await self.get_full_beatmap_info(map_info, 
+                        extra_info={'play_info': score}, 
+                        mods=self._get_score_mods(score),
+                        force_osu_cache=True)
+                except:
+                    return None
+
+        return await asyncio.gather(*[_get_full_info(score, map_info) 
+            for score, map_info in zip(scores, map_infos)])
+
+
+    @owoMetrics.timed
     async def get_user_recent(self, user_id, 
         mode=0, limit=50, api='bancho', use_cache=True):
         request_name = 'get_user_recent'
@@ -880,13 +1342,20 @@ class owoAPI(object):
             'api': str(api),
             'mode': int(mode)
         }
+        fetch = lambda: self._get_user_recent(identifiers,
+            user_id, mode=mode, api=api)
 
         if use_cache and self.use_cache:
-            user_recent = await self.cache.user_recent.get(identifiers)
+            user_recent = await self._get_stale(self.cache.user_recent,
+                identifiers, request_name, identifiers, fetch)
             # print('Using recent cache', user_recent)
             if user_recent is not None:
                 return user_recent
 
+        return await self.single_flight.do(request_name, identifiers, fetch)
+
+
+    async def _get_user_recent(self, identifiers, user_id, mode=0, api='bancho'):
         api_obj = self.get_api(api)
         if api == 'bancho':
             # resp = await self.official_api.get_user_recent(user_id, mode=mode)
@@ -903,10 +1372,10 @@ class owoAPI(object):
         if resp is not None:
             await self.cache.user_recent.cache(identifiers, resp)  
 
-        self.log_request(request_name, api)
         return resp
 
 
+    @owoMetrics.timed
     async def get_leaderboard(self, beatmap_id, 
         mods=None, mode=0, api='bancho', use_cache=True):
         request_name = 'get_leaderboard'
@@ -918,13 +1387,21 @@ class owoAPI(object):
             'mods': mods,
             'mode': int(mode)
         }
+        fetch = lambda: self._get_leaderboard(identifiers,
+            beatmap_id, mods=mods, mode=mode, api=api)
 
         if use_cache and self.use_cache:
-            leaderboard = await self.cache.leaderboard.get(identifiers)
+            leaderboard = await self._get_stale(self.cache.leaderboard,
+                identifiers, request_name, identifiers, fetch)
             # print('Using recent cache', user_recent)
             if leaderboard:
                 return leaderboard
 
+        return await self.single_flight.do(request_name, identifiers, fetch)
+
+
+    async def _get_leaderboard(self, identifiers, beatmap_id,
+        mods=None, mode=0, api='bancho'):
         if api == 'bancho': # use v1 for this for now
             resp = await self.official_api.get_leaderboard(beatmap_id, 
                 mods=mods, mode=mode)
@@ -937,7 +1414,6 @@ class owoAPI(object):
         if resp is not None:
             await self.cache.leaderboard.cache(identifiers, resp)  
 
-        self.log_request(request_name, api) 
         return resp
 
 
@@ -948,6 +1424,7 @@ class owoAPI(object):
 
 
     # ------------------ searching function ----------------
+    @owoMetrics.timed
     async def map_search(self, search_terms, limit=50):
         headers={'content-type': 'application/json'}
         full_query = {
@@ -960,11 +1437,9 @@ class owoAPI(object):
         }
 
         url = 'http://localhost:9200/osu/mapsearch/_search'
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=json.dumps(full_query), 
-                headers=headers) as r:
-
-                json_data = await r.json()
+        async with self.sessions.post(url, data=json.dumps(full_query), 
+            headers=headers) as r:
+            json_data = await r.json()
 
         if 'hits' not in json_data:
             return []
@@ -988,10 +1463,9 @@ class owoAPI(object):
         }
 
         url = 'http://localhost:9200/osu/mapsearch/_search'
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=json.dumps(full_query),
-                headers=headers) as r:
-                json_data = await r.json()
+        async with self.sessions.post(url, data=json.dumps(full_query),
+            headers=headers) as r:
+            json_data = await r.json()
 
         results = json_data['hits']['hits']
 
@@ -1052,10 +1526,9 @@ class owoAPI(object):
         }
         
         # resp = requests.post(url, data=json.dumps(full_query), headers=headers)
-        async with aiohttp.ClientSession() as session:
-            async with session.post(url, data=json.dumps(full_query),
-                headers=headers) as r:
-                json_data = await r.json()
+        async with self.sessions.post(url, data=json.dumps(full_query),
+            headers=headers) as r:
+            json_data = await r.json()
 
         return new_doc
 
@@ -1110,6 +1583,7 @@ class owoAPI(object):
         return api.name
 
 
+    @owoMetrics.timed
     async def get_user_avatar(self, user_id, api_name):
         rand_int = random.randint(0, 1000)
         api = self.get_api(api_name)
@@ -1212,15 +1686,25 @@ class owoAPI(object):
         return cleaned_api
 
     async def download_file(self, uri, path):
+        """returns True if the file was written"""
         print(uri)
+        api, request_name = owoMetrics.get_labels(owoSession.SessionManager.host_key(uri))
+        start_time = time.monotonic()
+        success = False
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(uri) as resp:
+        try:
+            async with owoSession.get_manager().get(uri) as resp:
                 # print(resp.status)
                 if resp.status == 200:
                     f = await aiofiles.open(path, mode='wb')
                     await f.write(await resp.read())
                     await f.close()
+                    success = True
+                    owoDisk.get_manager().add(path)
+        finally:
+            self.metrics.observe('download', api, request_name,
+                time.monotonic() - start_time, error=not success)
+        return success
 
 
 class BeatConnect:
@@ -1262,6 +1746,8 @@ class BeatConnect:
 
         if not os.path.exists(full_path):
             await self.download_file(uri, full_path)
+        else:
+            owoDisk.get_manager().touch(full_path)
 
         if not os.path.exists(full_path): # if download was unsuccessful
             # print('BMP image not downloaded.')
@@ -1292,13 +1778,13 @@ class BeatConnect:
     async def download_file(self, uri, path):
         print(uri)
 
-        async with aiohttp.ClientSession() as session:
-            async with session.get(uri) as resp:
-                # print(resp.status)
-                if resp.status == 200:
-                    f = await aiofiles.open(path, mode='wb')
-                    await f.write(await resp.read())
-                    await f.close()
+        async with owoSession.get_manager().get(uri) as resp:
+            # print(resp.status)
+            if resp.status == 200:
+                f = await aiofiles.open(path, mode='wb')
+                await f.write(await resp.read())
+                await f.close()
+                owoDisk.get_manager().add(path)
 
 
 class officialAPIv1:
@@ -1437,33 +1923,21 @@ class officialAPIv1:
         return False
 
 
-    def key_mapping(self, key_name, command=None):
-        if key_name == 'difficultyrating':
-            return 'difficulty_rating'
-        if key_name == 'diff_size':
-            return 'cs'
-        if key_name == 'diff_overall':
-            return 'od'
-        if key_name == 'diff_approach':
-            return 'ar'
-        if key_name == 'diff_drain':
-            return 'hp'
-        if key_name == 'count300':
-            return 'count_300'
-        if key_name == 'count100':
-            return 'count_100'
-        if key_name == 'count50':
-            return 'count_50'
-        if key_name == 'countmiss':
-            return 'count_miss'
-        if key_name == 'countkatu':
-            return 'count_katu'
-        if key_name == 'countgeki':
-            return 'count_geki'
-        if key_name == 'maxcombo':
-            return 'max_combo'
-        if key_name == 'approved':
-            return 'status'
+    key_mapping = KeyMap({
+        'difficultyrating': 'difficulty_rating',
+        'diff_size': 'cs',
+        'diff_overall': 'od',
+        'diff_approach': 'ar',
+        'diff_drain': 'hp',
+        'count300': 'count_300',
+        'count100': 'count_100',
+        'count50': 'count_50',
+        'countmiss': 'count_miss',
+        'countkatu': 'count_katu',
+        'countgeki': 'count_geki',
+        'maxcombo': 'max_combo',
+        'approved': 'status'
+    })
 
 
 class officialAPIv2(object):
@@ -1528,21 +2002,15 @@ class officialAPIv2(object):
         return resp
 
 
-    def _get_user_key_mapping(self, key_name, command="get_user"):
-        if key_name == "id":
-            return "user_id"
-        if key_name == "play_count":
-            return "playcount"
-        if key_name == "play_time":
-            return "total_seconds_played"
-        if key_name == "hit_accuracy":
-            return "accuracy"
-        if key_name == "maximum_combo":
-            return "max_combo"
-        if key_name == "rankHistory":
-            return "rank_history"
-        if key_name == 'pp':
-            return 'pp_raw'
+    _get_user_key_mapping = KeyMap({
+        "id": "user_id",
+        "play_count": "playcount",
+        "play_time": "total_seconds_played",
+        "hit_accuracy": "accuracy",
+        "maximum_combo": "max_combo",
+        "rankHistory": "rank_history",
+        "pp": "pp_raw"
+    })
 
 
     async def get_user_best(self, user_id, mode=0, limit=100):
@@ -1574,38 +2042,37 @@ class officialAPIv2(object):
 
 
     def fix_score_keys(self, resp):
+        # single pass per play
+        fix_user = self._get_user_key_mapping.compile()
+        fix_beatmap = self._get_beatmap_key_mapping.compile()
+        fix_beatmapset = self._get_beatmapset_key_mapping.compile()
+
         for play in resp:
             # get mod number
-            play['enabled_mods'] = utils.mod_to_num(''.join(play['mods']))
+            play['enabled_mods'] = normalize.mod_str_to_num(''.join(play['mods']))
 
             # fix date
-            play['date'] = play['created_at']
-            del play['created_at']
-            play = value_cleanup([play], 'date', self._fix_date)[0]
+            play['date'] = normalize.fix_utc_date(play.pop('created_at'))
 
             # fix accuracy
-            play = value_cleanup([play], 'accuracy', self._fix_accuracy)[0]
+            play['accuracy'] = play['accuracy'] * 100
 
             # get count hits
-            play.update(play['statistics'])
-            del play['statistics']
+            play.update(play.pop('statistics'))
 
             # format user section
-            play['user'] = key_cleanup([play['user']], 
-                self._get_user_key_mapping)[0]
+            play['user'] = fix_user(play['user'])
 
             # format beatmap section
-            play['beatmap'] = key_cleanup([play['beatmap']], 
-                self._get_beatmap_key_mapping)[0]
-            play['beatmap'] = value_cleanup([play['beatmap']], 
-                'status', self._fix_ranking_status)[0]
+            beatmap = fix_beatmap(play['beatmap'])
+            beatmap['status'] = normalize.fix_ranking_status(beatmap['status'])
+            play['beatmap'] = beatmap
 
-            play['beatmap_id'] = play['beatmap']['beatmap_id']
+            play['beatmap_id'] = beatmap['beatmap_id']
 
-            play['beatmapset'] = key_cleanup([play['beatmapset']], 
-                self._get_beatmapset_key_mapping)[0]
-            play['beatmapset'] = value_cleanup([play['beatmapset']], 
-                'status', self._fix_ranking_status)[0]
+            beatmapset = fix_beatmapset(play['beatmapset'])
+            beatmapset['status'] = normalize.fix_ranking_status(beatmapset['status'])
+            play['beatmapset'] = beatmapset
 
         return resp
 
@@ -1690,9 +2157,9 @@ class officialAPIv2(object):
         return resp
 
 
-    async def _user_activity_key_mapping(self, key_name, command="get_user_activity"):
-        if key_name == "createdAt":
-            return "date"
+    _user_activity_key_mapping = KeyMap({
+        "createdAt": "date"
+    })
 
 
     async def get_ranking(self, country=None, mode=0):
@@ -1722,40 +2189,60 @@ class officialAPIv2(object):
 
         resp = await self.fetch(uri)
 
+        return [self._clean_beatmap(resp)]
+
+
+    async def get_beatmaps_bulk(self, beatmap_ids):
+        """Up to 50 beatmaps in one request, missing ones are left out"""
+        uri_base = 'beatmaps?'
+        uri_builder = URIBuilder(uri_base)
+        for beatmap_id in beatmap_ids:
+            uri_builder.add_parameter('ids[]', beatmap_id)
+
+        uri = self.base.format(uri_builder.uri)
+
+        resp = await self.fetch(uri)
+
+        try:
+            beatmaps = resp['beatmaps']
+        except:
+            return []
+
+        return [self._clean_beatmap(beatmap) for beatmap in beatmaps]
+
+
+    def _clean_beatmap(self, resp):
         resp = key_cleanup([resp], self._get_beatmap_key_mapping)[0]  # clean up
         resp = value_cleanup([resp], 'status', self._fix_ranking_status)[0]
         resp = value_cleanup([resp], 'mode', self._fix_gamemode)[0]
 
-        resp['beatmapset'] = key_cleanup([resp['beatmapset']], self._get_beatmapset_key_mapping)[0]
-        resp['beatmapset'] = value_cleanup([resp['beatmapset']], 'status', self._fix_ranking_status)[0]
-        
-        resp.update(resp['beatmapset'])
+        if 'beatmapset' in resp:
+            resp['beatmapset'] = key_cleanup([resp['beatmapset']], self._get_beatmapset_key_mapping)[0]
+            resp['beatmapset'] = value_cleanup([resp['beatmapset']], 'status', self._fix_ranking_status)[0]
+            
+            resp.update(resp['beatmapset'])
 
-        """
-        if 'max_combo' in resp:
-            print('API v2 resp max combo!', resp['max_combo'])"""
+            """
+            if 'max_combo' in resp:
+                print('API v2 resp max combo!', resp['max_combo'])"""
 
-        del resp['beatmapset']
+            del resp['beatmapset']
 
         # fix times/dates
         for key in resp.keys():
             if 'date' in key and resp[key] is not None:
                 resp = self._fix_date(resp, key)
 
-        return [resp]
+        return resp
 
 
-    def _get_beatmap_key_mapping(self, key_name, command="get_beatmap"):
-        if key_name == "id":
-            return "beatmap_id"
-        if key_name == "accuracy":
-            return "od"
-        if key_name == "last_updated":
-            return "last_update"
-        if key_name == 'diff_drain':
-            return 'hp'
-        if key_name == 'drain':
-            return 'hp'
+    _get_beatmap_key_mapping = KeyMap({
+        "id": "beatmap_id",
+        "accuracy": "od",
+        "last_updated": "last_update",
+        "diff_drain": "hp",
+        "drain": "hp"
+    })
 
 
     async def get_beatmapset(self, beatmapset_id):
@@ -1795,15 +2282,12 @@ class officialAPIv2(object):
         return beatmap_list
 
 
-    def _get_beatmapset_key_mapping(self, key_name, command="get_beatmapset"):
-        if key_name == "play_count":
-            return "playcount"
-        if key_name == "submitted_date":
-            return "submit_date"
-        if key_name == 'diff_drain':
-            return 'hp'
-        if key_name == 'drain':
-            return 'hp'
+    _get_beatmapset_key_mapping = KeyMap({
+        "play_count": "playcount",
+        "submitted_date": "submit_date",
+        "diff_drain": "hp",
+        "drain": "hp"
+    })
 
 
     def download_beatmapset(self, beatmapset_id):
@@ -1853,40 +2337,19 @@ class officialAPIv2(object):
 
 
     def _fix_ranking_status(self, resp, key_name):
-        if resp[key_name] == 'graveyard':
-            resp[key_name] = -2
-        elif resp[key_name] == 'WIP':
-            resp[key_name] = -1
-        elif resp[key_name] == 'pending':
-            resp[key_name] = 0
-        elif resp[key_name] == 'ranked':
-            resp[key_name] = 1
-        elif resp[key_name] == 'approved':
-            resp[key_name] = 2
-        elif resp[key_name] == 'qualified':
-            resp[key_name] = 3
-        elif resp[key_name] == 'loved':
-            resp[key_name] = 4
+        resp[key_name] = normalize.fix_ranking_status(resp[key_name])
 
         return resp
 
 
     def _fix_gamemode(self, resp, key_name):
-        if resp[key_name] == 'osu':
-            resp[key_name] = 0
-        elif resp[key_name] == 'taiko':
-            resp[key_name] = 1
-        elif resp[key_name] == 'fruits':
-            resp[key_name] = 2
-        elif resp[key_name] == 'mania':
-            resp[key_name] = 3
+        resp[key_name] = normalize.fix_gamemode(resp[key_name])
 
         return resp
 
 
     def _fix_date(self, resp, key_name):
-        dt_obj = datetime.datetime.strptime(resp[key_name], '%Y-%m-%dT%H:%M:%S+00:00')
-        resp[key_name] = dt_obj.strftime('%Y-%m-%d %H:%M:%S')
+        resp[key_name] = normalize.fix_utc_date(resp[key_name])
 
         return resp
 
@@ -1939,10 +2402,9 @@ class officialAPIv2(object):
         }
         # print(headers)
 
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.get(uri) as resp:
-                json_body = await resp.json()
-                return json_body
+        async with owoSession.get_manager().get(uri, headers=headers) as resp:
+            json_body = await resp.json(loads=normalize.json_loads)
+            return json_body
 
 
     async def post(self, uri, body={}, get_token=False):
@@ -1962,14 +2424,13 @@ class officialAPIv2(object):
                   'Content-Type': 'application/json',
             }
 
-        async with aiohttp.ClientSession(headers=headers) as session:
-            async with session.post(uri, json=body) as resp:
-                json_body = await resp.json()
-                return json_body        
+        async with owoSession.get_manager().post(
+            uri, json=body, headers=headers) as resp:
+            json_body = await resp.json(loads=normalize.json_loads)
+            return json_body        
 
 
-    def key_mapping(self, key_name, command=None):
-        pass
+    key_mapping = KeyMap({})
 
 
     def mode_to_str(self, mode):
@@ -2187,41 +2648,27 @@ class gatariAPI():
         return False
 
 
-    def key_mapping(self, key_name, command=None):
-        if key_name == "a_count":
-            return "count_rank_a"
-        if key_name == "s_count":
-            return "count_rank_s"
-        if key_name == "sh_count":
-            return "count_rank_sh"
-        if key_name == "x_count":
-            return "count_rank_ss"
-        if key_name == "xh_count":
-            return "count_rank_ssh"
-        if key_name == "count_gekis":
-            return "count_geki"
-        if key_name == "avg_accuracy":
-            return "accuracy"
-        if key_name == "id":
-            return "user_id"
-        if key_name == "playtime":
-            return "total_seconds_played"
-        if key_name == "pp" and command == "get_user":
-            return "pp_raw"
-        if key_name == "rank" and command not in ['get_scores']:
-            return "pp_rank"
-        if key_name == "country_rank":
-            return "pp_country_rank"
-        if key_name == "difficulty":
-            return "difficulty_rating"
-        if key_name == "userid":
-            return "user_id"
-        if key_name == "mods":
-            return "enabled_mods"
-        if key_name == "ranking":
-            return "rank"
-        if key_name == "time":
-            return "date"
+    key_mapping = KeyMap({
+        "a_count": "count_rank_a",
+        "s_count": "count_rank_s",
+        "sh_count": "count_rank_sh",
+        "x_count": "count_rank_ss",
+        "xh_count": "count_rank_ssh",
+        "count_gekis": "count_geki",
+        "avg_accuracy": "accuracy",
+        "id": "user_id",
+        "playtime": "total_seconds_played",
+        "rank": "pp_rank",
+        "country_rank": "pp_country_rank",
+        "difficulty": "difficulty_rating",
+        "userid": "user_id",
+        "mods": "enabled_mods",
+        "ranking": "rank",
+        "time": "date"
+    }, commands={
+        "get_user": {"pp": "pp_raw"},
+        "get_scores": {"rank": None}
+    })
 
 
 class rippleAPI():
@@ -2416,7 +2863,7 @@ class rippleAPI():
             dt_obj += datetime.timedelta(hours=1) # because of +1
         else:
             # print('API +0 Time (Z)')
-            dt_obj = datetime.datetime.strptime(date_time_str, '%Y-%m-%dT%H:%M:%SZ')        
+            return normalize.fix_utc_date(date_time_str, '%Y-%m-%dT%H:%M:%SZ')
         
         # dt_obj = datetime.datetime.fromisoformat(date_time_str) # for python 3.7+
         return dt_obj.strftime('%Y-%m-%d %H:%M:%S')
@@ -2485,34 +2932,23 @@ class rippleAPI():
         return False
 
 
-    def key_mapping(self, key_name, command=None):
-        if key_name == "global_leaderboard_rank":
-            return "pp_rank"
-        if key_name == "country_leaderboard_rank":
-            return "pp_country_rank"
-        if key_name == "pp" and command == "get_user":
-            return "pp_raw"
-        if key_name == "id" and command == "get_user":
-            return "user_id"
-        if key_name == "mods" and (
-            command in ["get_user_best", "get_user_recent", "get_scores"]):
-            return "enabled_mods"
-        if key_name == "time":
-            return "date"
-        if key_name == "play_mode":
-            return "mode"
-        if key_name == "difficultyrating":
-            return "difficulty_rating"
-        if key_name == 'diff_overall':
-            return "od"
-        if key_name == 'diff_approach':
-            return "ar"
-        if key_name == 'diff_drain':
-            return "hp"
-        if key_name == 'diff_size':
-            return "cs"
-        if key_name == "approved":
-            return "status"
+    key_mapping = KeyMap({
+        "global_leaderboard_rank": "pp_rank",
+        "country_leaderboard_rank": "pp_country_rank",
+        "time": "date",
+        "play_mode": "mode",
+        "difficultyrating": "difficulty_rating",
+        "diff_overall": "od",
+        "diff_approach": "ar",
+        "diff_drain": "hp",
+        "diff_size": "cs",
+        "approved": "status"
+    }, commands={
+        "get_user": {"pp": "pp_raw", "id": "user_id"},
+        "get_user_best": {"mods": "enabled_mods"},
+        "get_user_recent": {"mods": "enabled_mods"},
+        "get_scores": {"mods": "enabled_mods"}
+    })
 
 
 class rippleAPIpeppy(officialAPIv1):
@@ -3277,12 +3713,10 @@ class droidAPI():
         return resp
 
 
-    def key_mapping(self, key_name, command=None):
-        if key_name == "mark":
-            return "rank"
-        if key_name == "combo":
-            return "max_combo"   
-        return key_name
+    key_mapping = KeyMap({
+        "mark": "rank",
+        "combo": "max_combo"
+    })
 
 
     def convert_droid_mods(self, droid_mods):
@@ -3345,45 +3779,21 @@ class URIBuilder:
             self.uri += '&' + str(key) + '=' + str(value)
 
 
-def key_cleanup(obj_list, key_mapping, command=None):
-    new_obj_list = []
-
-    for sub_obj in obj_list:
-        new_sub_obj = {}
-        for obj_key in sub_obj.keys():
-            new_key = key_mapping(obj_key, command=command)
-            if new_key:
-                new_sub_obj[new_key] = sub_obj[obj_key]
-            else:
-                new_sub_obj[obj_key] = sub_obj[obj_key]
-        new_obj_list.append(new_sub_obj)
-
-    return new_obj_list
-
-
-def value_cleanup(obj_list, key_name, value_mapping):
-    for idx, sub_obj in enumerate(obj_list):
-        obj_list[idx] = value_mapping(sub_obj, key_name)
-
-    return obj_list
-
-
 async def fetch(uri, session=None, timeout=20):
     print(uri)
     timeout = aiohttp.ClientTimeout(total=timeout)
     if not session:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(uri, timeout=timeout) as resp:
-                try:
-                    api_resp = await resp.json()
-                except:
-                    api_resp = await resp.text()
+        async with owoSession.get_manager().get(uri, timeout=timeout) as resp:
+            try:
+                api_resp = await resp.json(loads=normalize.json_loads)
+            except:
+                api_resp = await resp.text()
 
-                return api_resp
+            return api_resp
     else:
         async with session.get(uri, timeout=timeout) as resp:
             try:
-                api_resp = await resp.json()
+                api_resp = await resp.json(loads=normalize.json_loads)
             except:
                 api_resp = await resp.text()
             return api_resp
@@ -1,13 +1,23 @@
 import os
+import sys
 import time
 import copy
-import pickle as pkl
+import json
+import zlib
+import asyncio
+import hashlib
+import datetime
+import collections
 import motor.motor_asyncio
-from cogs.osu.osu_utils import map_utils
+from pymongo import ReplaceOne
+from cogs.osu.osu_utils import map_utils, owoMetrics, owoDisk, parsed_beatmap, difficulty_table
+from cogs.osu.osu_utils import owoCompute
+from cogs.osu.osu_utils.normalize import json_loads
 
 class owoCache(object):
 
-    def __init__(self, database):
+    def __init__(self, database, stale_times=None, memory_limits=None,
+        keep_times=None, write_behind=None, negative_times=None, compression=None):
         # cache basepath
         self.cache_folderpath = os.path.join('cogs', 'osu', 'cache')
         self.beatmap_parsed_folderpath = os.path.join(
@@ -23,6 +33,10 @@ class owoCache(object):
         self.beatmapset = CacheBeatmap(database, 'cached_beatmapset')
         self.beatmap_chunks = CacheBeatmap(database, 'cached_beatmap_chunks')
         self.beatmap_osu_file = CacheBeatmap(database, 'cached_beatmap_osu_file')
+        # fc pp/acc/rank, stars and bpm with mods per score, see owoAPI._get_score_derived
+        self.score_derived = CacheBeatmap(database, 'cached_score_derived')
+        # difficulty tables by .osu md5, precomputed by other_scripts/bulk_difficulty.py
+        self.beatmap_difficulty = database['beatmap_difficulty']
 
         self.leaderboard = Cache(database, 'cached_beatmap_leaderboard', 5*60)
         self.user = Cache(database, 'cached_user', 5*60) # 2*60
@@ -33,6 +47,143 @@ class owoCache(object):
         self.user_stats = Cache(database, 'cached_user_stats', 7*24*60) # 1 * 60
         self.user_score = Cache(database, 'cached_user_score', 5*60) # 5 * 60
 
+        # how long past expiry an entry can still be served while it refreshes
+        self.stale_times = {
+            'cached_user': 60*60,
+            'cached_beatmap_leaderboard': 30*60,
+            'cached_user_recent': 2*60,
+        }
+        self.stale_times.update(stale_times or {})
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache):
+                cache.stale_time = self.stale_times.get(cache.name, 0)
+
+        # in-process lru in front of the busiest collections
+        self.memory_limits = {
+            'cached_beatmap': {'max_entries': 5000, 'max_bytes': 32*1024**2},
+            'cached_beatmapset': {'max_entries': 2000, 'max_bytes': 32*1024**2},
+            'cached_beatmap_chunks': {'max_entries': 1000, 'max_bytes': 64*1024**2},
+            'cached_user': {'max_entries': 2000, 'max_bytes': 16*1024**2},
+            'cached_beatmap_leaderboard': {'max_entries': 500, 'max_bytes': 16*1024**2},
+        }
+        for name, limits in (memory_limits or {}).items():
+            self.memory_limits.setdefault(name, {}).update(limits)
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache) and cache.name in self.memory_limits:
+                cache.memory = LRUTier(**self.memory_limits[cache.name])
+
+        # payloads above the threshold (bytes of json) are stored compressed
+        compression = dict(compression or {})
+        self.compress_thresholds = {
+            'cached_user_best': 8*1024,
+            'cached_user_nc_best': 8*1024,
+            'cached_user_stats': 8*1024,
+            'cached_beatmap_chunks': 8*1024,
+        }
+        self.compress_thresholds.update(compression.get('collections', {}))
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache):
+                cache.compress_threshold = self.compress_thresholds.get(cache.name)
+                cache.compress_level = compression.get('level', 6)
+
+        # how long "doesn't exist" answers are remembered
+        self.negative_times = {
+            'cached_user': 10*60,
+            'cached_beatmap': 30*60,
+            'cached_user_score': 5*60,
+        }
+        self.negative_times.update(negative_times or {})
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache):
+                cache.negative_time = self.negative_times.get(cache.name)
+
+        # how long past expiry mongo keeps an entry before the ttl index drops
+        # it (force reads, user stats and the server leaderboards use old ones)
+        self.keep_times = {
+            'default': 24*3600,
+            'cached_user': 30*24*3600,
+            'cached_user_stats': 30*24*3600,
+        }
+        self.keep_times.update(keep_times or {})
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache):
+                cache.keep_time = self.keep_times.get(
+                    cache.name, self.keep_times['default'])
+
+        # lookups by something other than the full identifiers (_id covers those)
+        self.beatmap.indexes = [
+            [('beatmap_id', 1), ('api', 1), ('mods', 1)]]
+        self.beatmapset.indexes = [
+            [('beatmapset_id', 1), ('api', 1)]]
+        self.user.indexes = [
+            [('data.user_id', 1), ('api', 1), ('mode', 1)],
+            [('data.username', 1), ('api', 1)]]
+
+        asyncio.get_event_loop().create_task(self.create_indexes())
+
+        # opt-in queued writes, flushed in batches
+        write_behind = dict(write_behind or {})
+        if write_behind.pop('enabled', False):
+            names = write_behind.pop('collections', None)
+            for cache in self.__dict__.values():
+                if isinstance(cache, Cache) and (names is None or cache.name in names):
+                    cache.write_behind = WriteBehind(cache, **write_behind)
+
+
+    async def create_indexes(self):
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache):
+                try:
+                    await cache.create_indexes()
+                except Exception as e:
+                    print('Could not create indexes for {}: {}'.format(cache.name, e))
+
+
+    async def close(self):
+        """flushes anything still queued for write-behind"""
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache) and cache.write_behind is not None:
+                await cache.write_behind.close()
+
+
+    def get_write_behind_stats(self):
+        stats = {}
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache) and cache.write_behind is not None:
+                stats[cache.name] = cache.write_behind.get_stats()
+        return stats
+
+
+    def get_compression_stats(self):
+        """what compressed writes saved since startup, by collection"""
+        stats = {}
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache) and cache.compress_threshold is not None:
+                stats[cache.name] = cache.get_compression_stats()
+        return stats
+
+
+    async def get_stored_difficulty(self, md5):
+        """difficulty table from the bulk run for an .osu md5, None if missing or old"""
+        if not md5:
+            return None
+        try:
+            doc = await self.beatmap_difficulty.find_one({'_id': str(md5).lower()})
+        except Exception as e:
+            print('Could not read stored difficulty:', e)
+            return None
+        if not doc or doc['table'].get('version') != difficulty_table.VERSION:
+            return None
+        return doc['table']
+
+
+    def get_memory_stats(self):
+        stats = {}
+        for cache in self.__dict__.values():
+            if isinstance(cache, Cache) and cache.memory is not None:
+                stats[cache.name] = cache.memory.get_stats()
+        return stats
+
 
     def create_folders(self):
         folders = [
@@ -45,26 +196,323 @@ class owoCache(object):
                 os.makedirs(folder)
 
 
+# ----- compressed payloads -----
+# codec -> (compress(bytes, level), decompress(bytes)), documents are tagged
+# with the codec and PAYLOAD_VERSION (1 = json text)
+CODECS = {
+    'zlib': (zlib.compress, zlib.decompress),
+}
+PAYLOAD_VERSION = 1
+
+
+def encode_payload(data, codec='zlib', level=6):
+    """(raw size, compressed bytes), None when data isn't plain json"""
+    try:
+        raw = json.dumps(data, separators=(',', ':')).encode('utf-8')
+    except (TypeError, ValueError): # datetimes and such stay as bson
+        return None
+    compress, _ = CODECS[codec]
+    return len(raw), compress(raw, level)
+
+
+def decode_payload(doc):
+    """puts the decompressed payload of a document back in data"""
+    if 'payload' not in doc:
+        return doc
+    if doc.get('payload_version') != PAYLOAD_VERSION or doc.get('codec') not in CODECS:
+        raise ValueError('unknown payload {} v{}'.format(
+            doc.get('codec'), doc.get('payload_version')))
+    _, decompress = CODECS[doc['codec']]
+    doc['data'] = json_loads(decompress(bytes(doc['payload'])))
+    for key in ['payload', 'codec', 'payload_version', 'raw_size']:
+        doc.pop(key, None)
+    return doc
+
+
+class _Negative:
+    """cached answer that upstream has nothing for the identifiers"""
+    def __bool__(self):
+        return False
+
+    def __repr__(self):
+        return 'NEGATIVE'
+
+NEGATIVE = _Negative()
+
+
+def identifiers_key(name, identifiers):
+    """Hashable key for a request name and its cache identifiers"""
+    return (name,) + tuple(sorted(
+        (str(key), str(value)) for key, value in identifiers.items()))
+
+
+def cache_id(identifiers):
+    """Deterministic document _id for a set of cache identifiers"""
+    canonical = '&'.join('{}={}'.format(key, value)
+        for key, value in identifiers_key('', identifiers)[1:])
+    return hashlib.sha1(canonical.encode('utf-8')).hexdigest()
+
+
+def approx_size(obj):
+    """rough in-memory size of a decoded mongo document"""
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        for key, value in obj.items():
+            size += sys.getsizeof(key) + approx_size(value)
+    elif isinstance(obj, (list, tuple)):
+        for value in obj:
+            size += approx_size(value)
+    return size
+
+
+class LRUTier:
+    """
+    Recently read cache documents, bounded by entry count and approximate
+    bytes. Entries are dropped after `max_age` seconds so other shards'
+    writes to mongo are picked up.
+    """
+    def __init__(self, max_entries=1000, max_bytes=16*1024**2, max_age=300):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.entries = collections.OrderedDict() # key -> (doc, size, stored time)
+        self.bytes = 0
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key, valid=None):
+        """a copy of the document, None (a miss) if it's missing, too old or not valid(doc)"""
+        entry = self.entries.get(key)
+        if entry is None or time.time() - entry[2] > self.max_age or \
+            (valid is not None and not valid(entry[0])):
+            if entry is not None:
+                self._remove(key)
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return copy.deepcopy(entry[0]) # callers modify what they get back
+
+    def put(self, key, doc):
+        size = approx_size(doc)
+        if size > self.max_bytes:
+            return
+        if key in self.entries:
+            self._remove(key)
+        self.entries[key] = (copy.deepcopy(doc), size, time.time())
+        self.bytes += size
+        while len(self.entries) > self.max_entries or self.bytes > self.max_bytes:
+            oldest_key = next(iter(self.entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, key):
+        if key in self.entries:
+            self._remove(key)
+            self.invalidations += 1
+
+    def _remove(self, key):
+        doc, size, _ = self.entries.pop(key)
+        self.bytes -= size
+
+    def get_stats(self):
+        return {
+            'entries': len(self.entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'invalidations': self.invalidations
+        }
+
+
+class WriteBehind:
+    """
+    Queued cache writes for one collection. Writes to the same _id coalesce,
+    and the queue goes to mongo as one unordered bulk_write every
+    `flush_interval` seconds or once `max_batch` documents are waiting.
+    Past `max_pending` documents, writers wait for a flush (backpressure).
+    """
+    def __init__(self, cache, flush_interval=0.25, max_batch=500, max_pending=5000):
+        self.cache = cache
+        self.flush_interval = flush_interval
+        self.max_batch = max_batch
+        self.max_pending = max_pending
+        self.pending = collections.OrderedDict() # _id -> document
+        self.in_flight = {} # _id -> document, popped but not written yet
+        self.lock = asyncio.Lock()
+        self.task = None
+
+        self.writes = 0
+        self.coalesced = 0
+        self.flushes = 0
+        self.flushed = 0
+        self.waits = 0
+        self.errors = 0
+
+    async def put(self, doc):
+        doc_id = doc['_id']
+        self.writes += 1
+        if doc_id in self.pending:
+            self.coalesced += 1
+            del self.pending[doc_id] # newest write goes to the back
+        elif len(self.pending) >= self.max_pending:
+            self.waits += 1
+            await self.flush()
+        self.pending[doc_id] = doc
+
+        if len(self.pending) >= self.max_batch:
+            await self.flush()
+        elif self.task is None or self.task.done():
+            self.task = asyncio.ensure_future(self._flush_later())
+
+    def get(self, doc_id):
+        """a queued document, so reads see writes that haven't flushed yet"""
+        doc = self.pending.get(doc_id)
+        if doc is None: # mongo may still have the old one until the write is done
+            doc = self.in_flight.get(doc_id)
+        if doc is not None:
+            return copy.deepcopy(doc)
+        return None
+
+    async def _flush_later(self):
+        await asyncio.sleep(self.flush_interval)
+        await self.flush()
+
+    async def flush(self):
+        async with self.lock:
+            while self.pending:
+                batch = []
+                while self.pending and len(batch) < self.max_batch:
+                    batch.append(self.pending.popitem(last=False)[1])
+                self.in_flight.update((doc['_id'], doc) for doc in batch)
+                try:
+                    await self._write(batch)
+                finally:
+                    for doc in batch:
+                        if self.in_flight.get(doc['_id']) is doc:
+                            del self.in_flight[doc['_id']]
+
+    async def _write(self, batch):
+        start_time = time.monotonic()
+        error = False
+        try:
+            await self.cache.entries.bulk_write([ReplaceOne(
+                {'_id': doc['_id']}, doc, upsert=True) for doc in batch], ordered=False)
+            self.flushed += len(batch)
+        except Exception as e: # it's only cache, drop the batch
+            error = True
+            self.errors += 1
+            print('Write-behind flush to {} failed: {}'.format(self.cache.name, e))
+        self.flushes += 1
+        owoMetrics.get_metrics().observe('cache', self.cache.name,
+            'flush', time.monotonic() - start_time, error=error)
+
+    async def close(self):
+        await self.flush() # waits for a flush already writing
+        if self.task is not None and not self.task.done():
+            self.task.cancel()
+
+    def get_stats(self):
+        return {
+            'pending': len(self.pending),
+            'in_flight': len(self.in_flight),
+            'writes': self.writes,
+            'coalesced': self.coalesced,
+            'flushes': self.flushes,
+            'flushed': self.flushed,
+            'waits': self.waits,
+            'errors': self.errors
+        }
+
+
+class SingleFlight:
+    """
+    Coalesces identical concurrent lookups so only one of them goes upstream,
+    the rest await the same in-flight task.
+    """
+    def __init__(self):
+        self.in_flight = {}
+        self.calls = {}
+        self.deduplicated = {}
+
+    async def do(self, name, identifiers, coro_func):
+        key = identifiers_key(name, identifiers)
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+        task = self.in_flight.get(key)
+        joined = task is not None
+        if joined:
+            self.deduplicated[name] = self.deduplicated.get(name, 0) + 1
+        else:
+            # run as its own task so a cancelled caller doesn't take the others down
+            task = asyncio.ensure_future(coro_func())
+            self.in_flight[key] = task
+            task.add_done_callback(
+                lambda done_task: self._finish(key, done_task))
+
+        # callers tend to modify what they get back, the first one included
+        # (it resumes before the others), so nobody gets the shared result
+        return copy.deepcopy(await asyncio.shield(task))
+
+    def _finish(self, key, task):
+        if self.in_flight.get(key) is task:
+            del self.in_flight[key]
+        if not task.cancelled():
+            task.exception() # mark as retrieved
+
+    def is_in_flight(self, name, identifiers):
+        return identifiers_key(name, identifiers) in self.in_flight
+
+    def get_stats(self):
+        stats = {}
+        for name in self.calls:
+            stats[name] = {
+                'calls': self.calls[name],
+                'deduplicated': self.deduplicated.get(name, 0),
+                'in_flight': sum(1 for key in self.in_flight if key[0] == name)
+            }
+        return stats
+
+
 class Cache:
     def __init__(self, database, name, time):
         self.database = database
         self.name = name
         self.entries = self.database[self.name]
         self.time = time # in sections to expire
-
-    async def get(self, query, force=False, include_time=False):
+        self.stale_time = 0 # servable past expiry while refreshing, see get_stale
+        self.keep_time = 24*3600 # kept in mongo past expiry, see expires_at
+        self.negative_time = None # ttl of negative entries, None doesn't store them
+        self.compress_threshold = None # bytes of json, None stores data as is
+        self.compress_level = 6
+        self.compressed_writes = 0
+        self.raw_bytes = 0
+        self.stored_bytes = 0
+        self.memory = None # optional LRUTier
+        self.indexes = [] # extra compound indexes, lists of (field, direction)
+        self.write_behind = None # optional WriteBehind
+
+    async def create_indexes(self):
+        # expireAfterSeconds=0 drops each document at its own expires_at
+        await self.entries.create_index('expires_at', expireAfterSeconds=0)
+        for keys in self.indexes:
+            await self.entries.create_index(keys)
+
+    async def get(self, query, force=False, include_time=False, allow_negative=False):
+        """allow_negative returns NEGATIVE for known missing entries"""
         # await self.entries.delete_many({}) # testing
         # db_query = self._get_db_query(query)
         # print(db_query)
-        data = await self.entries.find_one(query)
+        data = await self._find_one(query, allow_negative=allow_negative and not force)
 
         if data is None:
             return self._get_none_response(force, include_time)
 
-        cache_valid = True
-        elapsed_time = time.time() - float(data['cached_date']) # seconds
-        if elapsed_time > self.time:
-            cache_valid = False
+        cache_valid = self._cache_valid(data)
 
         if force:
             if include_time:
@@ -82,6 +530,144 @@ class Cache:
         else:
             return data['data']
 
+    async def get_stale(self, query, allow_negative=False):
+        """
+        (data, fresh) for stale-while-revalidate, entries up to stale_time
+        past expiry come back with fresh=False. (None, False) if nothing usable.
+        """
+        data = await self._find_one(query, allow_negative=allow_negative)
+        if data is None:
+            return None, False
+        if self._cache_valid(data):
+            return data['data'], True
+        if self._stale_valid(data):
+            return data['data'], False
+        return None, False
+
+    async def get_many(self, key_name, values, query={}):
+        """
+        Valid entries for many values of one identifier in a single query,
+        returned as {value: data}
+        """
+        db_query = dict(query)
+        db_query[key_name] = {"$in": list(values)}
+        db_query['negative'] = {"$ne": True}
+
+        found = {}
+        async for data in self.entries.find(db_query):
+            data = self._decode(data)
+            if data is not None and self._cache_valid(data):
+                found[data[key_name]] = data['data']
+        return found
+
+    async def get_bulk(self, queries):
+        """
+        valid entries for many full identifiers in one query, in order,
+        None where there's nothing usable
+        """
+        start_time = time.monotonic()
+        doc_ids = [cache_id(query) for query in queries]
+        found = {}
+        for doc_id in doc_ids:
+            data = None
+            if self.write_behind is not None:
+                data = self._decode(self.write_behind.get(doc_id))
+            if data is None and self.memory is not None:
+                data = self.memory.get(doc_id, valid=self._cache_valid)
+            if data is not None:
+                found[doc_id] = data
+
+        missing = [doc_id for doc_id in set(doc_ids) if doc_id not in found]
+        if missing:
+            async for data in self.entries.find({'_id': {'$in': missing}}):
+                data = self._decode(data)
+                if data is not None:
+                    found[data['_id']] = data
+
+        results = []
+        for doc_id in doc_ids:
+            data = found.get(doc_id)
+            if data is None or data.get('negative') or not self._cache_valid(data):
+                results.append(None)
+            else:
+                results.append(data['data'])
+        owoMetrics.get_metrics().observe('cache', self.name,
+            'bulk', time.monotonic() - start_time)
+        return results
+
+    async def _find_one(self, query, allow_negative=False):
+        data = await self._find_doc(query)
+        if data is not None and data.get('negative'):
+            if not allow_negative:
+                return None
+            data['data'] = NEGATIVE
+        return data
+
+    async def _find_doc(self, query):
+        start_time = time.monotonic()
+        doc_id = cache_id(query)
+        if self.write_behind is not None:
+            data = self.write_behind.get(doc_id)
+            if data is not None:
+                owoMetrics.get_metrics().observe('cache', self.name,
+                    'queued', time.monotonic() - start_time)
+                return self._decode(data)
+        if self.memory is not None:
+            # only while valid, another shard may have a fresher copy in mongo
+            data = self.memory.get(doc_id, valid=self._cache_valid)
+            if data is not None:
+                owoMetrics.get_metrics().observe('cache', self.name,
+                    'memory', time.monotonic() - start_time)
+                return data
+
+        data = self._decode(await self.entries.find_one({'_id': doc_id}))
+        if data is not None and self.memory is not None:
+            self.memory.put(doc_id, data)
+
+        if data is None:
+            outcome = 'miss'
+        elif data.get('negative'):
+            outcome = 'negative' if self._cache_valid(data) else 'miss'
+        elif self._cache_valid(data):
+            outcome = 'hit'
+        elif self._stale_valid(data):
+            outcome = 'stale'
+        else:
+            outcome = 'miss'
+        owoMetrics.get_metrics().observe('cache', self.name,
+            outcome, time.monotonic() - start_time)
+        return data
+
+    def _cache_valid(self, data):
+        elapsed_time = time.time() - float(data['cached_date']) # seconds
+        return elapsed_time <= self._entry_timeout(data)
+
+    def _entry_timeout(self, data):
+        if data.get('negative'):
+            return self.negative_time or 0
+        return self._timeout(data)
+
+    def _timeout(self, data):
+        return self.time
+
+    def expires_at(self, data):
+        """when the ttl index may drop the document, None keeps it forever"""
+        if data.get('negative'): # no use for these once they've expired
+            return datetime.datetime.utcfromtimestamp(
+                float(data['cached_date']) + self._entry_timeout(data))
+        timeout = self._timeout(data)
+        if timeout is None or self.keep_time is None:
+            return None
+        seconds = float(data['cached_date']) + timeout + \
+            max(self.stale_time, self.keep_time)
+        return datetime.datetime.utcfromtimestamp(seconds)
+
+    def _stale_valid(self, data):
+        if not self.stale_time or self.time is None or data.get('negative'):
+            return False
+        elapsed_time = time.time() - float(data['cached_date']) # seconds
+        return elapsed_time <= self.time + self.stale_time
+
     def _get_none_response(self, force, include_time):
         if force:
             if include_time:
@@ -101,14 +687,99 @@ class Cache:
         cache_obj['data'] = data
 
         # print('To cache', cache_obj)
-        db_query = self._get_db_query(identifiers)
+        await self._replace(identifiers, cache_obj)
+
+    async def cache_many(self, items):
+        """(identifiers, data) pairs written as one bulk_write"""
+        cache_objs = []
+        for identifiers, data in items:
+            cache_obj = copy.deepcopy(identifiers)
+            cache_obj['cached_date'] = time.time()
+            cache_obj['data'] = data
+            self._prepare(identifiers, cache_obj)
+            cache_objs.append(cache_obj)
+        if not cache_objs:
+            return
+
+        if self.write_behind is not None:
+            for cache_obj in cache_objs:
+                await self.write_behind.put(cache_obj)
+        else:
+            await self.entries.bulk_write([ReplaceOne(
+                {'_id': cache_obj['_id']}, cache_obj, upsert=True)
+                for cache_obj in cache_objs], ordered=False)
+        for identifiers, _ in items:
+            self._invalidate(identifiers)
 
-        # print("Cached")
+    async def cache_negative(self, identifiers):
+        """
+        Remembers that upstream has nothing for the identifiers for
+        negative_time seconds. Caching real data for them replaces it.
         """
-        await self.entries.replace_one(
-            db_query, cache_obj, upsert=True)"""
-        await self.entries.update_many(
-            db_query, {"$set": cache_obj}, upsert=True)
+        if not self.negative_time:
+            return
+        cache_obj = copy.deepcopy(identifiers)
+        cache_obj['cached_date'] = time.time()
+        cache_obj['data'] = None
+        cache_obj['negative'] = True
+        await self._replace(identifiers, cache_obj)
+
+    async def _replace(self, identifiers, cache_obj):
+        self._prepare(identifiers, cache_obj)
+        if self.write_behind is not None:
+            await self.write_behind.put(cache_obj)
+        else:
+            await self.entries.replace_one(
+                {'_id': cache_obj['_id']}, cache_obj, upsert=True)
+        self._invalidate(identifiers)
+
+    def _prepare(self, identifiers, cache_obj):
+        """_id, expires_at and compression, as the document goes to mongo"""
+        cache_obj['_id'] = cache_id(identifiers)
+        expires_at = self.expires_at(cache_obj)
+        if expires_at is not None:
+            cache_obj['expires_at'] = expires_at
+        self._compress(cache_obj)
+
+    def _compress(self, cache_obj):
+        if self.compress_threshold is None or cache_obj.get('data') is None:
+            return
+        encoded = encode_payload(cache_obj['data'], level=self.compress_level)
+        if encoded is None or encoded[0] < self.compress_threshold:
+            return
+        raw_size, payload = encoded
+        cache_obj['data'] = None
+        cache_obj['payload'] = payload
+        cache_obj['codec'] = 'zlib'
+        cache_obj['payload_version'] = PAYLOAD_VERSION
+        cache_obj['raw_size'] = raw_size
+
+        self.compressed_writes += 1
+        self.raw_bytes += raw_size
+        self.stored_bytes += len(payload)
+
+    def _decode(self, doc):
+        """the document with its data decompressed, None if it can't be read"""
+        if doc is None or 'payload' not in doc:
+            return doc
+        try:
+            return decode_payload(doc)
+        except (ValueError, zlib.error) as e: # a newer version wrote it, treat as a miss
+            print('Could not decode {} entry: {}'.format(self.name, e))
+            return None
+
+    def get_compression_stats(self):
+        return {
+            'threshold': self.compress_threshold,
+            'compressed_writes': self.compressed_writes,
+            'raw_bytes': self.raw_bytes,
+            'stored_bytes': self.stored_bytes,
+            'saved_bytes': self.raw_bytes - self.stored_bytes
+        }
+
+    def _invalidate(self, identifiers):
+        if self.memory is not None:
+            self.memory.invalidate(cache_id(identifiers))
 
     def _get_db_query(self, query):
         db_query = {}
@@ -122,29 +793,14 @@ class CacheBeatmap(Cache):
     def __init__(self, database, name):
         super().__init__(database, name, None)
 
-    async def get(self, query, force=False, include_time=False):
+    async def get(self, query, force=False, include_time=False, allow_negative=False):
 
-        data = await self.entries.find_one(query)
+        data = await self._find_one(query, allow_negative=allow_negative and not force)
 
         if data is None:
             return self._get_none_response(force, include_time)
 
-        cache_valid = True
-        elapsed_time = time.time() - float(data['cached_date']) # seconds
-        if isinstance(data['data'], list):
-            if 'approved' in data['data'][0]:
-                if elapsed_time > self._beatmap_cache_timeout(data['data'][0]['approved']):
-                    cache_valid = False
-            else:
-                if elapsed_time > self._beatmap_cache_timeout(data['data'][0]['status']):
-                    cache_valid = False
-        else:
-            if 'approved' in data['data']:
-                if elapsed_time > self._beatmap_cache_timeout(data['data']['approved']):
-                    cache_valid = False     
-            else:
-                if elapsed_time > self._beatmap_cache_timeout(data['data']['status']):
-                    cache_valid = False            
+        cache_valid = self._cache_valid(data)
 
         if force:
             if include_time:
@@ -161,6 +817,18 @@ class CacheBeatmap(Cache):
         else:
             return data['data']
 
+    def _timeout(self, data):
+        if isinstance(data['data'], list):
+            beatmap = data['data'][0]
+        else:
+            beatmap = data['data']
+
+        if 'approved' in beatmap:
+            status = beatmap['approved']
+        else:
+            status = beatmap['status']
+        return self._beatmap_cache_timeout(status)
+
     def _beatmap_cache_timeout(self, status):
         status = int(self.handle_status(status))
         # return 10 # 1 second for testing
@@ -204,18 +872,16 @@ class CacheBeatmapFile(CacheBeatmap):
     def __init__(self, database, name, folderpath):
         super().__init__(database, name)
         self.folderpath = folderpath
+        self.building = set() # parsed files with a difficulty table being built
 
     async def get(self, query, force=False, include_time=False):
 
-        data = await self.entries.find_one(query)
+        data = await self._find_one(query)
 
         if data is None:
             return self._get_none_response(force, include_time)
 
-        cache_valid = True
-        elapsed_time = time.time() - float(data['cached_date']) # seconds
-        if elapsed_time > self._beatmap_cache_timeout(data['data']['status']):
-            cache_valid = False
+        cache_valid = self._cache_valid(data)
 
         if force:
             if include_time:
@@ -232,6 +898,22 @@ class CacheBeatmapFile(CacheBeatmap):
         else:
             return data['data']['filepath']
 
+    def build_difficulty(self, filepath):
+        """difficulty table sidecar for a parsed beatmap, built in the compute pool"""
+        if filepath in self.building:
+            return None
+        self.building.add(filepath)
+        future = asyncio.ensure_future(owoCompute.get_service().difficulty_table(filepath))
+        future.add_done_callback(lambda done: self._built(filepath, done))
+        return future
+
+    def _built(self, filepath, future):
+        self.building.discard(filepath)
+        if not future.cancelled() and future.exception() is not None:
+            # busy or timed out, the next load of the map tries again
+            print('Difficulty table not built for {}: {!r}'.format(
+                filepath, future.exception()))
+
     async def cache(self, identifiers, data, beatmap_info):
         # print('Caching Beatmap File')
         beatmap_id = str(beatmap_info['beatmap_id'])
@@ -243,17 +925,20 @@ class CacheBeatmapFile(CacheBeatmap):
         except:
             cache_obj['data']['status'] = 1 # default to 1 cause i don't care
         cache_obj['data']['filepath'] = os.path.join(
-            self.folderpath, '{}.pkl'.format(beatmap_id))
+            self.folderpath, '{}{}'.format(beatmap_id, parsed_beatmap.EXTENSION))
 
         # print('Caching Time', time.time())
 
-        with open(cache_obj['data']['filepath'], 'wb') as pickle_file:
-            pkl.dump(data, pickle_file)
+        # the old version's table would be served until the new one is built
+        sidecar_filepath = difficulty_table.sidecar_path(cache_obj['data']['filepath'])
+        if os.path.exists(sidecar_filepath):
+            os.remove(sidecar_filepath)
+        parsed_beatmap.dump(data, cache_obj['data']['filepath'])
+        owoDisk.get_manager().add(cache_obj['data']['filepath'])
+        self.build_difficulty(cache_obj['data']['filepath'])
+        legacy_filepath = os.path.join(self.folderpath, '{}.pkl'.format(beatmap_id))
+        if os.path.exists(legacy_filepath):
+            os.remove(legacy_filepath)
 
         # print('To cache', cache_obj)
-        db_query = self._get_db_query(identifiers)
-        """
-        await self.entries.replace_one(
-            db_query, cache_obj, upsert=True)"""
-        await self.entries.update_many(
-            db_query, {"$set": cache_obj}, upsert=True)
\ No newline at end of file
+        await self._replace(identifiers, cache_obj)
\ No newline at end of file
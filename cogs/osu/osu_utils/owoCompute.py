@@ -0,0 +1,266 @@
+import os
+import time
+import asyncio
+import multiprocessing
+import concurrent.futures
+from concurrent.futures.process import BrokenProcessPool
+
+import pyttanko
+from cogs.osu.osu_utils import owoMetrics, parsed_beatmap, droid_pyttanko, droid_strain, strain_graph
+from cogs.osu.osu_utils import osu_file, difficulty_table
+
+
+class ComputeBusy(Exception):
+    """the submission queue is full, the job wasn't run"""
+    pass
+
+
+# ----- jobs, these run in the worker processes -----
+def _warm_worker():
+    # workers don't fork from the bot, they import this module (and the
+    # calculators with it) to unpickle the initializer. this touches the
+    # calculators once so the first real job doesn't pay for it
+    pyttanko.diff_calc()
+    droid_strain.diff_calc()
+
+
+def _ping():
+    return os.getpid()
+
+
+def parse_job(filepath):
+    """.osu file -> ParsedBeatmap (arrays pickle cheaply back to the bot)"""
+    bmap = osu_file.parse(filepath)
+    return parsed_beatmap.ParsedBeatmap.from_pyttanko(bmap)
+
+
+def diff_calc_job(source, mods, kind='std'):
+    """(total, aim, speed) from a parsed beatmap file path or a ParsedBeatmap"""
+    if isinstance(source, str):
+        source = parsed_beatmap.load_parsed(source)
+    if kind == 'droid':
+        bmap = source.to_pyttanko(droid_pyttanko)
+        stars = droid_strain.diff_calc().calc(bmap, mods=mods)
+    else:
+        bmap = source.to_pyttanko(pyttanko)
+        stars = pyttanko.diff_calc().calc(bmap, mods=mods)
+    return float(stars.total), float(stars.aim), float(stars.speed)
+
+
+def chunks_job(filepath, mods):
+    """star graph for the .osu file, [{'time', 'stars', 'aim_stars', 'speed_stars'}]"""
+    return strain_graph.chunks(filepath, mods=mods)
+
+
+class ComputeService:
+    """
+    Parsing and difficulty work in a process pool, so a marathon map doesn't
+    hold up the event loop. At most max_workers jobs are handed to the pool
+    at once and up to max_queue more wait for a worker, past that ComputeBusy
+    is raised. Jobs time out (asyncio.TimeoutError) after `timeout` seconds,
+    including the wait; a job that already started keeps its worker until it
+    finishes. Queue and compute times go to metrics as ('compute', job, 'queue'|'run').
+    """
+    def __init__(self, max_workers=2, max_queue=32, timeout=30):
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.timeout = timeout
+        self.executor = None
+        self.slots = None
+        self.waiting = 0
+        self.running = 0
+
+        self.submitted = 0
+        self.completed = 0
+        self.errors = 0
+        self.timeouts = 0
+        self.cancelled = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build from the settings.osu.compute block of config.json"""
+        settings = settings or {}
+        return cls(max_workers=settings.get('max_workers', 2),
+            max_queue=settings.get('max_queue', 32),
+            timeout=settings.get('timeout', 30))
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = concurrent.futures.ProcessPoolExecutor(
+                max_workers=self.max_workers, mp_context=_mp_context(),
+                initializer=_warm_worker)
+        return self.executor
+
+    def _get_slots(self):
+        if self.slots is None:
+            self.slots = asyncio.Semaphore(self.max_workers)
+        return self.slots
+
+    def _release(self):
+        self.running -= 1
+        self.slots.release()
+
+    async def start(self):
+        """starts every worker now instead of on the first map"""
+        await asyncio.gather(*[self.run(_ping, name='ping')
+            for _ in range(self.max_workers)], return_exceptions=True)
+
+    async def run(self, func, *args, name=None, timeout=None):
+        """func(*args) in a worker, func and args need to be picklable"""
+        name = name or func.__name__
+        slots = self._get_slots()
+        if slots.locked() and self.waiting >= self.max_queue:
+            self.rejected += 1
+            raise ComputeBusy('{} jobs already waiting'.format(self.waiting))
+
+        loop = asyncio.get_event_loop()
+        metrics = owoMetrics.get_metrics()
+        timeout = self.timeout if timeout is None else timeout
+        deadline = loop.time() + timeout
+
+        # wait for a worker, only jobs that can't have one now count as waiting
+        start_time = time.monotonic()
+        if not slots.locked():
+            await slots.acquire() # free slot, doesn't block
+        else:
+            self.waiting += 1
+            try:
+                await asyncio.wait_for(slots.acquire(), timeout)
+            except asyncio.TimeoutError:
+                self.timeouts += 1
+                metrics.observe('compute', name, 'queue',
+                    time.monotonic() - start_time, error=True)
+                raise
+            finally:
+                self.waiting -= 1
+        metrics.observe('compute', name, 'queue', time.monotonic() - start_time)
+
+        # the slot is given back when the job is really done, not when we stop waiting
+        self.running += 1
+        self.submitted += 1
+        try:
+            future = self._submit(func, args)
+        except Exception:
+            self.errors += 1
+            self._release()
+            raise
+        future.add_done_callback(
+            lambda _: loop.call_soon_threadsafe(self._release))
+
+        start_time = time.monotonic()
+        error = False
+        try:
+            result = await asyncio.wait_for(asyncio.wrap_future(future),
+                max(0.0, deadline - loop.time()))
+            self.completed += 1
+            return result
+        except asyncio.TimeoutError:
+            error = True
+            self.timeouts += 1
+            future.cancel()
+            raise
+        except asyncio.CancelledError:
+            self.cancelled += 1
+            future.cancel()
+            raise
+        except BrokenProcessPool: # a worker died (killed, out of memory)
+            error = True
+            self.errors += 1
+            self._restart()
+            raise
+        except Exception:
+            error = True
+            self.errors += 1
+            raise
+        finally:
+            metrics.observe('compute', name, 'run',
+                time.monotonic() - start_time, error=error)
+
+    def _submit(self, func, args):
+        try:
+            return self._get_executor().submit(func, *args)
+        except BrokenProcessPool: # pool died since the last job, start a new one
+            self._restart()
+            return self._get_executor().submit(func, *args)
+
+    def _restart(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+            self.restarts += 1
+
+    # ----- jobs -----
+    async def parse(self, filepath):
+        return await self.run(parse_job, filepath, name='parse')
+
+    async def diff_calc(self, bmap, mods, kind='std'):
+        """Stars for a beatmap, sent as its parsed file if it has one"""
+        source = getattr(bmap, 'parsed_filepath', None) or \
+            parsed_beatmap.ParsedBeatmap.from_pyttanko(bmap)
+        total, aim, speed = await self.run(diff_calc_job, source, mods, kind,
+            name='diff_calc_{}'.format(kind))
+        return difficulty_table.Stars(total, aim, speed)
+
+    async def chunks(self, filepath, mods=0):
+        return await self.run(chunks_job, filepath, mods, name='chunks')
+
+    async def difficulty_table(self, parsed_filepath):
+        """builds and writes the difficulty table sidecar, the table or None"""
+        return await self.run(difficulty_table.build, parsed_filepath,
+            name='difficulty_table')
+
+    async def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+
+    def get_stats(self):
+        return {
+            'max_workers': self.max_workers,
+            'max_queue': self.max_queue,
+            'waiting': self.waiting,
+            'running': self.running,
+            'submitted': self.submitted,
+            'completed': self.completed,
+            'errors': self.errors,
+            'timeouts': self.timeouts,
+            'cancelled': self.cancelled,
+            'rejected': self.rejected,
+            'restarts': self.restarts
+        }
+
+
+def _mp_context():
+    """
+    forkserver (spawn where there's none): forking the bot itself would copy
+    the mongo and executor threads' locks into the workers, which can hang
+    them. the server preloads this module so workers start warm.
+    """
+    if 'forkserver' in multiprocessing.get_all_start_methods():
+        context = multiprocessing.get_context('forkserver')
+        context.set_forkserver_preload([__name__])
+        return context
+    return multiprocessing.get_context('spawn')
+
+
+# ----- shared service -----
+_service = None
+
+def get_service():
+    global _service
+    if _service is None:
+        _service = ComputeService()
+    return _service
+
+
+def set_service(service):
+    global _service
+    _service = service
+
+
+def clear_service(service):
+    global _service
+    if _service is service:
+        _service = None
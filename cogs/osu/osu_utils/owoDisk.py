@@ -0,0 +1,301 @@
+import os
+import json
+import time
+import asyncio
+import contextlib
+import collections
+
+
+class DiskCache:
+    """
+    Byte quota for one cache directory, least recently used files are
+    deleted first. Files being read (see `reading`) or pinned are skipped.
+    The index (size and last access per file) is kept in memory and saved
+    to `index_filepath` so the order survives restarts.
+    """
+    def __init__(self, name, folderpath, max_bytes, index_filepath=None):
+        self.name = name
+        self.folderpath = folderpath
+        self.max_bytes = max_bytes
+        self.index_filepath = index_filepath
+        self.entries = collections.OrderedDict() # filename -> [size, last access], oldest first
+        self.bytes = 0
+        self.in_use = collections.Counter() # filename -> readers
+        self.pinned = set()
+        self.scanned = False
+        self.dirty = False
+
+        self.hits = 0
+        self.adds = 0
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.errors = 0
+
+    def _filename(self, filepath):
+        return os.path.basename(filepath)
+
+    # ----- index -----
+    def load_index(self):
+        if not self.index_filepath or not os.path.exists(self.index_filepath):
+            return
+        try:
+            with open(self.index_filepath) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print('Disk index for {} not loaded: {}'.format(self.name, e))
+            return
+        for filename, (size, last_access) in sorted(
+            saved.items(), key=lambda item: item[1][1]):
+            self._set(filename, size, last_access)
+
+    def save_index(self):
+        if not self.index_filepath or not self.dirty:
+            return
+        temp_filepath = self.index_filepath + '.tmp'
+        with open(temp_filepath, 'w') as f:
+            json.dump(self.entries, f)
+        os.replace(temp_filepath, self.index_filepath)
+        self.dirty = False
+
+    def scan(self):
+        """(filename, size, mtime) for every file, run in an executor"""
+        found = []
+        if not os.path.exists(self.folderpath):
+            return found
+        with os.scandir(self.folderpath) as it:
+            for entry in it:
+                if entry.is_file() and not entry.name.endswith('.tmp'):
+                    stat = entry.stat()
+                    found.append((entry.name, stat.st_size, stat.st_mtime))
+        return found
+
+    def merge_scan(self, found):
+        """files on disk become the index, keeping known access times"""
+        on_disk = set()
+        for filename, size, mtime in sorted(found, key=lambda item: item[2]):
+            on_disk.add(filename)
+            if filename in self.entries:
+                self._set(filename, size, self.entries[filename][1])
+            else:
+                self._set(filename, size, mtime)
+        for filename in [filename for filename in self.entries if filename not in on_disk]:
+            self._drop(filename)
+        # keep oldest-first order after the merge
+        self.entries = collections.OrderedDict(
+            sorted(self.entries.items(), key=lambda item: item[1][1]))
+        self.scanned = True
+        self.dirty = True
+        self.enforce()
+
+    def _set(self, filename, size, last_access):
+        if filename in self.entries:
+            self.bytes -= self.entries[filename][0]
+        self.entries[filename] = [size, last_access]
+        self.bytes += size
+
+    def _drop(self, filename):
+        size, _ = self.entries.pop(filename)
+        self.bytes -= size
+
+    # ----- usage -----
+    def touch(self, filepath):
+        """a cache hit, moves the file to the back of the eviction order"""
+        filename = self._filename(filepath)
+        entry = self.entries.get(filename)
+        if entry is None:
+            return
+        entry[1] = time.time()
+        self.entries.move_to_end(filename)
+        self.hits += 1
+        self.dirty = True
+
+    def add(self, filepath):
+        """a file was written (or replaced), then evicts down to the quota"""
+        try:
+            size = os.path.getsize(filepath)
+        except OSError:
+            return
+        filename = self._filename(filepath)
+        self._set(filename, size, time.time())
+        self.entries.move_to_end(filename)
+        self.adds += 1
+        self.dirty = True
+        self.enforce(keep=filename)
+
+    @contextlib.contextmanager
+    def reading(self, filepath):
+        """the file won't be evicted inside this block"""
+        filename = self._filename(filepath)
+        self.in_use[filename] += 1
+        try:
+            yield
+        finally:
+            self.in_use[filename] -= 1
+            if self.in_use[filename] <= 0:
+                del self.in_use[filename]
+        self.touch(filepath)
+
+    def pin(self, filepath):
+        self.pinned.add(self._filename(filepath))
+
+    def unpin(self, filepath):
+        self.pinned.discard(self._filename(filepath))
+
+    def enforce(self, keep=None):
+        if self.max_bytes is None or self.bytes <= self.max_bytes:
+            return
+        for filename in list(self.entries):
+            if self.bytes <= self.max_bytes:
+                break
+            if filename == keep or filename in self.in_use or filename in self.pinned:
+                continue
+            size = self.entries[filename][0]
+            try:
+                os.remove(os.path.join(self.folderpath, filename))
+            except FileNotFoundError:
+                pass
+            except OSError as e:
+                self.errors += 1
+                print('Could not evict {} from {}: {}'.format(filename, self.name, e))
+                continue
+            self._drop(filename)
+            self.evictions += 1
+            self.evicted_bytes += size
+            self.dirty = True
+
+    def get_stats(self):
+        return {
+            'folder': self.folderpath,
+            'files': len(self.entries),
+            'bytes': self.bytes,
+            'max_bytes': self.max_bytes,
+            'scanned': self.scanned,
+            'in_use': len(self.in_use),
+            'pinned': len(self.pinned),
+            'hits': self.hits,
+            'adds': self.adds,
+            'evictions': self.evictions,
+            'evicted_bytes': self.evicted_bytes,
+            'errors': self.errors
+        }
+
+
+class DiskCacheManager:
+    """DiskCache per cache directory, looked up by name or by file path"""
+    DEFAULTS = {
+        'beatmaps': {
+            'path': os.path.join('cogs', 'osu', 'beatmaps'),
+            'max_bytes': 8 * 1024**3},
+        'beatmap_store': {
+            'path': os.path.join('cogs', 'osu', 'beatmaps', 'md5'),
+            'max_bytes': 8 * 1024**3},
+        'beatmap_parsed': {
+            'path': os.path.join('cogs', 'osu', 'cache', 'beatmap_parsed'),
+            'max_bytes': 4 * 1024**3},
+        'beatmap_images': {
+            'path': os.path.join('cogs', 'osu', 'resources', 'beatmap_images'),
+            'max_bytes': 2 * 1024**3},
+        'beatmap_images_full': {
+            'path': os.path.join('cogs', 'osu', 'resources', 'beatmap_images_full'),
+            'max_bytes': 4 * 1024**3},
+    }
+
+    def __init__(self, quotas=None, index_folderpath=None, save_interval=300):
+        self.index_folderpath = index_folderpath or \
+            os.path.join('cogs', 'osu', 'cache', 'disk_index')
+        self.save_interval = save_interval
+        self.caches = {}
+        self.task = None
+
+        settings = {name: dict(quota) for name, quota in self.DEFAULTS.items()}
+        for name, quota in (quotas or {}).items():
+            settings.setdefault(name, {}).update(quota)
+        for name, quota in settings.items():
+            self.caches[name] = DiskCache(name, quota['path'], quota.get('max_bytes'),
+                index_filepath=os.path.join(self.index_folderpath, '{}.json'.format(name)))
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build from the settings.osu.disk_cache block of config.json"""
+        settings = settings or {}
+        return cls(quotas=settings.get('quotas', {}),
+            save_interval=settings.get('save_interval', 300))
+
+    def get(self, filepath):
+        """the DiskCache whose folder holds filepath, or None"""
+        folderpath = os.path.abspath(os.path.dirname(filepath))
+        for cache in self.caches.values():
+            if os.path.abspath(cache.folderpath) == folderpath:
+                return cache
+        return None
+
+    def touch(self, filepath):
+        cache = self.get(filepath)
+        if cache is not None:
+            cache.touch(filepath)
+
+    def add(self, filepath):
+        cache = self.get(filepath)
+        if cache is not None:
+            cache.add(filepath)
+
+    @contextlib.contextmanager
+    def reading(self, filepath):
+        cache = self.get(filepath)
+        if cache is None:
+            yield
+        else:
+            with cache.reading(filepath):
+                yield
+
+    async def start(self):
+        """loads the saved indexes, then scans each folder off the event loop"""
+        if not os.path.exists(self.index_folderpath):
+            os.makedirs(self.index_folderpath)
+        loop = asyncio.get_event_loop()
+        for cache in self.caches.values():
+            cache.load_index()
+            found = await loop.run_in_executor(None, cache.scan)
+            cache.merge_scan(found)
+        self.task = asyncio.ensure_future(self._save_loop())
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            self.save()
+
+    def save(self):
+        for cache in self.caches.values():
+            try:
+                cache.save_index()
+            except OSError as e:
+                print('Disk index for {} not saved: {}'.format(cache.name, e))
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.save()
+
+    def get_stats(self):
+        return {name: cache.get_stats() for name, cache in self.caches.items()}
+
+
+# ----- shared manager -----
+_manager = None
+
+def get_manager():
+    global _manager
+    if _manager is None:
+        _manager = DiskCacheManager()
+    return _manager
+
+
+def set_manager(manager):
+    global _manager
+    _manager = manager
+
+
+def clear_manager(manager):
+    global _manager
+    if _manager is manager:
+        _manager = None
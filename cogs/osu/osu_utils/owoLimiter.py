@@ -0,0 +1,180 @@
+import time
+import asyncio
+import contextlib
+import contextvars
+import collections
+
+# highest priority first
+LANES = ['interactive', 'tracking', 'bulk']
+
+# lane of the current task, inherited by tasks it creates
+current_lane = contextvars.ContextVar('owo_lane', default='interactive')
+
+
+@contextlib.contextmanager
+def lane(name):
+    """Run the enclosed requests (and tasks created inside) in a priority lane"""
+    if name not in LANES:
+        raise ValueError('Unknown lane {}'.format(name))
+    token = current_lane.set(name)
+    try:
+        yield
+    finally:
+        current_lane.reset(token)
+
+
+class LaneStats:
+    def __init__(self):
+        self.requests = 0
+        self.waited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+
+    def record(self, wait_time):
+        self.requests += 1
+        if wait_time > 0:
+            self.waited += 1
+            self.total_wait += wait_time
+            self.max_wait = max(self.max_wait, wait_time)
+
+
+class TokenBucket:
+    """
+    Token bucket shared by every lane, waiting requests are served strictly by
+    lane priority. Lower lanes also leave `reserve` tokens for the lanes above.
+    """
+    def __init__(self, name, rate, burst, reserve=None):
+        self.name = name
+        self.rate = rate / 60 # per second, configured per minute
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        if reserve is None:
+            reserve = {'interactive': 0, 'tracking': 0, 'bulk': burst * 0.25}
+        self.reserve = reserve
+
+        self.waiters = {lane_name: collections.deque() for lane_name in LANES}
+        self.stats = {lane_name: LaneStats() for lane_name in LANES}
+        self.dispatcher = None
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity,
+            self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def _can_take(self, lane_name):
+        return self.tokens - self.reserve.get(lane_name, 0) >= 1
+
+    def _queued_ahead(self, lane_name):
+        # anyone waiting in this lane or a more important one
+        for other_lane in LANES[:LANES.index(lane_name) + 1]:
+            if any(not waiter.done() for waiter in self.waiters[other_lane]):
+                return True
+        return False
+
+    async def acquire(self, lane_name):
+        start_time = time.monotonic()
+        self._refill()
+        if not self._queued_ahead(lane_name) and self._can_take(lane_name):
+            self.tokens -= 1
+            self.stats[lane_name].record(0)
+            return 0
+
+        waiter = asyncio.get_event_loop().create_future()
+        self.waiters[lane_name].append(waiter)
+        if self.dispatcher is None or self.dispatcher.done():
+            self.dispatcher = asyncio.ensure_future(self._dispatch())
+        await waiter
+
+        wait_time = time.monotonic() - start_time
+        self.stats[lane_name].record(wait_time)
+        return wait_time
+
+    async def _dispatch(self):
+        while True:
+            waiting_lane = None
+            for lane_name in LANES:
+                queue = self.waiters[lane_name]
+                while queue and queue[0].done(): # cancelled callers
+                    queue.popleft()
+                if queue:
+                    waiting_lane = lane_name
+                    break
+
+            if waiting_lane is None:
+                return
+
+            self._refill()
+            if self._can_take(waiting_lane):
+                self.tokens -= 1
+                self.waiters[waiting_lane].popleft().set_result(True)
+                continue
+
+            needed = 1 + self.reserve.get(waiting_lane, 0) - self.tokens
+            await asyncio.sleep(max(needed / self.rate, 0.01))
+
+    def get_stats(self):
+        stats = {}
+        for lane_name in LANES:
+            lane_stats = self.stats[lane_name]
+            stats[lane_name] = {
+                'queue_depth': sum(1 for waiter in self.waiters[lane_name]
+                    if not waiter.done()),
+                'requests': lane_stats.requests,
+                'waited': lane_stats.waited,
+                'avg_wait': lane_stats.total_wait / max(lane_stats.waited, 1),
+                'max_wait': lane_stats.max_wait
+            }
+        return stats
+
+
+class RateLimiter:
+    """
+    Central per-upstream limiter. Requests are matched to a budget by the
+    longest registered uri prefix, unmatched uris are not limited.
+    """
+    DEFAULT_BUDGETS = {
+        # requests per minute, burst
+        'officialAPIv1': {'rate': 600, 'burst': 60},
+        'officialAPIv2': {'rate': 600, 'burst': 60},
+        'gatariAPI': {'rate': 60, 'burst': 10},
+        'rippleAPI': {'rate': 60, 'burst': 10}, # per host
+        'droidAPI': {'rate': 60, 'burst': 10},
+    }
+
+    def __init__(self, budgets=None):
+        self.budgets = {name: dict(budget)
+            for name, budget in self.DEFAULT_BUDGETS.items()}
+        for budget_name, budget in (budgets or {}).items():
+            self.budgets.setdefault(budget_name, {}).update(budget)
+
+        self.routes = [] # (prefix, budget name, bucket key)
+        self.buckets = {}
+
+    def add_route(self, prefix, budget_name, key=None):
+        key = key or budget_name
+        self.routes.append((prefix, budget_name, key))
+        self.routes.sort(key=lambda route: len(route[0]), reverse=True)
+
+    def get_bucket(self, uri):
+        for prefix, budget_name, key in self.routes:
+            if uri.startswith(prefix):
+                bucket = self.buckets.get(key)
+                if bucket is None:
+                    budget = self.budgets[budget_name]
+                    bucket = TokenBucket(key, budget['rate'], budget['burst'],
+                        reserve=budget.get('reserve'))
+                    self.buckets[key] = bucket
+                return bucket
+        return None
+
+    async def acquire(self, uri, lane_name=None):
+        bucket = self.get_bucket(uri)
+        if bucket is None:
+            return 0
+        return await bucket.acquire(lane_name or current_lane.get())
+
+    def get_stats(self):
+        return {key: bucket.get_stats() for key, bucket in self.buckets.items()}
+
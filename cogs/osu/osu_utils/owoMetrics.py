@@ -0,0 +1,230 @@
+import time
+import bisect
+import inspect
+import functools
+import contextlib
+import contextvars
+import collections
+
+# upper bounds in seconds, last bucket is everything above
+BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30, 60]
+
+# (api, request name) of the owoAPI call the current task is inside of
+current_labels = contextvars.ContextVar('owo_metric_labels', default=None)
+
+
+class Histogram:
+    def __init__(self):
+        self.counts = [0] * (len(BUCKETS) + 1)
+        self.count = 0
+        self.errors = 0
+        self.total = 0.0
+
+    def observe(self, seconds, error=False):
+        self.counts[bisect.bisect_left(BUCKETS, seconds)] += 1
+        self.count += 1
+        self.total += seconds
+        if error:
+            self.errors += 1
+
+    def merge(self, other):
+        for idx, count in enumerate(other.counts):
+            self.counts[idx] += count
+        self.count += other.count
+        self.errors += other.errors
+        self.total += other.total
+
+    def percentile(self, pct):
+        """estimated from the buckets, linear inside the bucket"""
+        if not self.count:
+            return None
+        rank = pct / 100 * self.count
+        seen = 0
+        for idx, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                lower = BUCKETS[idx - 1] if idx > 0 else 0
+                upper = BUCKETS[idx] if idx < len(BUCKETS) else BUCKETS[-1] * 2
+                return lower + (upper - lower) * (rank - seen) / count
+            seen += count
+        return BUCKETS[-1]
+
+    def summary(self):
+        return {
+            'count': self.count,
+            'errors': self.errors,
+            'avg': self.total / max(self.count, 1),
+            'p50': self.percentile(50),
+            'p95': self.percentile(95),
+            'p99': self.percentile(99)
+        }
+
+
+class RollingHistogram:
+    """Lifetime histogram plus one histogram per time slot for recent windows"""
+    def __init__(self, slot_seconds=60, num_slots=60):
+        self.slot_seconds = slot_seconds
+        self.total = Histogram()
+        self.slots = collections.deque(maxlen=num_slots) # (slot, Histogram)
+
+    def observe(self, seconds, error=False):
+        self.total.observe(seconds, error)
+        slot = int(time.time() // self.slot_seconds)
+        if not self.slots or self.slots[-1][0] != slot:
+            self.slots.append((slot, Histogram()))
+        self.slots[-1][1].observe(seconds, error)
+
+    def window(self, seconds=None):
+        if seconds is None:
+            return self.total
+        oldest = int((time.time() - seconds) // self.slot_seconds)
+        merged = Histogram()
+        for slot, histogram in self.slots:
+            if slot >= oldest:
+                merged.merge(histogram)
+        return merged
+
+
+class Metrics:
+    """
+    Latency histograms keyed by (kind, api, request). Kinds used by owoAPI:
+    call (a whole owoAPI method), upstream (one http request), cache, download
+    and compute (process pool jobs, queue and run times).
+    """
+    def __init__(self, slot_seconds=60, num_slots=60):
+        self.slot_seconds = slot_seconds
+        self.num_slots = num_slots
+        self.histograms = {}
+
+    def observe(self, kind, api, request, seconds, error=False):
+        key = (kind, str(api), str(request))
+        histogram = self.histograms.get(key)
+        if histogram is None:
+            histogram = RollingHistogram(self.slot_seconds, self.num_slots)
+            self.histograms[key] = histogram
+        histogram.observe(seconds, error)
+
+    @contextlib.contextmanager
+    def timer(self, kind, api, request):
+        start_time = time.monotonic()
+        error = False
+        try:
+            yield
+        except Exception:
+            error = True
+            raise
+        finally:
+            self.observe(kind, api, request,
+                time.monotonic() - start_time, error=error)
+
+    def summary(self, kind=None, window=None):
+        """{kind: {api: {request: stats}}}, window in seconds (None is lifetime)"""
+        summary = {}
+        for (h_kind, api, request), histogram in sorted(self.histograms.items()):
+            if kind is not None and h_kind != kind:
+                continue
+            stats = histogram.window(window).summary()
+            if not stats['count']:
+                continue
+            summary.setdefault(h_kind, {}).setdefault(api, {})[request] = stats
+        return summary
+
+    def exposition(self):
+        """prometheus text format"""
+        lines = [
+            '# HELP owo_request_seconds owoAPI latency by kind, api and request',
+            '# TYPE owo_request_seconds histogram']
+        error_lines = [
+            '# HELP owo_request_errors_total owoAPI requests that failed',
+            '# TYPE owo_request_errors_total counter']
+
+        for (kind, api, request), histogram in sorted(self.histograms.items()):
+            total = histogram.total
+            labels = 'kind="{}",api="{}",request="{}"'.format(
+                _escape(kind), _escape(api), _escape(request))
+            cumulative = 0
+            for bound, count in zip(BUCKETS + ['+Inf'], total.counts):
+                cumulative += count
+                lines.append('owo_request_seconds_bucket{{{},le="{}"}} {}'.format(
+                    labels, bound, cumulative))
+            lines.append('owo_request_seconds_sum{{{}}} {}'.format(labels, total.total))
+            lines.append('owo_request_seconds_count{{{}}} {}'.format(labels, total.count))
+            error_lines.append('owo_request_errors_total{{{}}} {}'.format(
+                labels, total.errors))
+
+        return '\n'.join(lines + error_lines) + '\n'
+
+
+def _escape(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+# ----- labels -----
+@contextlib.contextmanager
+def labels(api, request):
+    token = current_labels.set((api, request))
+    try:
+        yield
+    finally:
+        current_labels.reset(token)
+
+
+def timed(func=None, api=None):
+    """
+    Times an owoAPI coroutine method as a `call` and labels everything it
+    does (upstream requests, cache lookups, downloads) with its api and name.
+    The api label is the method's `api` argument, falling back to `api` here.
+    """
+    if func is None:
+        return functools.partial(timed, api=api)
+
+    signature = inspect.signature(func)
+    request = func.__name__
+    fixed_api = api
+
+    @functools.wraps(func)
+    async def wrapper(*args, **kwargs):
+        api = None
+        if 'api' in signature.parameters:
+            bound = signature.bind_partial(*args, **kwargs)
+            api = bound.arguments.get('api', signature.parameters['api'].default)
+        api = api or fixed_api or 'bancho'
+
+        with labels(api, request), get_metrics().timer('call', api, request):
+            return await func(*args, **kwargs)
+    return wrapper
+
+
+def get_labels(default_api='other'):
+    return current_labels.get() or (default_api, 'other')
+
+
+# ----- shared metrics -----
+_metrics = None
+
+def get_metrics():
+    global _metrics
+    if _metrics is None:
+        _metrics = Metrics()
+    return _metrics
+
+
+def set_metrics(metrics):
+    global _metrics
+    _metrics = metrics
+
+
+async def start_server(metrics, host='127.0.0.1', port=9105):
+    """optional /metrics endpoint for prometheus scraping"""
+    from aiohttp import web
+
+    async def handle(request):
+        return web.Response(text=metrics.exposition(),
+            content_type='text/plain', charset='utf-8')
+
+    app = web.Application()
+    app.router.add_get('/metrics', handle)
+    runner = web.AppRunner(app)
+    await runner.setup()
+    site = web.TCPSite(runner, host, port)
+    await site.start()
+    return runner
@@ -0,0 +1,203 @@
+import time
+import asyncio
+import collections
+
+
+class MirrorStats:
+    """Rolling latency/error window and circuit breaker state for one mirror"""
+    def __init__(self, name, window=50):
+        self.name = name
+        self.latencies = collections.deque(maxlen=window) # successful attempts
+        self.outcomes = collections.deque(maxlen=window) # True/False
+        self.consecutive_failures = 0
+        self.trips = 0
+        self.open_until = 0
+        self.trial = False # half open, one request allowed through
+
+        self.requests = 0
+        self.failures = 0
+
+    def record(self, latency, success):
+        self.requests += 1
+        self.outcomes.append(success)
+        self.trial = False
+        if success:
+            self.latencies.append(latency)
+            self.consecutive_failures = 0
+            self.trips = 0
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    @property
+    def error_rate(self):
+        if not self.outcomes:
+            return 0
+        return self.outcomes.count(False) / len(self.outcomes)
+
+    def percentile(self, pct, default):
+        if not self.latencies:
+            return default
+        ordered = sorted(self.latencies)
+        idx = min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)
+        return ordered[idx]
+
+
+class MirrorScorer:
+    """
+    Orders download mirrors by rolling latency and error rate. Mirrors that
+    fail `failure_threshold` times in a row are skipped for `cooldown` seconds
+    (doubling while they keep failing), then get a single trial request.
+    """
+    def __init__(self, mirrors, window=50, failure_threshold=3, cooldown=60,
+        max_cooldown=900, hedge=True, hedge_percentile=95, min_hedge_delay=0.5,
+        default_latency=3.0, error_penalty=4):
+        self.stats = collections.OrderedDict(
+            (name, MirrorStats(name, window=window)) for name in mirrors)
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self.max_cooldown = max_cooldown
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.min_hedge_delay = min_hedge_delay
+        self.default_latency = default_latency
+        self.error_penalty = error_penalty
+
+        self.hedged = 0
+        self.hedge_wins = 0
+
+    @classmethod
+    def from_settings(cls, mirrors, settings):
+        """Build from the settings.osu.mirrors block of config.json"""
+        settings = settings or {}
+        return cls(settings.get('order', mirrors),
+            window=settings.get('window', 50),
+            failure_threshold=settings.get('failure_threshold', 3),
+            cooldown=settings.get('cooldown', 60),
+            max_cooldown=settings.get('max_cooldown', 900),
+            hedge=settings.get('hedge', True),
+            hedge_percentile=settings.get('hedge_percentile', 95),
+            min_hedge_delay=settings.get('min_hedge_delay', 0.5),
+            default_latency=settings.get('default_latency', 3.0),
+            error_penalty=settings.get('error_penalty', 4))
+
+    # ----- health -----
+    def state(self, name):
+        mirror = self.stats[name]
+        if mirror.consecutive_failures < self.failure_threshold:
+            return 'closed'
+        if time.monotonic() < mirror.open_until:
+            return 'open'
+        return 'half_open'
+
+    def is_healthy(self, name):
+        state = self.state(name)
+        if state == 'half_open':
+            return not self.stats[name].trial
+        return state == 'closed'
+
+    def score(self, name):
+        """expected seconds for a download, lower is better"""
+        mirror = self.stats[name]
+        median = mirror.percentile(50, self.default_latency)
+        return median * (1 + self.error_penalty * mirror.error_rate)
+
+    def ranked(self, names=None):
+        """healthy mirrors, fastest first"""
+        names = [name for name in (names or self.stats) if name in self.stats]
+        healthy = [name for name in names if self.is_healthy(name)]
+        return sorted(healthy, key=self.score)
+
+    def hedge_delay(self, name):
+        mirror = self.stats[name]
+        return max(self.min_hedge_delay,
+            mirror.percentile(self.hedge_percentile, self.default_latency))
+
+    def begin(self, name):
+        if self.state(name) == 'half_open':
+            self.stats[name].trial = True
+
+    def record(self, name, latency, success):
+        mirror = self.stats[name]
+        mirror.record(latency, success)
+        if not success and mirror.consecutive_failures >= self.failure_threshold:
+            cooldown = self.cooldown * (2 ** mirror.trips)
+            mirror.open_until = time.monotonic() + min(cooldown, self.max_cooldown)
+            mirror.trips += 1
+            print('Mirror {} unavailable for {:.0f}s'.format(
+                name, min(cooldown, self.max_cooldown)))
+
+    # ----- requests -----
+    async def run(self, attempt, names=None):
+        """
+        Calls `attempt(name)` on the best mirror, hedging with the next one
+        if it takes longer than its usual (percentile) time. A falsy result or
+        an exception counts as a failure and moves on to the next mirror.
+        Returns (mirror name, result), or (None, None) if every mirror failed.
+        """
+        candidates = self.ranked(names)
+        pending = {} # task -> (name, start time, hedged)
+
+        def start_next(hedged=False):
+            name = candidates.pop(0)
+            self.begin(name)
+            task = asyncio.ensure_future(attempt(name))
+            pending[task] = (name, time.monotonic(), hedged)
+
+        if not candidates:
+            return None, None
+
+        start_next()
+        try:
+            while pending:
+                timeout = None
+                if self.hedge and candidates and len(pending) == 1:
+                    name, start_time, _ = list(pending.values())[0]
+                    elapsed = time.monotonic() - start_time
+                    timeout = max(self.hedge_delay(name) - elapsed, 0)
+
+                done, _ = await asyncio.wait(list(pending), timeout=timeout,
+                    return_when=asyncio.FIRST_COMPLETED)
+
+                if not done: # slow, send the same request to the next mirror
+                    start_next(hedged=True)
+                    self.hedged += 1
+                    continue
+
+                for task in done:
+                    name, start_time, hedged = pending.pop(task)
+                    try:
+                        result = task.result()
+                    except Exception as e:
+                        print('Mirror {} failed: {}'.format(name, e))
+                        result = None
+
+                    self.record(name, time.monotonic() - start_time, bool(result))
+                    if result:
+                        if hedged:
+                            self.hedge_wins += 1
+                        return name, result
+
+                if not pending and candidates:
+                    start_next()
+            return None, None
+        finally:
+            for task, (name, _, _) in pending.items():
+                task.cancel() # the losing hedge, or the caller gave up
+                self.stats[name].trial = False
+
+    def get_stats(self):
+        stats = {}
+        for name, mirror in self.stats.items():
+            stats[name] = {
+                'state': self.state(name),
+                'score': self.score(name),
+                'p50': mirror.percentile(50, None),
+                'p95': mirror.percentile(95, None),
+                'error_rate': mirror.error_rate,
+                'requests': mirror.requests,
+                'failures': mirror.failures
+            }
+        stats['hedged'] = self.hedged
+        stats['hedge_wins'] = self.hedge_wins
+        return stats
@@ -0,0 +1,162 @@
+import time
+import asyncio
+import aiohttp
+import contextlib
+import contextvars
+from urllib.parse import urlparse
+
+from cogs.osu.osu_utils import owoMetrics
+
+# failed upstream requests in the current task, see track_failures
+current_failures = contextvars.ContextVar('owo_upstream_failures', default=None)
+
+
+class SessionManager(object):
+    """
+    Keeps one pooled, long-lived aiohttp session per upstream host
+    """
+
+    def __init__(self, limit=100, limit_per_host=10, dns_cache_ttl=300,
+        timeout=20, connect_timeout=10, hosts=None):
+        self.limit = limit
+        self.limit_per_host = limit_per_host
+        self.dns_cache_ttl = dns_cache_ttl
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.hosts = hosts or {} # per-host overrides, keyed by netloc
+
+        self.sessions = {}
+        self.closed = False
+        self.limiter = None # optional owoLimiter.RateLimiter
+        self.standin = None # base url of other_scripts/api_standin.py
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build from the settings.osu.http block of config.json"""
+        settings = settings or {}
+        return cls(
+            limit=settings.get('limit', 100),
+            limit_per_host=settings.get('limit_per_host', 10),
+            dns_cache_ttl=settings.get('dns_cache_ttl', 300),
+            timeout=settings.get('timeout', 20),
+            connect_timeout=settings.get('connect_timeout', 10),
+            hosts=settings.get('hosts', {}))
+
+    @staticmethod
+    def host_key(uri):
+        return urlparse(uri).netloc.lower()
+
+    def standin_uri(self, uri):
+        """https://host/path -> {standin}/https/host/path"""
+        if not self.standin:
+            return uri
+        parsed = urlparse(uri)
+        return '{}/{}/{}{}'.format(self.standin.rstrip('/'), parsed.scheme,
+            parsed.netloc, uri[len(parsed.scheme) + 3 + len(parsed.netloc):])
+
+    def _host_setting(self, host, key):
+        host_settings = self.hosts.get(host, {})
+        return host_settings.get(key, getattr(self, key))
+
+    def get_session(self, uri):
+        host = self.host_key(uri)
+        session = self.sessions.get(host)
+        if session is None or session.closed:
+            connector = aiohttp.TCPConnector(
+                limit=self._host_setting(host, 'limit'),
+                limit_per_host=self._host_setting(host, 'limit_per_host'),
+                ttl_dns_cache=self._host_setting(host, 'dns_cache_ttl'),
+                use_dns_cache=True)
+            timeout = aiohttp.ClientTimeout(
+                total=self._host_setting(host, 'timeout'),
+                connect=self._host_setting(host, 'connect_timeout'))
+            session = aiohttp.ClientSession(
+                connector=connector, timeout=timeout)
+            self.sessions[host] = session
+            self.closed = False
+        return session
+
+    @contextlib.asynccontextmanager
+    async def request(self, method, uri, **kwargs):
+        if self.limiter is not None:
+            await self.limiter.acquire(uri)
+        request_uri = self.standin_uri(uri)
+        session = self.get_session(request_uri)
+
+        # time to response headers, labelled by the owoAPI call we're in
+        api, request_name = owoMetrics.get_labels(self.host_key(uri))
+        start_time = time.monotonic()
+        observed = False
+        try:
+            async with session.request(method, request_uri, **kwargs) as resp:
+                observed = True
+                failed = resp.status >= 500 or resp.status == 429
+                owoMetrics.get_metrics().observe('upstream', api, request_name,
+                    time.monotonic() - start_time, error=failed)
+                if failed:
+                    _count_failure()
+                yield resp
+        except Exception:
+            if not observed:
+                owoMetrics.get_metrics().observe('upstream', api, request_name,
+                    time.monotonic() - start_time, error=True)
+                _count_failure()
+            raise
+
+    def get(self, uri, **kwargs):
+        return self.request('GET', uri, **kwargs)
+
+    def post(self, uri, **kwargs):
+        return self.request('POST', uri, **kwargs)
+
+    async def close(self):
+        sessions = list(self.sessions.values())
+        self.sessions = {}
+        self.closed = True
+        for session in sessions:
+            if not session.closed:
+                await session.close()
+        # give the connectors a moment to release their sockets
+        await asyncio.sleep(0.25)
+
+
+# ----- failures -----
+@contextlib.contextmanager
+def track_failures():
+    """
+    Counts upstream requests inside the block that errored, timed out or
+    came back 5xx/429, so an empty answer can be told apart from an outage.
+    """
+    failures = [0]
+    token = current_failures.set(failures)
+    try:
+        yield failures
+    finally:
+        current_failures.reset(token)
+
+
+def _count_failure():
+    failures = current_failures.get()
+    if failures is not None:
+        failures[0] += 1
+
+
+# ----- shared manager -----
+_manager = None
+
+def get_manager():
+    global _manager
+    if _manager is None:
+        _manager = SessionManager()
+    return _manager
+
+
+def set_manager(manager):
+    global _manager
+    _manager = manager
+
+
+def clear_manager(manager):
+    global _manager
+    if _manager is manager:
+        _manager = None
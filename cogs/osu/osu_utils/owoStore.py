@@ -0,0 +1,266 @@
+import os
+import json
+import asyncio
+import hashlib
+
+from cogs.osu.osu_utils import owoDisk
+
+
+def file_md5(data):
+    return hashlib.md5(data).hexdigest()
+
+
+def read_beatmap_id(data):
+    """BeatmapID from the [Metadata] section of .osu bytes, None for old maps"""
+    for line in data.splitlines():
+        line = line.strip()
+        if line.startswith(b'BeatmapID:'):
+            beatmap_id = line.split(b':', 1)[1].strip().decode('utf-8', 'ignore')
+            return beatmap_id if beatmap_id.isdigit() and beatmap_id != '0' else None
+        if line.startswith(b'[Difficulty]'): # metadata is before this
+            break
+    return None
+
+
+class OsuFileStore:
+    """
+    .osu files stored by content as <md5>.osu. The index maps beatmap_id to
+    the md5 of its current version and every md5 seen to its beatmap_id, so
+    maps from replays and droid scores (which only have the hash) resolve
+    to a local file without asking an API. Old versions stay until the
+    disk quota evicts them.
+    """
+    def __init__(self, folderpath=None, index_filepath=None,
+        legacy_folderpath=None, save_interval=300):
+        self.folderpath = folderpath or \
+            os.path.join('cogs', 'osu', 'beatmaps', 'md5')
+        self.index_filepath = index_filepath or \
+            os.path.join('cogs', 'osu', 'cache', 'osu_store.json')
+        self.legacy_folderpath = legacy_folderpath # <beatmap_id>.osu files to import
+        self.save_interval = save_interval
+        self.ids = {} # beatmap_id -> md5 of the current version
+        self.hashes = {} # md5 -> beatmap_id
+        self.dirty = False
+        self.task = None
+
+        self.hits = 0
+        self.misses = 0
+        self.adds = 0
+        self.mismatches = 0
+
+        if not os.path.exists(self.folderpath):
+            os.makedirs(self.folderpath)
+
+    @classmethod
+    def from_settings(cls, settings):
+        """Build from the settings.osu.osu_store block of config.json"""
+        settings = settings or {}
+        legacy_folderpath = None
+        if settings.get('import_legacy', True):
+            legacy_folderpath = os.path.join('cogs', 'osu', 'beatmaps')
+        return cls(folderpath=settings.get('path'),
+            legacy_folderpath=legacy_folderpath,
+            save_interval=settings.get('save_interval', 300))
+
+    def filepath(self, md5):
+        return os.path.join(self.folderpath, '{}.osu'.format(md5))
+
+    # ----- lookups -----
+    def get_path(self, beatmap_id=None, md5=None):
+        """
+        local file for a beatmap_id or an md5, None if there isn't one.
+        with both, the file for beatmap_id must have that md5 (current version)
+        """
+        if md5 is None and beatmap_id is not None:
+            md5 = self.ids.get(str(beatmap_id))
+        elif md5 is not None:
+            md5 = str(md5).lower()
+            if beatmap_id is not None and self.ids.get(str(beatmap_id)) != md5:
+                self.misses += 1
+                return None
+
+        if md5 is None:
+            self.misses += 1
+            return None
+        filepath = self.filepath(md5)
+        if not os.path.exists(filepath): # evicted by the disk quota
+            self._forget(md5)
+            self.misses += 1
+            return None
+        self.hits += 1
+        return filepath
+
+    def get_beatmap_id(self, md5):
+        """beatmap_id for any version of a map seen by the store"""
+        return self.hashes.get(str(md5).lower())
+
+    def get_md5(self, beatmap_id):
+        return self.ids.get(str(beatmap_id))
+
+    # ----- writes -----
+    def add_bytes(self, data, beatmap_id=None):
+        """stores .osu bytes, returns (filepath, md5)"""
+        md5 = file_md5(data)
+        filepath = self.filepath(md5)
+        if not os.path.exists(filepath):
+            temp_filepath = '{}.{}.tmp'.format(filepath, os.getpid())
+            with open(temp_filepath, 'wb') as f:
+                f.write(data)
+            os.replace(temp_filepath, filepath)
+            self.adds += 1
+        owoDisk.get_manager().add(filepath)
+
+        beatmap_id = beatmap_id or read_beatmap_id(data)
+        if beatmap_id is not None:
+            self._index(str(beatmap_id), md5)
+        return filepath, md5
+
+    def add_file(self, src_filepath, beatmap_id=None, remove=True):
+        """stores a downloaded/extracted .osu, returns (filepath, md5)"""
+        with open(src_filepath, 'rb') as f:
+            data = f.read()
+        result = self.add_bytes(data, beatmap_id=beatmap_id)
+        if remove:
+            try:
+                os.remove(src_filepath)
+            except OSError:
+                pass
+        return result
+
+    def _index(self, beatmap_id, md5):
+        if self.ids.get(beatmap_id) != md5 or self.hashes.get(md5) != beatmap_id:
+            self.ids[beatmap_id] = md5
+            self.hashes[md5] = beatmap_id
+            self.dirty = True
+
+    def _forget(self, md5):
+        beatmap_id = self.hashes.pop(md5, None)
+        if beatmap_id is not None and self.ids.get(beatmap_id) == md5:
+            del self.ids[beatmap_id]
+        self.dirty = True
+
+    # ----- index -----
+    def load_index(self):
+        if not os.path.exists(self.index_filepath):
+            return
+        try:
+            with open(self.index_filepath) as f:
+                saved = json.load(f)
+        except (OSError, ValueError) as e:
+            print('Osu store index not loaded:', e)
+            return
+        self.ids = saved.get('ids', {})
+        self.hashes = saved.get('hashes', {})
+
+    def save_index(self):
+        if not self.dirty:
+            return
+        temp_filepath = self.index_filepath + '.tmp'
+        with open(temp_filepath, 'w') as f:
+            json.dump({'ids': self.ids, 'hashes': self.hashes}, f)
+        os.replace(temp_filepath, self.index_filepath)
+        self.dirty = False
+
+    def scan(self, known):
+        """
+        run in an executor. (md5, beatmap_id) for store files missing from
+        the index, legacy <beatmap_id>.osu files are moved into the store.
+        returns (found, on_disk)
+        """
+        found, on_disk = [], set()
+        with os.scandir(self.folderpath) as it:
+            for entry in it:
+                md5, extension = os.path.splitext(entry.name)
+                if extension != '.osu' or not entry.is_file():
+                    continue
+                on_disk.add(md5)
+                if md5 not in known:
+                    with open(entry.path, 'rb') as f:
+                        found.append((md5, read_beatmap_id(f.read())))
+
+        if self.legacy_folderpath and os.path.exists(self.legacy_folderpath):
+            with os.scandir(self.legacy_folderpath) as it:
+                for entry in it:
+                    beatmap_id, extension = os.path.splitext(entry.name)
+                    if extension != '.osu' or not entry.is_file():
+                        continue
+                    with open(entry.path, 'rb') as f:
+                        data = f.read()
+                    md5 = file_md5(data)
+                    if md5 not in on_disk:
+                        os.replace(entry.path, self.filepath(md5))
+                        on_disk.add(md5)
+                    else:
+                        os.remove(entry.path)
+                    found.append((md5, beatmap_id if beatmap_id.isdigit() else read_beatmap_id(data)))
+        return found, on_disk
+
+    def merge_scan(self, found, on_disk):
+        for md5 in [md5 for md5 in self.hashes if md5 not in on_disk]:
+            self._forget(md5)
+        disk = owoDisk.get_manager()
+        for md5, beatmap_id in found:
+            disk.add(self.filepath(md5))
+            if beatmap_id is not None:
+                self._index(str(beatmap_id), md5)
+        self.dirty = True
+
+    async def start(self):
+        """loads the index, then checks it against the folder off the event loop"""
+        self.load_index()
+        loop = asyncio.get_event_loop()
+        found, on_disk = await loop.run_in_executor(
+            None, self.scan, set(self.hashes))
+        self.merge_scan(found, on_disk)
+        if found:
+            print('Osu store indexed {} files'.format(len(found)))
+        self.save_index()
+        self.task = asyncio.ensure_future(self._save_loop())
+
+    async def _save_loop(self):
+        while True:
+            await asyncio.sleep(self.save_interval)
+            self.save()
+
+    def save(self):
+        try:
+            self.save_index()
+        except OSError as e:
+            print('Osu store index not saved:', e)
+
+    async def close(self):
+        if self.task is not None:
+            self.task.cancel()
+        self.save()
+
+    def get_stats(self):
+        return {
+            'folder': self.folderpath,
+            'beatmaps': len(self.ids),
+            'hashes': len(self.hashes),
+            'hits': self.hits,
+            'misses': self.misses,
+            'adds': self.adds,
+            'mismatches': self.mismatches
+        }
+
+
+# ----- shared store -----
+_store = None
+
+def get_store():
+    global _store
+    if _store is None:
+        _store = OsuFileStore()
+    return _store
+
+
+def set_store(store):
+    global _store
+    _store = store
+
+
+def clear_store(store):
+    global _store
+    if _store is store:
+        _store = None
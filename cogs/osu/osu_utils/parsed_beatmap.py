@@ -0,0 +1,141 @@
+"""
+Compact on-disk format for parsed std beatmaps, replacing pickled pyttanko
+objects in cogs/osu/cache/beatmap_parsed.
+
+    magic b'OWOB', version (uint16), header length, object count, timing count
+    json header (difficulty settings, counts, metadata), padded to 8 bytes
+    hitobjects: packed time, type, x, y, repetitions, distance
+    timing points: packed time, ms_per_beat, change
+
+The arrays are read straight out of a memory map. to_pyttanko rebuilds the
+objects pyttanko.diff_calc, ppv2 and max_combo (and droid_pyttanko) use.
+"""
+import os
+import mmap
+import json
+import struct
+import numpy as np
+import pyttanko
+
+MAGIC = b'OWOB'
+VERSION = 1
+EXTENSION = '.owob'
+
+PREFIX = struct.Struct('<4sHHIII') # magic, version, flags, header, objects, timing
+OBJECT_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('type', 'u1'),
+    ('x', '<f8'),
+    ('y', '<f8'),
+    ('repetitions', '<i4'),
+    ('distance', '<f8')])
+TIMING_DTYPE = np.dtype([
+    ('time', '<f8'),
+    ('ms_per_beat', '<f8'),
+    ('change', 'u1')])
+
+HEADER_FIELDS = ['mode', 'format_version', 'hp', 'cs', 'od', 'ar', 'sv', 'tick_rate',
+    'ncircles', 'nsliders', 'nspinners', 'title', 'title_unicode', 'artist',
+    'artist_unicode', 'creator', 'version']
+
+
+class ParsedBeatmap:
+    """header dict plus the hitobject and timing point arrays"""
+    def __init__(self, header, objects, timing_points):
+        self.header = header
+        self.objects = objects
+        self.timing_points = timing_points
+
+    @classmethod
+    def from_pyttanko(cls, bmap):
+        header = {field: getattr(bmap, field, None) for field in HEADER_FIELDS}
+
+        rows = []
+        for obj in bmap.hitobjects:
+            data = obj.data
+            if data is None: # spinners
+                rows.append((obj.time, obj.objtype, 0.0, 0.0, 0, 0.0))
+            else:
+                rows.append((obj.time, obj.objtype, data.pos.x, data.pos.y,
+                    getattr(data, 'repetitions', 0), getattr(data, 'distance', 0.0)))
+        objects = np.array(rows, dtype=OBJECT_DTYPE)
+
+        timing_points = np.array([(point.time, point.ms_per_beat, point.change)
+            for point in bmap.timing_points], dtype=TIMING_DTYPE)
+        return cls(header, objects, timing_points)
+
+    def to_pyttanko(self, module=pyttanko):
+        """a fresh module.beatmap, `module` can also be droid_pyttanko"""
+        bmap = module.beatmap()
+        for field, value in self.header.items():
+            setattr(bmap, field, value)
+
+        # same precedence as the .osu parser
+        circle_bit, spinner_bit, slider_bit = \
+            module.OBJ_CIRCLE, module.OBJ_SPINNER, module.OBJ_SLIDER
+        hitobjects = bmap.hitobjects
+        for time, objtype, x, y, repetitions, distance in self.objects.tolist():
+            if objtype & circle_bit:
+                data = module.circle(pos=module.v2f(x, y))
+            elif objtype & spinner_bit:
+                data = None
+            elif objtype & slider_bit:
+                data = module.slider(pos=module.v2f(x, y),
+                    distance=distance, repetitions=repetitions)
+            else:
+                data = None
+            hitobjects.append(module.hitobject(time=time, objtype=objtype, data=data))
+
+        bmap.timing_points.extend(module.timing(time=time,
+            ms_per_beat=ms_per_beat, change=bool(change))
+            for time, ms_per_beat, change in self.timing_points.tolist())
+        return bmap
+
+
+def dump(bmap, filepath):
+    """writes a pyttanko beatmap (or ParsedBeatmap), atomically"""
+    if not isinstance(bmap, ParsedBeatmap):
+        bmap = ParsedBeatmap.from_pyttanko(bmap)
+
+    header = json.dumps(bmap.header).encode('utf-8')
+    header += b' ' * (-(PREFIX.size + len(header)) % 8)
+
+    temp_filepath = '{}.{}.tmp'.format(filepath, os.getpid())
+    with open(temp_filepath, 'wb') as f:
+        f.write(PREFIX.pack(MAGIC, VERSION, 0, len(header),
+            len(bmap.objects), len(bmap.timing_points)))
+        f.write(header)
+        f.write(bmap.objects.tobytes())
+        f.write(bmap.timing_points.tobytes())
+    os.replace(temp_filepath, filepath)
+
+
+def load_parsed(filepath):
+    """ParsedBeatmap with arrays backed by a memory map of the file"""
+    with open(filepath, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+    if len(buffer) < PREFIX.size:
+        raise ValueError('{} is not a parsed beatmap'.format(filepath))
+    magic, version, _, header_len, num_objects, num_timing = \
+        PREFIX.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError('{} is not a parsed beatmap'.format(filepath))
+    if version != VERSION:
+        raise ValueError('{} is version {}, expected {}'.format(
+            filepath, version, VERSION))
+
+    offset = PREFIX.size
+    header = json.loads(buffer[offset:offset + header_len].decode('utf-8'))
+    offset += header_len
+    objects = np.frombuffer(buffer, dtype=OBJECT_DTYPE,
+        count=num_objects, offset=offset)
+    offset += objects.nbytes
+    timing_points = np.frombuffer(buffer, dtype=TIMING_DTYPE,
+        count=num_timing, offset=offset)
+    return ParsedBeatmap(header, objects, timing_points)
+
+
+def load(filepath, module=pyttanko):
+    """pyttanko beatmap from a file written by dump, ValueError if it isn't one"""
+    return load_parsed(filepath).to_pyttanko(module)
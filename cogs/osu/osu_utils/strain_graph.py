@@ -0,0 +1,143 @@
+"""
+Star graph over a sliding window, in one pass over the map.
+
+chunks.chunks cuts every window out into its own temporary .osu and runs a
+full difficulty calculation on it. Here the map is parsed once, spacing
+weights and strains are computed once for the whole map, and a window's
+strains come from the map's: the strain the objects before the window left
+behind only decays (by base^(elapsed / 1000)), so it's subtracted back out
+with one power per object. Each window then only finds its 400ms interval
+peaks and weighs them.
+
+Windows work like chunks.chunks: the window at `seek` holds the objects
+after seek and before seek + window_length, the next one starts step_size
+later and an empty window is all zeros and skips 5 seconds ahead. Stars are
+pyttanko's for each window as if it were its own map (within float
+rounding, see other_scripts/benchmark_strain_graph.py). Objects are expected
+in time order, as the .osu format has them.
+"""
+import math
+import numpy as np
+import pyttanko
+
+from cogs.osu.osu_utils import osu_file
+from cogs.osu.osu_utils.droid_strain import (
+    WEIGHT_SCALING, scaling, hitobject_arrays, spacing_arrays, spacing_weights)
+from pyttanko import DIFF_SPEED, DIFF_AIM, DECAY_BASE
+
+MAX_SPEED_BONUS = 45.0 # pyttanko's, droid uses 53
+EMPTY_SKIP = 5000 # ms skipped after an empty window
+
+
+class MapStrains:
+    """per object strains for one difficulty type, for the whole map"""
+    def __init__(self, difftype, time, hit, delta_time, distance,
+        prev_distance, prev_delta_time, angle):
+        self.base = DECAY_BASE[difftype]
+        self.time = time
+        self.elapsed = np.cumsum(delta_time) # with mods, for the decay
+
+        values, _ = spacing_weights(difftype, distance, delta_time,
+            prev_distance, prev_delta_time, angle, max_speed_bonus=MAX_SPEED_BONUS)
+        self.values = np.where(hit, values * WEIGHT_SCALING[difftype], 0.0)
+
+        # the second object of a window has no angle and nothing before
+        # the first, so its value is different from the one in the map
+        no_prev = np.zeros(len(time))
+        values, _ = spacing_weights(difftype, distance, delta_time,
+            no_prev, no_prev, np.full(len(time), np.nan),
+            max_speed_bonus=MAX_SPEED_BONUS)
+        self.first_values = np.where(hit, values * WEIGHT_SCALING[difftype], 0.0)
+
+        # strains over the whole map, each one depends on the previous one
+        decays = np.power(self.base, delta_time / 1000.0).tolist()
+        strains = [0.0]
+        strain = 0.0
+        for value, decay in zip(self.values.tolist()[1:], decays[1:]):
+            strain = strain * decay + value
+            strains.append(strain)
+        self.strains = np.array(strains)
+
+    def window_strains(self, start, end):
+        """strains of objects start..end - 1 as if start was the first object"""
+        second = start + 1
+        carried = self.strains[second] - self.first_values[second]
+        strains = self.strains[second:end] - carried * np.power(self.base,
+            (self.elapsed[second:end] - self.elapsed[second]) / 1000.0)
+        strains[0] = self.first_values[second]
+        return np.concatenate(([0.0], strains))
+
+    def difficulty(self, start, end, strain_step):
+        """weighted interval peaks for a window, same as diff_calc.calc_individual"""
+        DECAY_WEIGHT = 0.9
+        if end - start < 2: # first object doesn't generate a strain
+            return 0.0
+
+        time = self.time[start:end]
+        strains = self.window_strains(start, end)
+
+        first_interval = math.ceil(time[0] / strain_step)
+        intervals = np.maximum(
+            np.ceil(time[1:] / strain_step).astype(np.int64) - first_interval, 0)
+        peaks = np.zeros(int(intervals.max()) + 1)
+        np.maximum.at(peaks, intervals, strains[1:])
+
+        # every interval after the first starts at the last strain before it, decayed
+        if len(peaks) > 1:
+            interval_ends = (first_interval + np.arange(len(peaks) - 1)) * strain_step
+            prev = np.searchsorted(time, interval_ends, side='right') - 1
+            decayed = strains[prev] * np.power(self.base,
+                (interval_ends - time[prev]) / 1000.0)
+            peaks[1:] = np.maximum(peaks[1:], decayed)
+
+        peaks[::-1].sort()
+        return float(np.dot(peaks, np.power(DECAY_WEIGHT, np.arange(len(peaks)))))
+
+
+def windows(time, window_length=3000, step_size=500):
+    """(seek, start, end) object ranges, the same windows as chunks.chunks"""
+    seek = 0
+    start = 0
+    while start < len(time):
+        end = max(int(np.searchsorted(time, seek + window_length, side='left')), start)
+        yield seek, start, end
+        seek += step_size if end > start else EMPTY_SKIP
+        start = max(int(np.searchsorted(time, seek, side='right')), start)
+
+
+def chunks(bmap, mods=0, window_length=3000, step_size=500):
+    """
+    [{'time', 'stars', 'aim_stars', 'speed_stars'}] for each window, from a
+    .osu file path or a parsed pyttanko beatmap
+    """
+    STAR_SCALING_FACTOR = 0.0675
+    EXTREME_SCALING_FACTOR = 0.5
+
+    if isinstance(bmap, str):
+        bmap = osu_file.parse(bmap)
+    if not bmap.hitobjects:
+        return []
+
+    speed_mul, _, _, cs, _ = pyttanko.mods_apply(mods, cs=bmap.cs)
+    scaling_factor, playfield_center = scaling(cs)
+    time, objtype, x, y = hitobject_arrays(bmap, scaling_factor, playfield_center)
+    spacing = spacing_arrays(time, objtype, x, y, speed_mul)
+    strain_step = 400.0 * speed_mul
+
+    with np.errstate(invalid='ignore'):
+        speed_strains = MapStrains(DIFF_SPEED, time, *spacing)
+        aim_strains = MapStrains(DIFF_AIM, time, *spacing)
+
+    results = []
+    for seek, start, end in windows(time, window_length, step_size):
+        if end == start:
+            results.append({'time': seek, 'stars': 0, 'aim_stars': 0, 'speed_stars': 0})
+            continue
+        aim = math.sqrt(aim_strains.difficulty(start, end, strain_step)) * STAR_SCALING_FACTOR
+        speed = math.sqrt(speed_strains.difficulty(start, end, strain_step)) * STAR_SCALING_FACTOR
+        if mods & pyttanko.MODS_TOUCH_DEVICE:
+            aim = pow(aim, 0.8)
+        stars = aim + speed + abs(speed - aim) * EXTREME_SCALING_FACTOR
+        results.append({'time': seek, 'stars': stars,
+            'aim_stars': aim, 'speed_stars': speed})
+    return results
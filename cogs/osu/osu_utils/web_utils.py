@@ -18,7 +18,7 @@ import matplotlib.pyplot as plt
 import matplotlib.dates as mdates
 
 from utils.dataIO import dataIO, fileIO
-from cogs.osu.osu_utils.chunks import chunks
+from cogs.osu.osu_utils import owoSession, owoDisk
 
 from apiclient.discovery import build
 from apiclient.errors import HttpError
@@ -45,13 +45,12 @@ async def youtube_search(q, key, max_results=10, order="relevance"):
 
 async def get_web(url, session=None, parser = 'html.parser'):
     if not session:
-        async with aiohttp.ClientSession() as session:
-            async with session.get(url) as resp:
-                text = await resp.read()
-                try:
-                    return BeautifulSoup(text.decode('utf-8'), parser)
-                except:
-                    return BeautifulSoup(text, parser)
+        async with owoSession.get_manager().get(url) as resp:
+            text = await resp.read()
+            try:
+                return BeautifulSoup(text.decode('utf-8'), parser)
+            except:
+                return BeautifulSoup(text, parser)
     else:
         async with session.get(url) as resp:
             text = await resp.read()
@@ -63,18 +62,16 @@ async def get_web(url, session=None, parser = 'html.parser'):
 
 # asynchronously download the file
 async def download_file(url, filename):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            if resp.status == 200:
-                f = await aiofiles.open(filename, mode='wb')
-                await f.write(await resp.read())
-                await f.close()
+    async with owoSession.get_manager().get(url) as resp:
+        if resp.status == 200:
+            f = await aiofiles.open(filename, mode='wb')
+            await f.write(await resp.read())
+            await f.close()
 
 
 async def get_REST(url):
-    async with aiohttp.ClientSession() as session:
-        async with session.get(url) as resp:
-            return await resp.json()
+    async with owoSession.get_manager().get(url) as resp:
+        return await resp.json()
 
 async def get_beatmap_listing(map_type=None):
     config_data = fileIO("config.json", "load")
@@ -183,14 +180,6 @@ async def download_map_image_to_folder(mapset_id, session=None, limit=8000):
         break
         await asyncio.sleep(1)
 
-    # if too many
-    path, dirs, files = next(os.walk(folder))
-    file_count = len(files)
-    if file_count > limit:
-        delete_num = file_count - limit
-        for i in range(delete_num):
-            file = random.choice(files)
-            delete_file = f"{folder}/{file}"
-            if delete_file != file_path:
-                os.remove(delete_file)
+    # evicts the least recently used images past the folder quota
+    owoDisk.get_manager().add(file_path)
     return bg, bg_success
\ No newline at end of file
@@ -25,7 +25,7 @@ from discord.ext import commands
 
 from cogs.osu.osu import Osu
 from cogs.osu.osu_utils.owoAPI import owoAPI
-from cogs.osu.osu_utils import map_utils, utils, web_utils
+from cogs.osu.osu_utils import map_utils, utils, web_utils, owoLimiter
 
 from concurrent.futures import ProcessPoolExecutor
 
@@ -51,7 +51,8 @@ class Updater(commands.Cog):
         self.loop = asyncio.get_event_loop()
 
         # add map feed
-        self.loop.create_task(MapTracker(bot).map_feed())
+        with owoLimiter.lane('tracking'):
+            self.loop.create_task(MapTracker(bot).map_feed())
 
         
         # add tracking loops
@@ -68,11 +69,11 @@ class Updater(commands.Cog):
 
 
 class TopPlayTrackerPoll(Osu):
-    def __init__(self, bot, api, max_requests=30):
+    def __init__(self, bot, api, max_concurrent=10):
         self.bot = bot
-        self.max_requests = max_requests # per minute
-        self.cycle_time = 0
-        self.sleep_time = 0.01 # initial
+        self.max_concurrent = max_concurrent # players checked at once
+        self.check_semaphore = asyncio.Semaphore(max_concurrent)
+        self.min_cycle_time = 60 # seconds
         self.num_track = 100 # track all of them
         self.api = api
 
@@ -107,27 +108,26 @@ class TopPlayTrackerPoll(Osu):
             loop = asyncio.get_event_loop()
             relevant_players = await self._get_online_ids() #  list of osu ids that are relevant for the server alone!
             total_tracking = len(relevant_players) # counts total number of players
-            self.sleep_time = self.max_requests/60 # in seconds hardcoded
-            self.cycle_time = total_tracking/self.max_requests
 
-            print("INFO Total players: {} | Cycle Estimate: {} min | Sleep Time: {}".format(
-                len(relevant_players), str(self.cycle_time), str(self.sleep_time)))
+            print("INFO Total players: {} | Concurrent checks: {}".format(
+                total_tracking, self.max_concurrent))
 
-            for osu_id in relevant_players:
+            # requests are paced by the owoAPI limiter in the tracking lane
+            with owoLimiter.lane('tracking'):
+                for osu_id in relevant_players:
 
-                player = self.track.find_one({"osu_id":osu_id})
-                if not player:
-                    player = self.track.find_one({"username":osu_id})
+                    player = await self.track.find_one({"osu_id":osu_id})
+                    if not player:
+                        player = await self.track.find_one({"username":osu_id})
 
-                loop.create_task(self.check_plays(player)) # *** needs to be uncommented!
+                    await self.check_semaphore.acquire()
+                    loop.create_task(self._bounded_check_plays(player)) # *** needs to be uncommented!
 
-                print('Finished tracking', osu_id)
-                await asyncio.sleep(self.sleep_time)
+                    print('Finished tracking', osu_id)
 
-            if self.cycle_time * 60 < 60:
-                await asyncio.sleep(60 - self.cycle_time*60)
-            else:
-                pass
+            elapsed_seconds = (datetime.datetime.now() - current_time).total_seconds()
+            if elapsed_seconds < self.min_cycle_time:
+                await asyncio.sleep(self.min_cycle_time - elapsed_seconds)
 
             loop_time = datetime.datetime.now()
             elapsed_time = loop_time - current_time
@@ -148,6 +148,13 @@ class TopPlayTrackerPoll(Osu):
         return osu_id_list
 
 
+    async def _bounded_check_plays(self, player):
+        try:
+            await self.check_plays(player)
+        finally:
+            self.check_semaphore.release()
+
+
     async def check_plays(self, player, api='bancho'):
         if player and 'osu_id' in player:
             osu_id = player['osu_id']
@@ -191,7 +198,6 @@ class TopPlayTrackerPoll(Osu):
                     play = best_plays[i]
 
                     play_map = await self.owoAPI.get_beatmap(play['beatmap_id'])
-                    await asyncio.sleep(1)
                     new_user_info = await self.owoAPI.get_user(osu_id, 
                         mode=gamemode_number, api='bancho') # disable cache necessary? **
                     new_user_info = new_user_info[0]
@@ -253,8 +259,6 @@ class TopPlayTrackerPoll(Osu):
                     if new_play_obj:
                         await self.send_play(new_play_obj)
 
-                    await asyncio.sleep(1)
-
 
     async def _fetch_new(self, osu_id, player_servers):
         new_data = {"best":{}, "recent":{}}
@@ -263,8 +267,8 @@ class TopPlayTrackerPoll(Osu):
 
         for mode in required_modes:
             # new_data["best"][mode] = {}
-            new_data["best"][mode] = await self.owoAPI.get_user_best(osu_id, mode=gamemode, use_cache=False)
-            await asyncio.sleep(1)
+            new_data["best"][mode] = await self.owoAPI.get_user_best(osu_id, 
+                mode=utils.get_gamemode_number(mode), use_cache=False)
 
         return new_data, required_modes
 
@@ -281,7 +285,7 @@ class TopPlayTrackerPoll(Osu):
         required_modes = list(set(required_modes))
         required_modes_list = []
         for mode_num in required_modes:
-            required_modes_list.append(int(self.MODES[mode_num]))
+            required_modes_list.append(self.MODES[int(mode_num)])
         return required_modes_list
 
 
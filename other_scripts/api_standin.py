@@ -0,0 +1,255 @@
+"""
+Local stand-in for the osu! apis (official v1/v2, gatari, ripple family, droid)
+so owoAPI and the tracker can be load tested without touching the real servers.
+
+owoAPI sends https://host/path?query to {stand-in}/https/host/path?query when
+settings.osu.api_standin is enabled (see SessionManager.standin_uri).
+
+    # capture real responses into fixtures (passes requests through)
+    python other_scripts/api_standin.py --record
+
+    # replay them with 80ms +- 30ms latency and 2% 502s
+    python other_scripts/api_standin.py --latency 0.08 --jitter 0.03 --error-rate 0.02
+
+Replay looks for the exact request first, then any fixture for the same path,
+then any fixture whose path matches once numbers are ignored, so a handful of
+recorded users/maps can stand in for any id.
+"""
+import os
+import re
+import json
+import time
+import base64
+import random
+import asyncio
+import hashlib
+import argparse
+import collections
+from urllib.parse import parse_qsl, urlencode
+
+import aiohttp
+from aiohttp import web
+
+FIXTURE_FOLDER = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'standin_fixtures')
+
+# query params that identify us rather than the request
+SECRET_PARAMS = ['k', 'key', 'apiKey', 'client_id', 'client_secret', 'password', 'username']
+TEXT_TYPES = ['application/json', 'text/']
+
+
+class FixtureStore:
+    def __init__(self, folderpath):
+        self.folderpath = folderpath
+        self.exact = {}
+        self.by_path = collections.defaultdict(list)
+        self.by_pattern = collections.defaultdict(list)
+        self.load()
+
+    @staticmethod
+    def public_query(query):
+        """query string without SECRET_PARAMS"""
+        return urlencode([(key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+            if key not in SECRET_PARAMS])
+
+    @staticmethod
+    def request_key(method, host, path, query):
+        params = sorted((key, value) for key, value in parse_qsl(query, keep_blank_values=True)
+            if key not in SECRET_PARAMS)
+        return '{} {}{}?{}'.format(method.upper(), host, path, urlencode(params))
+
+    @staticmethod
+    def path_key(method, host, path):
+        return '{} {}{}'.format(method.upper(), host, path)
+
+    @staticmethod
+    def pattern_key(method, host, path):
+        return '{} {}{}'.format(method.upper(), host, re.sub(r'[0-9]+', '{n}', path))
+
+    def load(self):
+        if not os.path.exists(self.folderpath):
+            return
+        for host in os.listdir(self.folderpath):
+            host_folder = os.path.join(self.folderpath, host)
+            if not os.path.isdir(host_folder):
+                continue
+            for filename in sorted(os.listdir(host_folder)):
+                if filename.endswith('.json'):
+                    with open(os.path.join(host_folder, filename)) as f:
+                        self.add(json.load(f))
+        print('Loaded {} fixtures from {}'.format(len(self.exact), self.folderpath))
+
+    def add(self, fixture):
+        method, host, path = fixture['method'], fixture['host'], fixture['path']
+        self.exact[self.request_key(method, host, path, fixture['query'])] = fixture
+        self.by_path[self.path_key(method, host, path)].append(fixture)
+        self.by_pattern[self.pattern_key(method, host, path)].append(fixture)
+
+    def find(self, method, host, path, query):
+        fixture = self.exact.get(self.request_key(method, host, path, query))
+        if fixture:
+            return fixture, 'exact'
+        fixtures = self.by_path.get(self.path_key(method, host, path))
+        if fixtures:
+            return random.choice(fixtures), 'path'
+        fixtures = self.by_pattern.get(self.pattern_key(method, host, path))
+        if fixtures:
+            return random.choice(fixtures), 'pattern'
+        return None, 'miss'
+
+    def save(self, fixture):
+        host_folder = os.path.join(self.folderpath, fixture['host'])
+        if not os.path.exists(host_folder):
+            os.makedirs(host_folder)
+        key = self.request_key(fixture['method'], fixture['host'],
+            fixture['path'], fixture['query'])
+        filename = '{}.json'.format(hashlib.sha1(key.encode()).hexdigest()[:16])
+        with open(os.path.join(host_folder, filename), 'w') as f:
+            json.dump(fixture, f)
+        self.add(fixture)
+
+
+class StandIn:
+    def __init__(self, store, record=False, latency=0.0, jitter=0.0,
+        error_rate=0.0, error_status=502, max_rpm=None):
+        self.store = store
+        self.record = record
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.max_rpm = max_rpm # per host, answers 429 above it
+
+        self.session = None
+        self.recent = collections.defaultdict(collections.deque) # host -> times
+        self.stats = collections.defaultdict(collections.Counter) # host -> outcome
+
+    async def handle(self, request):
+        scheme = request.match_info['scheme']
+        host = request.match_info['host']
+        path = '/' + request.match_info['path']
+        query = request.query_string
+        stats = self.stats[host]
+        stats['requests'] += 1
+
+        if self.max_rpm and self._over_limit(host):
+            stats['429'] += 1
+            return web.json_response({'error': 'rate limited'}, status=429)
+
+        if self.latency or self.jitter:
+            await asyncio.sleep(max(random.gauss(self.latency, self.jitter), 0))
+
+        if self.error_rate and random.random() < self.error_rate:
+            stats['injected_errors'] += 1
+            return web.json_response({'error': 'injected'}, status=self.error_status)
+
+        if self.record:
+            fixture = await self._record(request, scheme, host, path, query)
+            stats['recorded'] += 1
+        else:
+            fixture, match = self.store.find(request.method, host, path, query)
+            stats[match] += 1
+            if fixture is None:
+                if path.endswith('/oauth/token'):
+                    return web.json_response({'token_type': 'Bearer',
+                        'expires_in': 86400, 'access_token': 'standin'})
+                return web.json_response({'error': 'no fixture'}, status=404)
+
+        return self._response(fixture)
+
+    def _over_limit(self, host):
+        now = time.monotonic()
+        recent = self.recent[host]
+        while recent and now - recent[0] > 60:
+            recent.popleft()
+        recent.append(now)
+        return len(recent) > self.max_rpm
+
+    async def _record(self, request, scheme, host, path, query):
+        if self.session is None:
+            self.session = aiohttp.ClientSession()
+
+        uri = '{}://{}{}'.format(scheme, host, path)
+        if query:
+            uri += '?' + query
+        headers = {key: value for key, value in request.headers.items()
+            if key.lower() in ['authorization', 'content-type', 'accept']}
+        body = await request.read()
+
+        async with self.session.request(request.method, uri,
+            headers=headers, data=body or None) as resp:
+            content = await resp.read()
+            content_type = resp.headers.get('Content-Type', '')
+
+        fixture = {
+            'method': request.method,
+            'host': host,
+            'path': path,
+            'query': self.store.public_query(query), # no api keys on disk
+            'status': resp.status,
+            'content_type': content_type,
+            'recorded': time.time()
+        }
+        if any(text_type in content_type for text_type in TEXT_TYPES):
+            fixture['text'] = content.decode('utf-8', errors='replace')
+        else:
+            fixture['base64'] = base64.b64encode(content).decode()
+
+        # never write tokens to disk, replay hands out a fake one
+        if resp.status < 500 and not path.endswith('/oauth/token'):
+            self.store.save(fixture)
+        return fixture
+
+    def _response(self, fixture):
+        if 'text' in fixture:
+            body = fixture['text'].encode()
+        else:
+            body = base64.b64decode(fixture['base64'])
+        content_type = fixture['content_type'].split(';')[0] or 'application/octet-stream'
+        return web.Response(body=body, status=fixture['status'],
+            content_type=content_type)
+
+    async def handle_stats(self, request):
+        return web.json_response({host: dict(counter)
+            for host, counter in self.stats.items()})
+
+    async def close(self, app):
+        if self.session is not None:
+            await self.session.close()
+
+
+def make_app(standin):
+    app = web.Application(client_max_size=64 * 1024 ** 2)
+    app.router.add_get('/_standin/stats', standin.handle_stats)
+    app.router.add_route('*', '/{scheme:https?}/{host}/{path:.*}', standin.handle)
+    app.on_cleanup.append(standin.close)
+    return app
+
+
+def main():
+    parser = argparse.ArgumentParser(description='osu! api stand-in')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8088)
+    parser.add_argument('--fixtures', default=FIXTURE_FOLDER)
+    parser.add_argument('--record', action='store_true',
+        help='pass requests to the real apis and save the responses')
+    parser.add_argument('--latency', type=float, default=0.0, help='seconds')
+    parser.add_argument('--jitter', type=float, default=0.0, help='seconds (std dev)')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='0 to 1')
+    parser.add_argument('--error-status', type=int, default=502)
+    parser.add_argument('--max-rpm', type=int, default=None,
+        help='requests per minute per host before answering 429')
+    args = parser.parse_args()
+
+    store = FixtureStore(args.fixtures)
+    standin = StandIn(store, record=args.record,
+        latency=args.latency, jitter=args.jitter,
+        error_rate=args.error_rate, error_status=args.error_status,
+        max_rpm=args.max_rpm)
+
+    print('{} on http://{}:{}'.format(
+        'Recording' if args.record else 'Replaying', args.host, args.port))
+    web.run_app(make_app(standin), host=args.host, port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,112 @@
+"""
+Checks droid_strain.diff_calc against droid_pyttanko.diff_calc on every map
+and the difficulty mod combinations, then times both on the longest maps.
+--repeat tiles each map's hitobjects end to end to make marathon lengths.
+
+    python other_scripts/benchmark_droid_strain.py [--beatmaps cogs/osu/beatmaps/md5] [--limit 200]
+"""
+import os
+import sys
+import math
+import time
+import argparse
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+
+from cogs.osu.osu_utils import droid_pyttanko, droid_strain, difficulty_table, utils
+
+FIELDS = ['total', 'aim', 'speed', 'aim_difficulty', 'speed_difficulty',
+    'nsingles', 'nsingles_threshold']
+
+
+def parse(filepath):
+    with open(filepath, encoding='utf-8', errors='ignore') as f:
+        return droid_pyttanko.parser().map(f)
+
+
+def tile(bmap, repeat):
+    """the map's objects played `repeat` times in a row"""
+    if repeat <= 1 or not bmap.hitobjects:
+        return bmap
+    objs = list(bmap.hitobjects)
+    length = objs[-1].time - objs[0].time + 1000.0
+    for i in range(1, repeat):
+        for obj in objs:
+            bmap.hitobjects.append(droid_pyttanko.hitobject(
+                time=obj.time + i * length, objtype=obj.objtype, data=obj.data))
+    return bmap
+
+
+def compare(bmap, mods):
+    """largest relative difference over FIELDS, counts must match exactly"""
+    expected = droid_pyttanko.diff_calc().calc(bmap, mods)
+    result = droid_strain.diff_calc().calc(bmap, mods)
+    worst = 0.0
+    for field in FIELDS:
+        a, b = getattr(expected, field), getattr(result, field)
+        if isinstance(a, int):
+            assert a == b, (field, a, b)
+        else:
+            assert math.isfinite(b), (field, b)
+            worst = max(worst, abs(a - b) / max(abs(a), 1e-12))
+    return worst
+
+
+def best_time(calc, bmap, mods, rounds):
+    best = None
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        calc().calc(bmap, mods)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='droid strain backend check and benchmark')
+    parser.add_argument('--beatmaps', default=os.path.join(BOT_FOLDER, 'cogs', 'osu', 'beatmaps', 'md5'))
+    parser.add_argument('--limit', type=int, default=200)
+    parser.add_argument('--longest', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=4)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    filepaths = sorted(os.path.join(args.beatmaps, filename)
+        for filename in os.listdir(args.beatmaps) if filename.endswith('.osu'))[:args.limit]
+    bmaps = []
+    for filepath in filepaths:
+        bmap = parse(filepath)
+        if bmap.mode == droid_pyttanko.MODE_STD and len(bmap.hitobjects) > 2:
+            bmaps.append((filepath, bmap))
+    if not bmaps:
+        print('No std .osu files in', args.beatmaps)
+        return
+
+    # equivalence, every map with every difficulty mod combination (+HD)
+    worst = 0.0
+    for filepath, bmap in bmaps:
+        for mods in difficulty_table.MOD_COMBOS + [8, 72]:
+            difference = compare(bmap, utils.num_to_droid_mod(mods))
+            assert difference <= args.tolerance, (filepath, mods, difference)
+            worst = max(worst, difference)
+    print('{} maps x {} mods, worst relative difference {:.2e}\n'.format(
+        len(bmaps), len(difficulty_table.MOD_COMBOS) + 2, worst))
+
+    # timing on the longest maps
+    longest = sorted(bmaps, key=lambda item: len(item[1].hitobjects), reverse=True)
+    print('{:<40} {:>9} {:>12} {:>12} {:>8}'.format(
+        'map', 'objects', 'objects (ms)', 'arrays (ms)', 'speedup'))
+    for filepath, bmap in longest[:args.longest]:
+        bmap = tile(parse(filepath), args.repeat)
+        compare(bmap, '')
+        old = best_time(droid_pyttanko.diff_calc, bmap, '', args.rounds)
+        new = best_time(droid_strain.diff_calc, bmap, '', args.rounds)
+        print('{:<40} {:>9} {:>12.1f} {:>12.1f} {:>8.1f}'.format(
+            os.path.basename(filepath)[:40], len(bmap.hitobjects),
+            old * 1000, new * 1000, old / new))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,423 @@
+"""
+Checks the compiled response normalization against the old if-chain
+key_mapping/key_cleanup code for every api backend, then times both.
+
+    python other_scripts/benchmark_normalize.py [--scores 100] [--rounds 200]
+"""
+import os
+import sys
+import copy
+import json
+import time
+import datetime
+import argparse
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from cogs.osu.osu_utils import normalize, utils
+from cogs.osu.osu_utils.owoAPI import officialAPIv1, officialAPIv2, \
+    gatariAPI, rippleAPI, droidAPI
+
+
+# ----- old implementation -----
+def legacy_key_cleanup(obj_list, key_mapping, command=None):
+    new_obj_list = []
+
+    for sub_obj in obj_list:
+        new_sub_obj = {}
+        for obj_key in sub_obj.keys():
+            new_key = key_mapping(obj_key, command=command)
+            if new_key:
+                new_sub_obj[new_key] = sub_obj[obj_key]
+            else:
+                new_sub_obj[obj_key] = sub_obj[obj_key]
+        new_obj_list.append(new_sub_obj)
+
+    return new_obj_list
+
+
+def legacy_value_cleanup(obj_list, key_name, value_mapping):
+    for idx, sub_obj in enumerate(obj_list):
+        obj_list[idx] = value_mapping(sub_obj, key_name)
+
+    return obj_list
+
+
+def legacy_v1_keys(key_name, command=None):
+    if key_name == 'difficultyrating':
+        return 'difficulty_rating'
+    if key_name == 'diff_size':
+        return 'cs'
+    if key_name == 'diff_overall':
+        return 'od'
+    if key_name == 'diff_approach':
+        return 'ar'
+    if key_name == 'diff_drain':
+        return 'hp'
+    if key_name == 'count300':
+        return 'count_300'
+    if key_name == 'count100':
+        return 'count_100'
+    if key_name == 'count50':
+        return 'count_50'
+    if key_name == 'countmiss':
+        return 'count_miss'
+    if key_name == 'countkatu':
+        return 'count_katu'
+    if key_name == 'countgeki':
+        return 'count_geki'
+    if key_name == 'maxcombo':
+        return 'max_combo'
+    if key_name == 'approved':
+        return 'status'
+
+
+def legacy_v2_user_keys(key_name, command="get_user"):
+    if key_name == "id":
+        return "user_id"
+    if key_name == "play_count":
+        return "playcount"
+    if key_name == "play_time":
+        return "total_seconds_played"
+    if key_name == "hit_accuracy":
+        return "accuracy"
+    if key_name == "maximum_combo":
+        return "max_combo"
+    if key_name == "rankHistory":
+        return "rank_history"
+    if key_name == 'pp':
+        return 'pp_raw'
+
+
+def legacy_v2_beatmap_keys(key_name, command="get_beatmap"):
+    if key_name == "id":
+        return "beatmap_id"
+    if key_name == "accuracy":
+        return "od"
+    if key_name == "last_updated":
+        return "last_update"
+    if key_name == 'diff_drain':
+        return 'hp'
+    if key_name == 'drain':
+        return 'hp'
+
+
+def legacy_v2_beatmapset_keys(key_name, command="get_beatmapset"):
+    if key_name == "play_count":
+        return "playcount"
+    if key_name == "submitted_date":
+        return "submit_date"
+    if key_name == 'diff_drain':
+        return 'hp'
+    if key_name == 'drain':
+        return 'hp'
+
+
+def legacy_gatari_keys(key_name, command=None):
+    if key_name == "a_count":
+        return "count_rank_a"
+    if key_name == "s_count":
+        return "count_rank_s"
+    if key_name == "sh_count":
+        return "count_rank_sh"
+    if key_name == "x_count":
+        return "count_rank_ss"
+    if key_name == "xh_count":
+        return "count_rank_ssh"
+    if key_name == "count_gekis":
+        return "count_geki"
+    if key_name == "avg_accuracy":
+        return "accuracy"
+    if key_name == "id":
+        return "user_id"
+    if key_name == "playtime":
+        return "total_seconds_played"
+    if key_name == "pp" and command == "get_user":
+        return "pp_raw"
+    if key_name == "rank" and command not in ['get_scores']:
+        return "pp_rank"
+    if key_name == "country_rank":
+        return "pp_country_rank"
+    if key_name == "difficulty":
+        return "difficulty_rating"
+    if key_name == "userid":
+        return "user_id"
+    if key_name == "mods":
+        return "enabled_mods"
+    if key_name == "ranking":
+        return "rank"
+    if key_name == "time":
+        return "date"
+
+
+def legacy_ripple_keys(key_name, command=None):
+    if key_name == "global_leaderboard_rank":
+        return "pp_rank"
+    if key_name == "country_leaderboard_rank":
+        return "pp_country_rank"
+    if key_name == "pp" and command == "get_user":
+        return "pp_raw"
+    if key_name == "id" and command == "get_user":
+        return "user_id"
+    if key_name == "mods" and (
+        command in ["get_user_best", "get_user_recent", "get_scores"]):
+        return "enabled_mods"
+    if key_name == "time":
+        return "date"
+    if key_name == "play_mode":
+        return "mode"
+    if key_name == "difficultyrating":
+        return "difficulty_rating"
+    if key_name == 'diff_overall':
+        return "od"
+    if key_name == 'diff_approach':
+        return "ar"
+    if key_name == 'diff_drain':
+        return "hp"
+    if key_name == 'diff_size':
+        return "cs"
+    if key_name == "approved":
+        return "status"
+
+
+def legacy_droid_keys(key_name, command=None):
+    if key_name == "mark":
+        return "rank"
+    if key_name == "combo":
+        return "max_combo"
+    return key_name
+
+
+def legacy_fix_ranking_status(resp, key_name):
+    statuses = ['graveyard', 'WIP', 'pending', 'ranked',
+        'approved', 'qualified', 'loved']
+    if resp[key_name] in statuses:
+        resp[key_name] = statuses.index(resp[key_name]) - 2
+    return resp
+
+
+def legacy_fix_date(resp, key_name):
+    dt_obj = datetime.datetime.strptime(resp[key_name], '%Y-%m-%dT%H:%M:%S+00:00')
+    resp[key_name] = dt_obj.strftime('%Y-%m-%d %H:%M:%S')
+    return resp
+
+
+def legacy_fix_accuracy(resp, key_name):
+    resp[key_name] = resp[key_name] * 100
+    return resp
+
+
+def legacy_fix_score_keys(resp):
+    for play in resp:
+        play['enabled_mods'] = utils.mod_to_num(''.join(play['mods']))
+
+        play['date'] = play['created_at']
+        del play['created_at']
+        play = legacy_value_cleanup([play], 'date', legacy_fix_date)[0]
+
+        play = legacy_value_cleanup([play], 'accuracy', legacy_fix_accuracy)[0]
+
+        play.update(play['statistics'])
+        del play['statistics']
+
+        play['user'] = legacy_key_cleanup([play['user']],
+            legacy_v2_user_keys)[0]
+
+        play['beatmap'] = legacy_key_cleanup([play['beatmap']],
+            legacy_v2_beatmap_keys)[0]
+        play['beatmap'] = legacy_value_cleanup([play['beatmap']],
+            'status', legacy_fix_ranking_status)[0]
+
+        play['beatmap_id'] = play['beatmap']['beatmap_id']
+
+        play['beatmapset'] = legacy_key_cleanup([play['beatmapset']],
+            legacy_v2_beatmapset_keys)[0]
+        play['beatmapset'] = legacy_value_cleanup([play['beatmapset']],
+            'status', legacy_fix_ranking_status)[0]
+
+    return resp
+
+
+# ----- payloads -----
+def v1_score(idx):
+    return {
+        'beatmap_id': str(1000 + idx), 'score_id': str(idx), 'score': '1234567',
+        'maxcombo': '512', 'count50': '0', 'count100': '12', 'count300': '400',
+        'countmiss': '1', 'countkatu': '3', 'countgeki': '40', 'perfect': '0',
+        'enabled_mods': '24', 'user_id': '124493', 'date': '2020-01-01 10:00:00',
+        'rank': 'A', 'pp': '250.5', 'replay_available': '1'}
+
+
+def v1_beatmap(idx):
+    return {
+        'beatmapset_id': str(idx), 'beatmap_id': str(1000 + idx),
+        'approved': '1', 'total_length': '120', 'diff_size': '4',
+        'diff_overall': '8', 'diff_approach': '9', 'diff_drain': '6',
+        'mode': '0', 'difficultyrating': '5.43', 'title': 'song',
+        'artist': 'artist', 'version': 'Insane', 'max_combo': '512'}
+
+
+def v2_user(idx):
+    return {
+        'id': idx, 'username': 'player', 'country_code': 'US',
+        'play_count': 1000, 'play_time': 36000, 'hit_accuracy': 98.5,
+        'maximum_combo': 2000, 'rankHistory': {'data': [1, 2, 3]},
+        'pp': 6000.5, 'is_online': False}
+
+
+def v2_beatmap(idx):
+    return {
+        'id': 1000 + idx, 'beatmapset_id': idx, 'mode': 'osu',
+        'status': 'ranked', 'accuracy': 8, 'ar': 9, 'cs': 4, 'drain': 6,
+        'difficulty_rating': 5.43, 'last_updated': '2019-01-01T00:00:00+00:00',
+        'version': 'Insane', 'url': 'https://osu.ppy.sh/b/{}'.format(idx)}
+
+
+def v2_beatmapset(idx):
+    return {
+        'id': idx, 'artist': 'artist', 'title': 'song', 'creator': 'mapper',
+        'play_count': 50000, 'status': 'loved',
+        'submitted_date': '2018-01-01T00:00:00+00:00', 'covers': {}}
+
+
+def v2_score(idx):
+    return {
+        'id': idx, 'user_id': 124493, 'accuracy': 0.9812, 'mods': ['HD', 'DT'],
+        'score': 1234567, 'max_combo': 512, 'perfect': False, 'pp': 250.5,
+        'rank': 'A', 'created_at': '2020-01-0{}T10:00:00+00:00'.format(idx % 9 + 1),
+        'statistics': {'count_50': 0, 'count_100': 12, 'count_300': 400,
+            'count_geki': 40, 'count_katu': 3, 'count_miss': 1},
+        'beatmap': v2_beatmap(idx), 'beatmapset': v2_beatmapset(idx),
+        'user': v2_user(124493)}
+
+
+def gatari_user(idx):
+    return {
+        'id': idx, 'a_count': 1, 's_count': 2, 'sh_count': 3, 'x_count': 4,
+        'xh_count': 5, 'avg_accuracy': 98.1, 'playtime': 1000, 'pp': 5000,
+        'rank': 100, 'country_rank': 10, 'level': 99}
+
+
+def gatari_score(idx):
+    return {
+        'id': idx, 'beatmap': {'beatmap_id': 1000 + idx, 'difficulty': 5.1},
+        'count_gekis': 40, 'count_300': 400, 'mods': 24, 'ranking': 'A',
+        'rank': 12, 'time': 1577872800, 'userid': 124493, 'pp': 250.5}
+
+
+def ripple_user(idx):
+    return {
+        'id': idx, 'username': 'player', 'global_leaderboard_rank': 100,
+        'country_leaderboard_rank': 10, 'pp': 5000, 'play_mode': 0}
+
+
+def ripple_score(idx):
+    return {
+        'id': idx, 'beatmap_md5': 'abc', 'mods': 24, 'time': '2020-01-01T10:00:00Z',
+        'play_mode': 0, 'pp': 250.5, 'rank': 'A',
+        'beatmap': {'beatmap_id': 1000 + idx, 'difficultyrating': 5.1,
+            'diff_overall': 8, 'diff_approach': 9, 'diff_drain': 6,
+            'diff_size': 4, 'approved': 1}}
+
+
+def droid_score(idx):
+    return {
+        'id': idx, 'mark': 'A', 'combo': 512, 'score': 1234567,
+        'mods': 'HD', 'accuracy': 98.12, 'miss': 1}
+
+
+def cases(num_scores):
+    scores = range(num_scores)
+    ripple_keys = rippleAPI.key_mapping
+    v2 = officialAPIv2
+    return [
+        # name, payload, legacy key_mapping, new key_mapping, command
+        ('officialAPIv1 scores', [v1_score(i) for i in scores],
+            legacy_v1_keys, officialAPIv1.key_mapping, None),
+        ('officialAPIv1 beatmaps', [v1_beatmap(i) for i in scores],
+            legacy_v1_keys, officialAPIv1.key_mapping, None),
+        ('officialAPIv2 user', [v2_user(1)],
+            legacy_v2_user_keys, v2._get_user_key_mapping, None),
+        ('officialAPIv2 beatmaps', [v2_beatmap(i) for i in scores],
+            legacy_v2_beatmap_keys, v2._get_beatmap_key_mapping, None),
+        ('officialAPIv2 beatmapsets', [v2_beatmapset(i) for i in scores],
+            legacy_v2_beatmapset_keys, v2._get_beatmapset_key_mapping, None),
+        ('gatariAPI get_user', [gatari_user(1)],
+            legacy_gatari_keys, gatariAPI.key_mapping, 'get_user'),
+        ('gatariAPI get_user_best', [gatari_score(i) for i in scores],
+            legacy_gatari_keys, gatariAPI.key_mapping, 'get_user_best'),
+        ('gatariAPI get_scores', [gatari_score(i) for i in scores],
+            legacy_gatari_keys, gatariAPI.key_mapping, 'get_scores'),
+        ('rippleAPI get_user', [ripple_user(1)],
+            legacy_ripple_keys, ripple_keys, 'get_user'),
+        ('rippleAPI get_user_best', [ripple_score(i) for i in scores],
+            legacy_ripple_keys, ripple_keys, 'get_user_best'),
+        ('rippleAPI get_user_recent', [ripple_score(i) for i in scores],
+            legacy_ripple_keys, ripple_keys, 'get_user_recent'),
+        ('rippleAPI get_beatmap', [ripple_score(i)['beatmap'] for i in scores],
+            legacy_ripple_keys, ripple_keys, 'get_beatmap'),
+        ('droidAPI scores', [droid_score(i) for i in scores],
+            legacy_droid_keys, droidAPI.key_mapping, None),
+    ]
+
+
+# ----- run -----
+def same(first, second):
+    """equal, including key order"""
+    return json.dumps(first) == json.dumps(second)
+
+
+def timed(func, rounds):
+    start_time = time.perf_counter()
+    for _ in range(rounds):
+        func()
+    return (time.perf_counter() - start_time) / rounds
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--scores', type=int, default=100)
+    parser.add_argument('--rounds', type=int, default=200)
+    args = parser.parse_args()
+
+    print('json backend: {}'.format(
+        'orjson' if normalize.orjson is not None else 'json'))
+    print('{:<28} {:>12} {:>12} {:>8}'.format(
+        'backend', 'legacy (us)', 'compiled (us)', 'speedup'))
+
+    for name, payload, legacy_keys, new_keys, command in cases(args.scores):
+        legacy = legacy_key_cleanup(payload, legacy_keys, command=command)
+        compiled = normalize.key_cleanup(payload, new_keys, command=command)
+        assert same(legacy, compiled), name
+
+        legacy_time = timed(lambda: legacy_key_cleanup(
+            payload, legacy_keys, command=command), args.rounds)
+        compiled_time = timed(lambda: normalize.key_cleanup(
+            payload, new_keys, command=command), args.rounds)
+        print('{:<28} {:>12.1f} {:>12.1f} {:>7.1f}x'.format(name,
+            legacy_time * 1e6, compiled_time * 1e6, legacy_time / compiled_time))
+
+    # officialAPIv2 scores go through fix_score_keys as a whole
+    v2_api = officialAPIv2.__new__(officialAPIv2)
+    payload = [v2_score(i) for i in range(args.scores)]
+    legacy = legacy_fix_score_keys(copy.deepcopy(payload))
+    compiled = v2_api.fix_score_keys(copy.deepcopy(payload))
+    assert same(legacy, compiled), 'officialAPIv2 fix_score_keys'
+
+    copies = [copy.deepcopy(payload) for _ in range(args.rounds * 2)]
+    legacy_time = timed(lambda: legacy_fix_score_keys(copies.pop()), args.rounds)
+    compiled_time = timed(lambda: v2_api.fix_score_keys(copies.pop()), args.rounds)
+    print('{:<28} {:>12.1f} {:>12.1f} {:>7.1f}x'.format('officialAPIv2 scores',
+        legacy_time * 1e6, compiled_time * 1e6, legacy_time / compiled_time))
+
+    # response decoding
+    raw = json.dumps(payload).encode()
+    assert normalize.json_loads(raw) == json.loads(raw)
+    json_time = timed(lambda: json.loads(raw), args.rounds)
+    fast_time = timed(lambda: normalize.json_loads(raw), args.rounds)
+    print('{:<28} {:>12.1f} {:>12.1f} {:>7.1f}x'.format('json decode',
+        json_time * 1e6, fast_time * 1e6, json_time / fast_time))
+
+
+if __name__ == '__main__':
+    main()
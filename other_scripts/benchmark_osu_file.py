@@ -0,0 +1,105 @@
+"""
+Checks osu_file against pyttanko's parser on every .osu file (full beatmaps
+for pyttanko and droid_pyttanko, plus the difficulty and hitobject time fast
+paths), then times them.
+
+    python other_scripts/benchmark_osu_file.py [--beatmaps cogs/osu/beatmaps/md5] [--limit 500]
+"""
+import os
+import sys
+import time
+import argparse
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+
+import pyttanko
+from cogs.osu.osu_utils import osu_file, droid_pyttanko
+
+BEATMAP_FIELDS = ['mode', 'format_version', 'hp', 'cs', 'od', 'ar', 'sv', 'tick_rate',
+    'ncircles', 'nsliders', 'nspinners', 'title', 'title_unicode', 'artist',
+    'artist_unicode', 'creator', 'version']
+
+
+def parse_open(filepath, module=pyttanko):
+    with open(filepath, encoding='utf-8', errors='replace') as f:
+        return module.parser().map(f)
+
+
+def describe(bmap):
+    """everything the calculators read from a beatmap, comparable with =="""
+    fields = [getattr(bmap, field) for field in BEATMAP_FIELDS]
+    objects = []
+    for obj in bmap.hitobjects:
+        data = obj.data
+        objects.append((obj.time, obj.objtype) + ((None,) if data is None else
+            (data.pos.x, data.pos.y, getattr(data, 'repetitions', None),
+            getattr(data, 'distance', None))))
+    timing_points = [(point.time, point.ms_per_beat, point.change)
+        for point in bmap.timing_points]
+    return fields, objects, timing_points
+
+
+def check(filepath):
+    for module in [pyttanko, droid_pyttanko]:
+        expected = parse_open(filepath, module)
+        assert describe(expected) == describe(osu_file.parse(filepath, module)), \
+            (filepath, module.__name__)
+
+    with osu_file.OsuFile(filepath) as osu:
+        difficulty = osu.difficulty()
+        for field, value in difficulty.items():
+            assert getattr(expected, field) == value, (filepath, field)
+        assert osu.mode() == expected.mode, filepath
+        if expected.mode == pyttanko.MODE_STD:
+            assert osu.hitobject_times().tolist() == \
+                [obj.time for obj in expected.hitobjects], filepath
+
+
+def best_time(func, filepaths, rounds):
+    best = None
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        for filepath in filepaths:
+            func(filepath)
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def difficulty(filepath):
+    with osu_file.OsuFile(filepath) as osu:
+        return osu.difficulty()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='lazy .osu parser check and benchmark')
+    parser.add_argument('--beatmaps', default=os.path.join(BOT_FOLDER, 'cogs', 'osu', 'beatmaps', 'md5'))
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    args = parser.parse_args()
+
+    filepaths = sorted(os.path.join(args.beatmaps, filename)
+        for filename in os.listdir(args.beatmaps) if filename.endswith('.osu'))[:args.limit]
+    if not filepaths:
+        print('No .osu files in', args.beatmaps)
+        return
+
+    for filepath in filepaths:
+        check(filepath)
+    print('{} files match pyttanko\'s parser\n'.format(len(filepaths)))
+
+    parse = best_time(parse_open, filepaths, args.rounds)
+    print('{:<28} {:>12} {:>9}'.format('', 'per map (ms)', 'speedup'))
+    for name, func in [
+        ('pyttanko parser', parse_open),
+        ('osu_file full', osu_file.parse),
+        ('osu_file difficulty', difficulty),
+        ('osu_file hitobject times', osu_file.hitobject_times)]:
+        elapsed = parse if func is parse_open else best_time(func, filepaths, args.rounds)
+        print('{:<28} {:>12.3f} {:>9.1f}'.format(
+            name, elapsed * 1000 / len(filepaths), parse / elapsed))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Compares the parsed beatmap cache formats: the old pickled pyttanko objects
+against parsed_beatmap (.owob). Checks that stars/pp come out the same from
+both, then times loading and measures RSS of a process holding every map.
+
+    python other_scripts/benchmark_parsed_beatmap.py [--beatmaps cogs/osu/beatmaps] [--limit 500]
+"""
+import os
+import sys
+import time
+import pickle
+import argparse
+import resource
+import tempfile
+import subprocess
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+
+import pyttanko
+from cogs.osu.osu_utils import parsed_beatmap
+
+FORMATS = {
+    'pickle': '.pkl',
+    'owob': parsed_beatmap.EXTENSION
+}
+
+
+def load_file(fmt, filepath):
+    if fmt == 'pickle':
+        with open(filepath, 'rb') as f:
+            return pickle.load(f)
+    return parsed_beatmap.load(filepath)
+
+
+def calc(bmap, mods=0):
+    stars = pyttanko.diff_calc().calc(bmap, mods=mods)
+    n300, n100, n50 = pyttanko.acc_round(98, len(bmap.hitobjects), 0)
+    pp = pyttanko.ppv2(stars.aim, stars.speed, bmap=bmap, mods=mods,
+        n300=n300, n100=n100, n50=n50, nmiss=0, combo=bmap.max_combo())[0]
+    return stars.total, pp, bmap.max_combo()
+
+
+def write_files(osu_filepaths, folderpath):
+    sizes = {fmt: 0 for fmt in FORMATS}
+    for osu_filepath in osu_filepaths:
+        with open(osu_filepath, encoding='utf-8', errors='ignore') as f:
+            bmap = pyttanko.parser().map(f)
+        name = os.path.splitext(os.path.basename(osu_filepath))[0]
+
+        pickle_filepath = os.path.join(folderpath, name + FORMATS['pickle'])
+        with open(pickle_filepath, 'wb') as f:
+            pickle.dump(bmap, f)
+        owob_filepath = os.path.join(folderpath, name + FORMATS['owob'])
+        parsed_beatmap.dump(bmap, owob_filepath)
+
+        sizes['pickle'] += os.path.getsize(pickle_filepath)
+        sizes['owob'] += os.path.getsize(owob_filepath)
+
+        for mods in [0, 16, 64]:
+            expected = calc(load_file('pickle', pickle_filepath), mods)
+            result = calc(load_file('owob', owob_filepath), mods)
+            assert result == expected, (osu_filepath, mods, expected, result)
+    return sizes
+
+
+def child_rss(fmt, folderpath):
+    """max rss (kb) of a fresh process after loading every map and keeping it"""
+    output = subprocess.check_output([sys.executable, os.path.abspath(__file__),
+        '--child', fmt, '--beatmaps', folderpath])
+    return [int(value) for value in output.split()]
+
+
+def run_child(fmt, folderpath):
+    before = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    kept = [load_file(fmt, os.path.join(folderpath, filename))
+        for filename in os.listdir(folderpath) if filename.endswith(FORMATS[fmt])]
+    after = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    print(before, after, len(kept))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='parsed beatmap format benchmark')
+    parser.add_argument('--beatmaps', default=os.path.join(BOT_FOLDER, 'cogs', 'osu', 'beatmaps'))
+    parser.add_argument('--limit', type=int, default=500)
+    parser.add_argument('--rounds', type=int, default=3)
+    parser.add_argument('--child', default=None, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child, args.beatmaps)
+        return
+
+    osu_filepaths = sorted(os.path.join(args.beatmaps, filename)
+        for filename in os.listdir(args.beatmaps) if filename.endswith('.osu'))
+    osu_filepaths = osu_filepaths[:args.limit]
+    if not osu_filepaths:
+        print('No .osu files in', args.beatmaps)
+        return
+
+    with tempfile.TemporaryDirectory() as folderpath:
+        sizes = write_files(osu_filepaths, folderpath)
+        print('{} maps, stars/pp/combo identical for both formats\n'.format(
+            len(osu_filepaths)))
+
+        print('{:<8} {:>10} {:>12} {:>12} {:>14}'.format(
+            'format', 'size (kb)', 'load (ms)', 'per map (ms)', 'rss kept (mb)'))
+        for fmt, extension in FORMATS.items():
+            filepaths = [os.path.join(folderpath, filename)
+                for filename in os.listdir(folderpath) if filename.endswith(extension)]
+
+            best = None
+            for _ in range(args.rounds):
+                start_time = time.perf_counter()
+                for filepath in filepaths:
+                    load_file(fmt, filepath)
+                elapsed = time.perf_counter() - start_time
+                best = elapsed if best is None else min(best, elapsed)
+
+            before, after, _ = child_rss(fmt, folderpath)
+            print('{:<8} {:>10.0f} {:>12.1f} {:>12.3f} {:>14.1f}'.format(
+                fmt, sizes[fmt] / 1024, best * 1000, best * 1000 / len(filepaths),
+                (after - before) / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,175 @@
+"""
+Checks strain_graph.chunks against the temporary file loop of chunks.chunks
+(with pyttanko doing the difficulty of each window, as pyoppai isn't
+around anymore) on every map and the difficulty mod combinations, then
+times both on the longest maps. --repeat tiles each map's hitobjects end to
+end to make marathon lengths. If pyoppai is installed chunks.chunks itself
+is timed as well.
+
+    python other_scripts/benchmark_strain_graph.py [--beatmaps cogs/osu/beatmaps/md5] [--limit 50]
+"""
+import os
+import sys
+import math
+import time
+import argparse
+import tempfile
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+
+import pyttanko
+from cogs.osu.osu_utils import strain_graph, difficulty_table
+
+try:
+    from cogs.osu.osu_utils import chunks as oppai_chunks
+except (ImportError, RuntimeError):
+    oppai_chunks = None
+
+FIELDS = ['stars', 'aim_stars', 'speed_stars']
+
+
+def read(filepath):
+    with open(filepath, encoding='utf-8', errors='ignore') as f:
+        lines = f.readlines()
+    index = [i for i, line in enumerate(lines) if line.startswith('[HitObjects]')][0]
+    return lines[:index + 1], [line for line in lines[index + 1:] if line.strip()]
+
+
+def tile(head, hitobjects, repeat):
+    """the map's objects played `repeat` times in a row, as .osu lines"""
+    if repeat <= 1 or not hitobjects:
+        return head, hitobjects
+    times = [int(float(line.split(',')[2])) for line in hitobjects]
+    length = times[-1] - times[0] + 1000
+    tiled = []
+    for i in range(repeat):
+        for line, obj_time in zip(hitobjects, times):
+            parts = line.split(',')
+            parts[2] = str(obj_time + i * length)
+            tiled.append(','.join(parts))
+    return head, tiled
+
+
+def write(head, hitobjects, filepath):
+    with open(filepath, 'w', encoding='utf-8') as f:
+        f.write(''.join(head + hitobjects))
+
+
+def temp_file_chunks(head, hitobjects, mods=0, window_length=3000, step_size=500):
+    """chunks.chunks, a temporary .osu per window, parsed and calculated by pyttanko"""
+    results = []
+    seek = 0
+    with tempfile.TemporaryDirectory() as tmpdir:
+        while hitobjects:
+            window = [x for x in hitobjects
+                if int(x.split(',')[2]) < seek + window_length]
+            if len(window) == 0:
+                results.append({'time': seek, 'stars': 0, 'speed_stars': 0, 'aim_stars': 0})
+                seek = seek + 5000
+                hitobjects = [x for x in hitobjects
+                    if int(x.split(',')[2]) > seek]
+                continue
+            filepath = os.path.join(tmpdir, 'tmp.osu')
+            write(head, window, filepath)
+            with open(filepath, encoding='utf-8') as f:
+                bmap = pyttanko.parser().map(f)
+            try:
+                stars = pyttanko.diff_calc().calc(bmap, mods)
+                results.append({'time': seek, 'stars': stars.total,
+                    'aim_stars': stars.aim, 'speed_stars': stars.speed})
+            except ValueError: # no strain at all (one object), log10(0)
+                results.append({'time': seek, 'stars': 0, 'speed_stars': 0, 'aim_stars': 0})
+
+            seek = seek + step_size
+            hitobjects = [x for x in hitobjects
+                if int(x.split(',')[2]) > seek]
+    return results
+
+
+def compare(expected, result):
+    """
+    largest difference over FIELDS, relative above 1 star. windows with next
+    to no strain come back as the square root of rounding noise here (and
+    as 0 there, pyttanko can't do them), windows must match exactly
+    """
+    assert [chunk['time'] for chunk in expected] == \
+        [chunk['time'] for chunk in result], 'windows differ'
+    worst = 0.0
+    for a, b in zip(expected, result):
+        for field in FIELDS:
+            assert math.isfinite(b[field]), (field, b)
+            worst = max(worst, abs(a[field] - b[field]) / max(abs(a[field]), 1.0))
+    return worst
+
+
+def best_time(func, rounds):
+    best = None
+    for _ in range(rounds):
+        start_time = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start_time
+        best = elapsed if best is None else min(best, elapsed)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='strain graph check and benchmark')
+    parser.add_argument('--beatmaps', default=os.path.join(BOT_FOLDER, 'cogs', 'osu', 'beatmaps', 'md5'))
+    parser.add_argument('--limit', type=int, default=50)
+    parser.add_argument('--longest', type=int, default=5)
+    parser.add_argument('--repeat', type=int, default=2)
+    parser.add_argument('--rounds', type=int, default=2)
+    parser.add_argument('--tolerance', type=float, default=1e-6)
+    args = parser.parse_args()
+
+    filepaths = sorted(os.path.join(args.beatmaps, filename)
+        for filename in os.listdir(args.beatmaps) if filename.endswith('.osu'))[:args.limit]
+    maps = []
+    for filepath in filepaths:
+        with open(filepath, encoding='utf-8', errors='ignore') as f:
+            bmap = pyttanko.parser().map(f)
+        if bmap.mode == pyttanko.MODE_STD and len(bmap.hitobjects) > 2:
+            maps.append((filepath, bmap))
+    if not maps:
+        print('No std .osu files in', args.beatmaps)
+        return
+
+    # equivalence, every map with every difficulty mod combination
+    worst = 0.0
+    windows = 0
+    for filepath, bmap in maps:
+        head, hitobjects = read(filepath)
+        for mods in difficulty_table.MOD_COMBOS:
+            expected = temp_file_chunks(head, hitobjects, mods)
+            difference = compare(expected, strain_graph.chunks(bmap, mods))
+            assert difference <= args.tolerance, (filepath, mods, difference)
+            worst = max(worst, difference)
+            windows += len(expected)
+    print('{} maps x {} mods ({} windows), worst difference {:.2e}\n'.format(
+        len(maps), len(difficulty_table.MOD_COMBOS), windows, worst))
+
+    # timing on the longest maps, both from the .osu file
+    longest = sorted(maps, key=lambda item: len(item[1].hitobjects), reverse=True)
+    print('{:<40} {:>9} {:>14} {:>12} {:>8}{}'.format(
+        'map', 'objects', 'temp files (ms)', 'graph (ms)', 'speedup',
+        ' {:>12}'.format('pyoppai (ms)') if oppai_chunks else ''))
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for filepath, _ in longest[:args.longest]:
+            head, hitobjects = tile(*read(filepath), args.repeat)
+            tiled_filepath = os.path.join(tmpdir, os.path.basename(filepath))
+            write(head, hitobjects, tiled_filepath)
+
+            old = best_time(lambda: temp_file_chunks(head, hitobjects), args.rounds)
+            new = best_time(lambda: strain_graph.chunks(tiled_filepath), args.rounds)
+            line = '{:<40} {:>9} {:>14.1f} {:>12.1f} {:>8.1f}'.format(
+                os.path.basename(filepath)[:40], len(hitobjects),
+                old * 1000, new * 1000, old / new)
+            if oppai_chunks:
+                oppai = best_time(lambda: oppai_chunks.chunks(tiled_filepath), args.rounds)
+                line += ' {:>12.1f}'.format(oppai * 1000)
+            print(line)
+
+
+if __name__ == '__main__':
+    main()
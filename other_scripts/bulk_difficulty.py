@@ -0,0 +1,278 @@
+"""
+Difficulty for every std .osu in a beatmap folder (a data.ppy.sh dump, see
+update_beatmaps.sh), ahead of anyone asking for the maps.
+
+Each map gets the difficulty_table rows (std and droid stars, modded
+ar/od/cs/hp, max combo for the 9 EZ/HR x DT/HT combinations) and std pp at
+--accs for each combination. TD plays aren't in the table (difficulty_table
+leaves them to diff_calc). Results go to a columnar .npz and, unless
+--no-mongo, to the beatmap_difficulty collection (by md5), where the bot
+picks the table up for parsed beatmaps that don't have their sidecar yet.
+
+Incremental and resumable: files whose path, size and mtime didn't change
+are skipped without reading them, files are hashed otherwise and known
+md5s are skipped, and the .npz is rewritten every --save-every maps, so an
+interrupted run carries on from its last save. Maps that failed are only
+tried again with --retry-failed. An .npz from another difficulty_table
+VERSION is thrown away and every map computed (and stored) again, the bot
+refuses stored tables of other versions in the meantime.
+
+    python other_scripts/bulk_difficulty.py [--beatmaps cogs/osu/beatmaps] [--workers 4] [--no-mongo]
+"""
+import os
+import sys
+import time
+import argparse
+import multiprocessing
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+os.chdir(BOT_FOLDER)
+
+import numpy as np
+import pyttanko
+
+from cogs.osu.osu_utils import difficulty_table, parsed_beatmap, osu_file
+from cogs.osu.osu_utils.owoStore import file_md5, read_beatmap_id
+
+MOD_COMBOS = difficulty_table.MOD_COMBOS
+ROW_FIELDS = ['stars', 'aim', 'speed'] # per kind and mod combination
+STAT_FIELDS = ['ar', 'od', 'cs', 'hp'] # std, per mod combination
+
+
+# ----- worker -----
+def compute_map(job):
+    """(md5, beatmap_id, table, pp) for one .osu, table is None if it failed"""
+    filepath, md5, beatmap_id, accs = job
+    try:
+        bmap = osu_file.parse(filepath)
+        if bmap.mode != pyttanko.MODE_STD or not bmap.hitobjects:
+            return md5, beatmap_id, None, 'not a std map'
+        table = difficulty_table.compute(parsed_beatmap.ParsedBeatmap.from_pyttanko(bmap))
+
+        pp = []
+        for mods in MOD_COMBOS:
+            row = table['std'][str(mods)]
+            mod_pp = []
+            for acc in accs:
+                n300, n100, n50 = pyttanko.acc_round(acc, len(bmap.hitobjects), 0)
+                mod_pp.append(float(pyttanko.ppv2(row['aim'], row['speed'], bmap=bmap,
+                    mods=mods, n300=n300, n100=n100, n50=n50)[0]))
+            pp.append(mod_pp)
+        return md5, beatmap_id, table, pp
+    except Exception as e:
+        return md5, beatmap_id, None, str(e)
+
+
+# ----- columnar results -----
+class Results:
+    """the .npz, one row per md5"""
+    def __init__(self, accs):
+        self.accs = list(accs)
+        self.rows = {} # md5 -> row dict
+        self.files = {} # relative path -> (size, mtime_ns, md5)
+        self.failed = {} # md5 -> relative path
+
+    @classmethod
+    def load(cls, filepath, accs):
+        results = cls(accs)
+        if not os.path.exists(filepath):
+            return results
+        with np.load(filepath) as saved:
+            if int(saved['version']) != difficulty_table.VERSION or \
+                saved['accs'].tolist() != results.accs or \
+                saved['mods'].tolist() != MOD_COMBOS:
+                print('{} is from another version or other accs, starting over'.format(filepath))
+                return results
+
+            for i, md5 in enumerate(saved['md5'].tolist()):
+                row = {'beatmap_id': int(saved['beatmap_id'][i]),
+                    'max_combo': int(saved['max_combo'][i]),
+                    'pp': saved['pp'][i].tolist()}
+                for kind in ['std', 'droid']:
+                    for field in ROW_FIELDS:
+                        name = '{}_{}'.format(kind, field)
+                        row[name] = saved[name][i].tolist()
+                for field in STAT_FIELDS:
+                    row[field] = saved[field][i].tolist()
+                results.rows[md5] = row
+            for path, size, mtime_ns, md5 in zip(saved['path'].tolist(),
+                saved['size'].tolist(), saved['mtime_ns'].tolist(), saved['file_md5'].tolist()):
+                results.files[path] = (size, mtime_ns, md5)
+            results.failed = dict(zip(saved['failed_md5'].tolist(),
+                saved['failed_path'].tolist()))
+        return results
+
+    def add(self, md5, beatmap_id, table, pp):
+        row = {'beatmap_id': int(beatmap_id or 0), 'pp': pp,
+            'max_combo': table['std'][str(MOD_COMBOS[0])]['max_combo']}
+        for kind in ['std', 'droid']:
+            for field in ROW_FIELDS:
+                row['{}_{}'.format(kind, field)] = [
+                    table[kind][str(mods)][field] for mods in MOD_COMBOS]
+        for field in STAT_FIELDS:
+            row[field] = [table['std'][str(mods)][field] for mods in MOD_COMBOS]
+        self.rows[md5] = row
+        self.failed.pop(md5, None)
+
+    def save(self, filepath):
+        md5s = sorted(self.rows)
+        rows = [self.rows[md5] for md5 in md5s]
+        columns = {
+            'version': np.array(difficulty_table.VERSION),
+            'mods': np.array(MOD_COMBOS, dtype=np.int64),
+            'accs': np.array(self.accs, dtype=float),
+            'md5': np.array(md5s, dtype='<U32'),
+            'beatmap_id': np.array([row['beatmap_id'] for row in rows], dtype=np.int64),
+            'max_combo': np.array([row['max_combo'] for row in rows], dtype=np.int64),
+            'pp': np.array([row['pp'] for row in rows], dtype=float).reshape(
+                len(rows), len(MOD_COMBOS), len(self.accs))
+        }
+        for name in ['{}_{}'.format(kind, field)
+            for kind in ['std', 'droid'] for field in ROW_FIELDS] + STAT_FIELDS:
+            columns[name] = np.array([row[name] for row in rows],
+                dtype=float).reshape(len(rows), len(MOD_COMBOS))
+
+        paths = sorted(self.files)
+        columns['path'] = np.array(paths, dtype=str)
+        columns['size'] = np.array([self.files[path][0] for path in paths], dtype=np.int64)
+        columns['mtime_ns'] = np.array([self.files[path][1] for path in paths], dtype=np.int64)
+        columns['file_md5'] = np.array([self.files[path][2] for path in paths], dtype='<U32')
+        columns['failed_md5'] = np.array(list(self.failed), dtype='<U32')
+        columns['failed_path'] = np.array(list(self.failed.values()), dtype=str)
+
+        temp_filepath = '{}.tmp.npz'.format(filepath)
+        np.savez_compressed(temp_filepath, **columns)
+        os.replace(temp_filepath, filepath)
+
+
+# ----- mongo -----
+def mongo_document(md5, beatmap_id, table, pp, accs):
+    return {
+        '_id': md5,
+        'beatmap_id': str(beatmap_id) if beatmap_id else None,
+        'table': table,
+        'accs': list(accs),
+        'pp': {str(mods): mod_pp for mods, mod_pp in zip(MOD_COMBOS, pp)},
+        'computed_date': time.time()
+    }
+
+
+def write_mongo(collection, documents):
+    from pymongo import ReplaceOne
+    if collection is not None and documents:
+        collection.bulk_write([ReplaceOne({'_id': document['_id']}, document, upsert=True)
+            for document in documents], ordered=False)
+    documents.clear()
+
+
+# ----- walking the folder -----
+def find_jobs(beatmaps_folderpath, results, accs, retry_failed=False):
+    """(jobs, files seen, skipped) for the .osu files that need computing"""
+    jobs, seen, queued = [], 0, set()
+    skipped = {'unchanged': 0, 'known': 0, 'failed': 0}
+    for folderpath, _, filenames in os.walk(beatmaps_folderpath):
+        for filename in filenames:
+            if not filename.endswith('.osu'):
+                continue
+            seen += 1
+            filepath = os.path.join(folderpath, filename)
+            path = os.path.relpath(filepath, beatmaps_folderpath)
+            stat = os.stat(filepath)
+            known = results.files.get(path)
+            if known and known[:2] == (stat.st_size, stat.st_mtime_ns) and \
+                known[2] in results.rows:
+                skipped['unchanged'] += 1
+                continue
+
+            with open(filepath, 'rb') as f:
+                data = f.read()
+            md5 = file_md5(data)
+            results.files[path] = (stat.st_size, stat.st_mtime_ns, md5)
+            if md5 in results.rows or md5 in queued:
+                skipped['known'] += 1
+                continue
+            if md5 in results.failed and not retry_failed:
+                skipped['failed'] += 1
+                continue
+
+            beatmap_id = os.path.splitext(filename)[0]
+            if not beatmap_id.isdigit():
+                beatmap_id = read_beatmap_id(data)
+            queued.add(md5)
+            jobs.append((filepath, md5, beatmap_id, accs))
+    return jobs, seen, skipped
+
+
+def main():
+    parser = argparse.ArgumentParser(description='bulk difficulty and pp for a beatmap folder')
+    parser.add_argument('--beatmaps', default=os.path.join('cogs', 'osu', 'beatmaps'))
+    parser.add_argument('--output', default=os.path.join('cogs', 'osu', 'cache', 'bulk_difficulty.npz'))
+    parser.add_argument('--workers', type=int, default=max(1, multiprocessing.cpu_count() - 1))
+    parser.add_argument('--accs', default='95,99,100')
+    parser.add_argument('--save-every', type=int, default=1000)
+    parser.add_argument('--limit', type=int, default=None)
+    parser.add_argument('--retry-failed', action='store_true')
+    parser.add_argument('--no-mongo', action='store_true')
+    parser.add_argument('--database', default='owo_database')
+    parser.add_argument('--port', type=int, default=27017)
+    args = parser.parse_args()
+
+    accs = [float(acc) for acc in args.accs.split(',')]
+    output_folderpath = os.path.dirname(args.output)
+    if output_folderpath and not os.path.exists(output_folderpath):
+        os.makedirs(output_folderpath)
+
+    collection = None
+    if not args.no_mongo:
+        from pymongo import MongoClient
+        collection = MongoClient(port=args.port)[args.database]['beatmap_difficulty']
+
+    results = Results.load(args.output, accs)
+    start_time = time.monotonic()
+    jobs, seen, skipped = find_jobs(args.beatmaps, results, accs,
+        retry_failed=args.retry_failed)
+    jobs = jobs[:args.limit]
+    print('{} .osu files, {} to compute ({} unchanged, {} known md5, {} failed before), '
+        'scanned in {:.1f}s'.format(seen, len(jobs), skipped['unchanged'],
+        skipped['known'], skipped['failed'], time.monotonic() - start_time))
+    if not jobs:
+        results.save(args.output)
+        return
+
+    start_time = time.monotonic()
+    done, failed = 0, 0
+    documents = []
+    filepaths = {md5: filepath for filepath, md5, _, _ in jobs}
+
+    def save():
+        write_mongo(collection, documents)
+        results.save(args.output)
+        elapsed = time.monotonic() - start_time
+        print('{}/{} maps, {} failed, {:.1f} maps/s'.format(
+            done, len(jobs), failed, done / max(elapsed, 1e-9)))
+
+    pool = multiprocessing.Pool(args.workers)
+    try:
+        for md5, beatmap_id, table, pp in pool.imap_unordered(compute_map, jobs, chunksize=8):
+            done += 1
+            if table is None:
+                failed += 1
+                results.failed[md5] = os.path.relpath(filepaths[md5], args.beatmaps)
+            else:
+                results.add(md5, beatmap_id, table, pp)
+                if collection is not None:
+                    documents.append(mongo_document(md5, beatmap_id, table, pp, accs))
+            if done % args.save_every == 0:
+                save()
+        pool.close()
+    except KeyboardInterrupt: # keep what's done, the next run picks up from here
+        print('Interrupted, saving')
+        pool.terminate()
+    finally:
+        pool.join()
+        save()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,69 @@
+"""
+Space saved by compressed owoCache payloads, per collection, from what is
+in mongo now (owoAPI.get_cache_compression_usage covers writes since startup).
+
+    python other_scripts/cache_compression_report.py [--database owo_database]
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+os.chdir(BOT_FOLDER)
+
+import motor.motor_asyncio
+
+from cogs.osu.osu_utils.owoCache import owoCache, Cache
+
+
+async def collection_report(cache):
+    pipeline = [
+        {"$group": {
+            "_id": None,
+            "documents": {"$sum": 1},
+            "compressed": {"$sum": {"$cond": [{"$ifNull": ["$payload", False]}, 1, 0]}},
+            "raw_bytes": {"$sum": {"$ifNull": ["$raw_size", 0]}},
+            "stored_bytes": {"$sum": {"$cond": [
+                {"$ifNull": ["$payload", False]}, {"$binarySize": "$payload"}, 0]}},
+        }}
+    ]
+    report = {'documents': 0, 'compressed': 0, 'raw_bytes': 0, 'stored_bytes': 0}
+    async for row in cache.entries.aggregate(pipeline, allowDiskUse=True):
+        row.pop('_id')
+        report.update(row)
+
+    stats = await cache.database.command('collStats', cache.name)
+    report['size'] = stats.get('size', 0) # uncompressed bson, what the working set holds
+    report['storage_size'] = stats.get('storageSize', 0)
+    return report
+
+
+async def main(args):
+    client = motor.motor_asyncio.AsyncIOMotorClient(port=args.port)
+    cache = owoCache(client[args.database])
+
+    print('{:<30} {:>9} {:>11} {:>10} {:>10} {:>10} {:>7} {:>10}'.format(
+        'collection', 'docs', 'compressed', 'raw (mb)', 'stored', 'saved', 'ratio', 'bson (mb)'))
+    for collection_cache in cache.__dict__.values():
+        if not isinstance(collection_cache, Cache):
+            continue
+        if collection_cache.compress_threshold is None and not args.all:
+            continue
+        report = await collection_report(collection_cache)
+        raw, stored = report['raw_bytes'], report['stored_bytes']
+        print('{:<30} {:>9} {:>11} {:>10.1f} {:>10.1f} {:>10.1f} {:>7.2f} {:>10.1f}'.format(
+            collection_cache.name, report['documents'], report['compressed'],
+            raw / 1024**2, stored / 1024**2, (raw - stored) / 1024**2,
+            raw / stored if stored else 0, report['size'] / 1024**2))
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='owoCache compression report')
+    parser.add_argument('--database', default='owo_database')
+    parser.add_argument('--port', type=int, default=27017)
+    parser.add_argument('--all', action='store_true', help='include collections without compression')
+    args = parser.parse_args()
+
+    asyncio.get_event_loop().run_until_complete(main(args))
@@ -0,0 +1,119 @@
+"""
+Checks difficulty_table against diff_calc with the real mods: every mod
+combination the table answers for must give diff_calc's stars, TD plays must
+miss the table (diff_calc's aim ** 0.8 isn't in it), and tables from an
+older VERSION must be refused, as sidecars and as stored by
+other_scripts/bulk_difficulty.py.
+
+    python other_scripts/check_difficulty_table.py [--beatmaps cogs/osu/beatmaps/md5] [--limit 20]
+"""
+import os
+import sys
+import asyncio
+import argparse
+import tempfile
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+
+import pyttanko
+from cogs.osu.osu_utils import difficulty_table, parsed_beatmap, osu_file
+
+EXTRA_MODS = [0, pyttanko.MODS_HD, pyttanko.MODS_NC | pyttanko.MODS_DT,
+    pyttanko.MODS_TOUCH_DEVICE, pyttanko.MODS_TOUCH_DEVICE | pyttanko.MODS_HD]
+
+
+def check_map(filepath, tolerance):
+    """number of lookups checked, raises AssertionError on a wrong row"""
+    bmap = osu_file.parse(filepath)
+    table = difficulty_table.compute(parsed_beatmap.ParsedBeatmap.from_pyttanko(bmap))
+    checked = 0
+    for combo in difficulty_table.MOD_COMBOS:
+        for extra in EXTRA_MODS:
+            mods = combo | extra
+            if mods & pyttanko.MODS_DT and mods & pyttanko.MODS_HT: # NC on HT, not a play
+                continue
+            table_hit = difficulty_table.lookup(table, mods)
+            if mods & pyttanko.MODS_TOUCH_DEVICE:
+                assert table_hit is None, (filepath, mods, 'TD served from the table')
+                continue
+            assert table_hit is not None, (filepath, mods)
+            stars = pyttanko.diff_calc().calc(bmap, mods=mods)
+            for field in ['total', 'aim', 'speed']:
+                assert abs(getattr(table_hit[0], field) - getattr(stars, field)) <= tolerance, \
+                    (filepath, mods, field)
+            checked += 1
+    return checked
+
+
+def check_old_version(filepath):
+    """a table or sidecar from before VERSION is refused"""
+    bmap = osu_file.parse(filepath)
+    table = difficulty_table.compute(parsed_beatmap.ParsedBeatmap.from_pyttanko(bmap))
+    table['version'] = difficulty_table.VERSION - 1
+    assert difficulty_table.lookup(table, 0) is None, 'old table used by lookup'
+    with tempfile.TemporaryDirectory() as folderpath:
+        sidecar_filepath = os.path.join(folderpath, 'old' + difficulty_table.EXTENSION)
+        difficulty_table.dump(table, sidecar_filepath)
+        assert difficulty_table.load(sidecar_filepath) is None, 'old sidecar loaded'
+
+
+class StoredTables:
+    """stands in for the beatmap_difficulty collection, documents by _id"""
+    def __init__(self, documents):
+        self.documents = {document['_id']: document for document in documents}
+
+    async def find_one(self, query):
+        return self.documents.get(query['_id'])
+
+
+def check_stored_version(filepath):
+    """owoCache hands out bulk_difficulty tables of this VERSION only"""
+    from cogs.osu.osu_utils.owoCache import owoCache
+
+    bmap = osu_file.parse(filepath)
+    table = difficulty_table.compute(parsed_beatmap.ParsedBeatmap.from_pyttanko(bmap))
+    old_table = dict(table, version=difficulty_table.VERSION - 1)
+    cache = owoCache.__new__(owoCache) # only the collection is needed
+    cache.beatmap_difficulty = StoredTables([
+        {'_id': 'current', 'table': table}, {'_id': 'old', 'table': old_table}])
+
+    loop = asyncio.new_event_loop()
+    try:
+        assert loop.run_until_complete(cache.get_stored_difficulty('current')) == table, \
+            'current stored table refused'
+        assert loop.run_until_complete(cache.get_stored_difficulty('old')) is None, \
+            'old stored table used'
+    finally:
+        loop.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='difficulty table check')
+    parser.add_argument('--beatmaps', default=os.path.join(BOT_FOLDER, 'cogs', 'osu', 'beatmaps', 'md5'))
+    parser.add_argument('--limit', type=int, default=20)
+    parser.add_argument('--tolerance', type=float, default=1e-9)
+    args = parser.parse_args()
+
+    filepaths = []
+    for filename in sorted(os.listdir(args.beatmaps)):
+        filepath = os.path.join(args.beatmaps, filename)
+        if not filename.endswith('.osu'):
+            continue
+        with osu_file.OsuFile(filepath) as osu:
+            if osu.mode() == pyttanko.MODE_STD:
+                filepaths.append(filepath)
+    filepaths = filepaths[:args.limit]
+    if not filepaths:
+        print('No std .osu files in', args.beatmaps)
+        return
+
+    checked = sum(check_map(filepath, args.tolerance) for filepath in filepaths)
+    check_old_version(filepaths[0])
+    check_stored_version(filepaths[0])
+    print('{} maps, {} lookups match diff_calc, TD and old versions miss'.format(
+        len(filepaths), checked))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,157 @@
+"""
+Throughput of owoAPI and the tracker against other_scripts/api_standin.py.
+
+    python other_scripts/api_standin.py --latency 0.05 --jitter 0.02 &
+    python other_scripts/load_test.py --user-ids 124493,2558286 --ops 200 --concurrency 20
+
+Targets are get_user_best, _process_stats and TopPlayTrackerPoll.check_plays.
+Needs mongodb for the cache/track collections (database `owo_loadtest`).
+Requests still go through the owoAPI rate limiter, raise the budgets in
+settings.osu.rate_limits to measure raw throughput.
+"""
+import os
+import sys
+import copy
+import time
+import asyncio
+import argparse
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+os.chdir(BOT_FOLDER) # owoAPI reads config.json and the beatmap folders from here
+
+import aiohttp
+import motor.motor_asyncio
+
+from cogs.osu.osu_utils.owoAPI import owoAPI
+from cogs.osu.osu_utils import owoMetrics
+
+
+async def run_target(name, func, ops, concurrency):
+    histogram = owoMetrics.Histogram()
+    semaphore = asyncio.Semaphore(concurrency)
+    first_error = []
+
+    async def run_one(idx):
+        async with semaphore:
+            start_time = time.monotonic()
+            error = False
+            try:
+                await func(idx)
+            except Exception as e:
+                error = True
+                if not first_error:
+                    first_error.append(repr(e))
+            histogram.observe(time.monotonic() - start_time, error=error)
+
+    start_time = time.monotonic()
+    await asyncio.gather(*[run_one(idx) for idx in range(ops)])
+    elapsed = time.monotonic() - start_time
+
+    stats = histogram.summary()
+    print('{:<16} {:>6} {:>6} {:>8.2f} {:>8.1f} {:>7.3f} {:>7.3f} {:>7.3f}'.format(
+        name, stats['count'], stats['errors'], elapsed, ops / elapsed,
+        stats['p50'], stats['p95'], stats['p99']))
+    if first_error:
+        print('    first error: {}'.format(first_error[0]))
+
+
+def make_tracker(api, database, sent_plays):
+    """TopPlayTrackerPoll without discord, new plays are only counted"""
+    from cogs.osu.updater import TopPlayTrackerPoll
+
+    async def send_play(play):
+        sent_plays.append(play['play_id'])
+
+    async def append_suggestion_database(play):
+        pass
+
+    tracker = TopPlayTrackerPoll.__new__(TopPlayTrackerPoll)
+    tracker.owoAPI = api
+    tracker.MODES = ["osu", "taiko", "ctb", "mania"]
+    tracker.track = database['track']
+    tracker.send_play = send_play
+    tracker._append_suggestion_database = append_suggestion_database
+    return tracker
+
+
+async def main(args):
+    client = motor.motor_asyncio.AsyncIOMotorClient(port=args.mongo_port)
+    if args.fresh:
+        await client.drop_database('owo_loadtest')
+    database = client['owo_loadtest']
+
+    api = owoAPI(official_api_key='standin', official_client_id='standin',
+        official_client_secret='standin', droid_api_key='standin',
+        database=database)
+    api.sessions.standin = args.standin
+    api.use_cache = not args.no_cache
+
+    user_ids = args.user_ids.split(',')
+    targets = args.targets.split(',')
+
+    print('{:<16} {:>6} {:>6} {:>8} {:>8} {:>7} {:>7} {:>7}'.format(
+        'target', 'ops', 'errors', 'seconds', 'ops/s', 'p50', 'p95', 'p99'))
+
+    if 'get_user_best' in targets:
+        await run_target('get_user_best', lambda idx: api.get_user_best(
+            user_ids[idx % len(user_ids)], mode=0, limit=100, use_cache=False),
+            args.ops, args.concurrency)
+
+    if 'process_stats' in targets:
+        top_scores = [await api.get_user_best(user_id, mode=0, limit=100)
+            for user_id in user_ids]
+        await run_target('process_stats', lambda idx: api._process_stats(
+            top_scores[idx % len(top_scores)], mode=0),
+            args.ops, args.concurrency)
+
+    if 'check_plays' in targets:
+        sent_plays = []
+        tracker = make_tracker(api, database, sent_plays)
+        players = []
+        for user_id in user_ids:
+            player = {
+                'osu_id': user_id,
+                'username': user_id,
+                'servers': {'0': {'options': {'gamemodes': [0]}}},
+                'userinfo': {},
+                'last_check': '1970-01-01 00:00:00' # every top play is new
+            }
+            await database['track'].replace_one(
+                {'osu_id': user_id}, player, upsert=True)
+            players.append(player)
+
+        await run_target('check_plays', lambda idx: tracker.check_plays(
+            copy.deepcopy(players[idx % len(players)])),
+            args.ops, args.concurrency)
+        print('    new plays found: {}'.format(len(sent_plays)))
+
+    # where the time went
+    print('\nupstream (lifetime)')
+    upstream = api.get_latency_usage('upstream').get('upstream', {})
+    for api_name, requests in upstream.items():
+        for request_name, stats in requests.items():
+            print('  {:<12} {:<26} {:>6} {:>5} p50 {:.3f} p95 {:.3f}'.format(
+                api_name, request_name, stats['count'], stats['errors'],
+                stats['p50'], stats['p95']))
+
+    async with aiohttp.ClientSession() as session:
+        async with session.get(args.standin.rstrip('/') + '/_standin/stats') as resp:
+            print('\nstand-in:', await resp.json())
+
+    await api.close()
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='owoAPI load test')
+    parser.add_argument('--standin', default='http://127.0.0.1:8088')
+    parser.add_argument('--user-ids', default='124493')
+    parser.add_argument('--targets', default='get_user_best,process_stats,check_plays')
+    parser.add_argument('--ops', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=10)
+    parser.add_argument('--mongo-port', type=int, default=27017)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--fresh', action='store_true', help='drop owo_loadtest first')
+    args = parser.parse_args()
+
+    asyncio.get_event_loop().run_until_complete(main(args))
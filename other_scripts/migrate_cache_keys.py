@@ -0,0 +1,97 @@
+"""
+One-shot migration of the owoCache collections to deterministic _ids.
+
+Entries used to be upserted by their identifier fields, so a collection could
+hold several documents for the same identifiers. This keeps the newest one per
+identifiers under owoCache.cache_id, sets expires_at for the ttl index and
+deletes the rest. Safe to run again, migrated documents are left alone.
+
+    python other_scripts/migrate_cache_keys.py [--database owo_database] [--dry-run]
+"""
+import os
+import sys
+import asyncio
+import argparse
+
+BOT_FOLDER = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BOT_FOLDER)
+os.chdir(BOT_FOLDER) # owoCache creates its folders relative to here
+
+import motor.motor_asyncio
+from pymongo import ReplaceOne, DeleteOne
+
+from cogs.osu.osu_utils.owoCache import owoCache, Cache, cache_id
+
+# fields that aren't identifiers
+ENTRY_FIELDS = ['_id', 'cached_date', 'data', 'expires_at', 'negative',
+    'payload', 'codec', 'payload_version', 'raw_size']
+
+
+async def migrate_collection(cache, dry_run=False, batch_size=500):
+    seen = set()
+    operations = []
+    counts = {'documents': 0, 'rewritten': 0, 'duplicates': 0}
+
+    async def flush():
+        if operations and not dry_run:
+            await cache.entries.bulk_write(list(operations), ordered=True)
+        operations.clear()
+
+    # newest first, so the first document seen for an _id is the one kept
+    async for doc in cache.entries.find({}).sort('cached_date', -1):
+        counts['documents'] += 1
+        identifiers = {key: value for key, value in doc.items()
+            if key not in ENTRY_FIELDS}
+        doc_id = cache_id(identifiers)
+
+        if doc_id in seen:
+            if doc['_id'] != doc_id: # the kept copy already owns doc_id
+                operations.append(DeleteOne({'_id': doc['_id']}))
+                counts['duplicates'] += 1
+        else:
+            seen.add(doc_id)
+            if doc['_id'] != doc_id or 'expires_at' not in doc:
+                new_doc = dict(doc)
+                new_doc['_id'] = doc_id
+                # compressed documents need their data back to find the timeout
+                decoded = cache._decode(dict(doc))
+                expires_at = cache.expires_at(decoded) if decoded is not None else None
+                if expires_at is not None:
+                    new_doc['expires_at'] = expires_at
+                operations.append(ReplaceOne({'_id': doc_id}, new_doc, upsert=True))
+                if doc['_id'] != doc_id:
+                    operations.append(DeleteOne({'_id': doc['_id']}))
+                counts['rewritten'] += 1
+
+        if len(operations) >= batch_size:
+            await flush()
+    await flush()
+    return counts
+
+
+async def main(args):
+    client = motor.motor_asyncio.AsyncIOMotorClient(port=args.port)
+    database = client[args.database]
+    cache = owoCache(database) # also creates the indexes
+
+    for name, collection_cache in cache.__dict__.items():
+        if not isinstance(collection_cache, Cache):
+            continue
+        counts = await migrate_collection(collection_cache, dry_run=args.dry_run)
+        print('{:<30} {:>8} documents {:>8} rewritten {:>8} duplicates removed'.format(
+            collection_cache.name, counts['documents'],
+            counts['rewritten'], counts['duplicates']))
+
+    await cache.create_indexes()
+    if args.dry_run:
+        print('Dry run, no documents were written')
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='owoCache _id migration')
+    parser.add_argument('--database', default='owo_database')
+    parser.add_argument('--port', type=int, default=27017)
+    parser.add_argument('--dry-run', action='store_true')
+    args = parser.parse_args()
+
+    asyncio.get_event_loop().run_until_complete(main(args))
@@ -14,4 +14,6 @@ wget "${urlname}" -P "${outputdir}"
 tar -xvjf "${full_zip_output_path}"
 rsync -av "${full_folder_output_path}" "$HOME/${bot_dir}/cogs/osu/beatmaps"
 rm "${full_zip_output_path}"
-rm -r "${full_folder_output_path}"
\ No newline at end of file
+rm -r "${full_folder_output_path}"
+echo "Computing difficulty for new maps"
+python3 "$HOME/${bot_dir}/other_scripts/bulk_difficulty.py" --beatmaps "$HOME/${bot_dir}/cogs/osu/beatmaps"
\ No newline at end of file